@@ -1,77 +1,128 @@
+import threading
+import time
 from os import environ
 
-from flask import Flask, jsonify, session, request
+from flask import Flask, jsonify, session
 from flask_cors import cross_origin
-from flask_session import Session
 from werkzeug.exceptions import HTTPException
 
 from util.app_util import CROSS_ORIGIN_HEADERS
 from util.type_util import SessionIdentity
-from util import app_logger, auth_util, sql_util
-
-app = Flask(__name__, static_folder=None)
-app.config['IS_DEV'] = 'DEV' in environ
-logger = app_logger.create_logger('app', app.config['IS_DEV'])
-logger.info('Starting up...')
-
-app.config['DC_DB'] = sql_util.init_db(app)
-app.config['SESSION_TYPE'] = 'sqlalchemy'
-app.config['SESSION_SQLALCHEMY'] = app.config['DC_DB'].get_db()
-app.config['SESSION_SQLALCHEMY_TABLE'] = 'Tbl_web_sessions'
-app.config['SESSION_COOKIE_SECURE'] = True
-
-# noinspection SpellCheckingInspection
-app.secret_key = environ['SESSION_SECRET']
-Session(app)
-
-with app.app_context():
-    from blueprints import estimate_blueprint
-
-    requires_auth = auth_util.init_auth('app')
-    app.register_blueprint(estimate_blueprint.estimate, url_prefix='/api/estimate')
-
-
-@app.route('/api/hello', methods=['GET'])
-def hello():
-    logger.info('GET /api/hello')
-    return 'Hello!'
-
-
-@app.route('/api/init-session', methods=['GET'])
-@cross_origin(headers=CROSS_ORIGIN_HEADERS)
-@requires_auth()
-def init_session():
-    logger.info('GET /api/init-session')
-    identity: SessionIdentity = session.get('identity', {'is_admin': False, 'name': '', 'employeeId': ''})
-    return jsonify({
-        'isAdmin': identity['is_admin'],
-        'fullName': identity['name'],
-        'employeeId': identity['employee_id']
-    })
-
-
-@app.after_request
-def add_headers(response):
-    response.headers['Referrer-Policy'] = 'no-referrer'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'deny'
-    response.headers['X-Permitted-Cross-Domain-Policies'] = 'none'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    return response
-
-
-@app.errorhandler(HTTPException)
-def handle_http_exception(e: HTTPException):
-    logger.error('%d %s HTTPException', e.code, e.name, exc_info=e)
-    return e.name, e.code
-
-
-@app.errorhandler(Exception)
-def handle_exception(e: Exception):
-    logger.error('Uncaught application exception', exc_info=e)
-    return 'Server Error', 500
+from util import app_logger, auth_util, executor_util, lifecycle_util, metrics_util, profile_util, session_util, \
+    sql_util
+
+_app_lock = threading.Lock()
+
+
+def create_app() -> Flask:
+    """
+    Creates the app without connecting to the database or calling out to the network, so it can be created
+    quickly and preloaded in a parent process before workers are forked. Connections, the signing keys, the
+    query executor and background threads are started in each process before it serves its first request; see
+    lifecycle_util.Lifecycle.
+    """
+    start = time.perf_counter()
+    app = Flask(__name__, static_folder=None)
+    app.config['IS_DEV'] = 'DEV' in environ
+    logger = app_logger.create_logger('app', app.config['IS_DEV'])
+    logger.info('Starting up...')
+
+    lifecycle = lifecycle_util.init_lifecycle(app)
+    app.config['DC_DB'] = sql_util.init_db(app)
+    app.config['DC_EXECUTOR'] = None
+    lifecycle.on_start('sql_executor', lambda: start_executor(app))
+    lifecycle.on_start('jwks', auth_util.start_jwks)
+    metrics_util.init_metrics(app)
+    if app.config['DC_DB'].cache is not None:
+        metrics_util.registry.add_collector('result_cache', 'SQLUtil result cache statistics',
+                                            app.config['DC_DB'].cache.stats)
+    if app.config['DC_DB'].version is not None:
+        metrics_util.registry.add_collector('data_version', 'Data version token statistics',
+                                            app.config['DC_DB'].version.stats)
+    metrics_util.registry.add_collector('db_pool', 'Source database connection pool statistics',
+                                        app.config['DC_DB'].pool.stats)
+    metrics_util.registry.add_collector('token_cache', 'Verified token cache statistics', auth_util.token_cache.stats)
+    metrics_util.registry.add_collector('startup', 'Seconds taken by each step of process startup', lifecycle.stats)
+
+    # noinspection SpellCheckingInspection
+    app.secret_key = environ['SESSION_SECRET']
+    session_util.init_session(app)
+    profile_util.init_profiling(app)
+
+    with app.app_context():
+        from blueprints import estimate_blueprint
+
+        requires_auth = auth_util.init_auth('app')
+        app.register_blueprint(estimate_blueprint.estimate, url_prefix='/api/estimate')
+
+    @app.route('/api/hello', methods=['GET'])
+    def hello():
+        logger.info('GET /api/hello')
+        return 'Hello!'
+
+    @app.route('/api/metrics', methods=['GET'])
+    @requires_auth(admin_required=True)
+    def metrics():
+        return app.response_class(metrics_util.registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/api/init-session', methods=['GET'])
+    @cross_origin(headers=CROSS_ORIGIN_HEADERS)
+    @requires_auth()
+    def init_session():
+        logger.info('GET /api/init-session')
+        identity: SessionIdentity = session.get('identity', {'is_admin': False, 'name': '', 'employeeId': ''})
+        return jsonify({
+            'isAdmin': identity['is_admin'],
+            'fullName': identity['name'],
+            'employeeId': identity['employee_id']
+        })
+
+    @app.after_request
+    def add_headers(response):
+        response.headers['Referrer-Policy'] = 'no-referrer'
+        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.headers['X-Frame-Options'] = 'deny'
+        response.headers['X-Permitted-Cross-Domain-Policies'] = 'none'
+        response.headers['X-XSS-Protection'] = '1; mode=block'
+        return response
+
+    @app.errorhandler(HTTPException)
+    def handle_http_exception(e: HTTPException):
+        logger.error('%d %s HTTPException', e.code, e.name, exc_info=e)
+        return e.name, e.code, [header for header in e.get_headers() if header[0] == 'Retry-After']
+
+    @app.errorhandler(Exception)
+    def handle_exception(e: Exception):
+        logger.error('Uncaught application exception', exc_info=e)
+        return 'Server Error', 500
+
+    lifecycle.timings['create_app'] = time.perf_counter() - start
+    logger.info('Created app in %.3fs', lifecycle.timings['create_app'])
+    return app
+
+
+def start_executor(app) -> None:
+    app.config['DC_EXECUTOR'] = executor_util.init_executor(app)
+    if app.config['DC_EXECUTOR'] is not None:
+        metrics_util.registry.add_collector('sql_executor', 'SQLUtil call executor statistics',
+                                            app.config['DC_EXECUTOR'].stats)
+
+
+def __getattr__(name: str):
+    """
+    Creates the module's app the first time app.app is looked up, so servers pointed at app:app keep working
+    while importing this module stays cheap.
+    """
+    if name != 'app':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
 
 
 if __name__ == '__main__':
-    app.run()
+    application = create_app()
+    application.config['DC_LIFECYCLE'].ensure_started()
+    application.run()
@@ -0,0 +1,86 @@
+"""
+Compares the jsonify path against format=columnar for the job result list methods on a seeded SQLite stand-in,
+reporting fetch and convert time, encode time and payload size. Values are converted to datetimes and Decimals
+first, as the Access driver returns them.
+
+    python -m bench.columnar_bench --jobs 100000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Flask, jsonify
+
+from bench.standin_db import create_standin
+from util import json_util
+from util.sql_util import SQLUtil, Table
+
+DATE_COLUMNS = {'ContractDate', 'CreateDate'}
+DECIMAL_COLUMNS = {'TotalAmount', 'TotalPayments'}
+
+
+def as_access_value(column: str, value):
+    if value is None:
+        return None
+    if column in DATE_COLUMNS:
+        return datetime.fromisoformat(value)
+    if column in DECIMAL_COLUMNS:
+        return Decimal(str(round(value, 2)))
+    return value
+
+
+def access_dicts(rows):
+    return [{column: as_access_value(column, value) for column, value in row.items()} for row in rows]
+
+
+def access_table(table: Table) -> Table:
+    return Table(table.columns, [
+        tuple(as_access_value(column, value) for column, value in zip(table.columns, row)) for row in table.rows
+    ])
+
+
+def median_ms(f, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    sql_util = SQLUtil(create_standin(args.jobs))
+    cases = [
+        ('recent-estimates', lambda columnar: sql_util.fetch_recent_estimates(columnar=columnar)),
+        ('active-contracts', lambda columnar: sql_util.fetch_active_contracts(columnar=columnar)),
+        ('address search', lambda columnar: sql_util.search_by_job_address('ave', columnar=columnar))
+    ]
+
+    print(f'encoder: {"orjson" if json_util.orjson is not None else "json"}')
+    print(f'{"endpoint":<18}{"format":<10}{"rows":>8}{"fetch ms":>10}{"encode ms":>11}{"bytes":>12}')
+    with app.test_request_context():
+        for name, fetch in cases:
+            fetch_ms, rows = median_ms(lambda: fetch(False), args.repeat)
+            rows = access_dicts(rows)
+            encode_ms, response = median_ms(lambda: jsonify(rows), args.repeat)
+            print(f'{name:<18}{"jsonify":<10}{len(rows):>8}{fetch_ms:>10.1f}{encode_ms:>11.1f}'
+                  f'{len(response.get_data()):>12}')
+
+            fetch_ms, table = median_ms(lambda: fetch(True), args.repeat)
+            table = access_table(table)
+            encode_ms, response = median_ms(lambda: json_util.table_response(table), args.repeat)
+            print(f'{name:<18}{"columnar":<10}{len(table.rows):>8}{fetch_ms:>10.1f}{encode_ms:>11.1f}'
+                  f'{len(response.get_data()):>12}')
+
+
+if __name__ == '__main__':
+    main()
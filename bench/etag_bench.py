@@ -0,0 +1,92 @@
+"""
+Polls the estimate routes the way a client refreshing a page does, once sending back the ETag of its previous
+response in If-None-Match and once without, and reports latency, bytes received and SQL statements executed per
+poll. Every --change-every polls a payment is added to a job no polled route shows, so the global token changes
+and the customer and job tokens do not.
+
+    python -m bench.etag_bench --jobs 100000 --polls 200 --interval 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from bench.standin_db import StandInDB, create_standin
+from bench.suite import admin_identity, configure_environment, create_bench_app, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=5, help='DATA_VERSION_SECONDS')
+    parser.add_argument('--change-every', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        os.environ['SQL_EXECUTOR_WORKERS'] = '0'
+        from util import version_util
+        from util.sql_util import SQLUtil
+
+        path = os.path.join(tmp, 'standin.db')
+        seed = create_standin(args.jobs, path)
+        customer_id, job_id = seed.session.execute('SELECT CustomerID, JobID FROM Tbl_Workorders LIMIT 1').fetchone()
+        other_job_id = seed.session.execute('SELECT MAX(JobID) FROM Tbl_Workorders WHERE CustomerID <> :customer_id',
+                                            {'customer_id': customer_id}).scalar()
+        seed.session.remove()
+        routes = ['/api/estimate/recent-estimates', '/api/estimate/dashboard', f'/api/estimate/customer/{customer_id}',
+                  f'/api/estimate/job/{job_id}']
+
+        print(f'jobs={args.jobs} polls={args.polls} interval={args.interval}s change every {args.change_every} polls')
+        print(f'{"mode":<12}{"route":<30}{"p50 ms":>9}{"p99 ms":>9}{"KB/poll":>9}{"SQL/poll":>10}  statuses')
+        for mode in ('full', 'conditional'):
+            sql_util = SQLUtil(StandInDB(path))
+            sql_util.version = version_util.DataVersion(sql_util, args.interval, path)
+            statements = []
+            event.listen(sql_util.source_db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+            app = create_bench_app(sql_util)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['identity'] = admin_identity()
+
+            etags = {}
+            timings, sizes, queries, statuses = (defaultdict(list) for _ in range(4))
+            for i in range(args.polls):
+                if i and i % args.change_every == 0:
+                    sql_util.source_db.session.execute(
+                        "INSERT INTO Tbl_Payments (JobID, PaymentDate, PaymentAmount, PaymentMethod) "
+                        "VALUES (:job_id, '2024-01-01', 1, 'Cash')", {'job_id': other_job_id}
+                    )
+                    sql_util.source_db.session.commit()
+                    sql_util.source_db.session.remove()
+                    time.sleep(args.interval)
+                for route in routes:
+                    headers = {'If-None-Match': etags[route]} if mode == 'conditional' and route in etags else {}
+                    executed = len(statements)
+                    start = time.perf_counter()
+                    response = client.get(route, headers=headers)
+                    body = response.get_data()
+                    timings[route].append(time.perf_counter() - start)
+                    sizes[route].append(len(body))
+                    queries[route].append(len(statements) - executed)
+                    statuses[route].append(response.status_code)
+                    etags[route] = response.headers.get('ETag')
+
+            for route in routes:
+                values = sorted(timings[route])
+                outcomes = ' '.join(f'{status}={statuses[route].count(status)}'
+                                    for status in sorted(set(statuses[route])))
+                print(f'{mode:<12}{route[14:]:<30}{statistics.median(values) * 1000:>9.2f}'
+                      f'{percentile(values, 0.99) * 1000:>9.2f}{statistics.mean(sizes[route]) / 1024:>9.1f}'
+                      f'{statistics.mean(queries[route]):>10.2f}  {outcomes}')
+            print(f'            version {sql_util.version.stats()}')
+            sql_util.source_db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
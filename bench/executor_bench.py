@@ -0,0 +1,104 @@
+"""
+Compares the estimate routes with SQLUtil calls run on the request thread (SQL_EXECUTOR_WORKERS=0, as before the
+executor) against the query executor, at a fixed number of request threads standing in for WSGI workers. One
+request in --slow-every polls /recent-estimates, which aggregates every job and takes hundreds of milliseconds
+from around 100k jobs; the rest load a customer or a job. Reports completed requests per second and latency for
+each kind, and how every request ended. The customer and job loads run on the executor's point lane and the
+slow polls on its scan lane. The timeout defaults to SQL_TIMEOUT_SECONDS' own default, so calls complete rather
+than turning into 504s.
+
+    python -m bench.executor_bench --jobs 100000 --workers 8 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from bench.standin_db import StandInDB, create_standin
+from bench.suite import admin_identity, configure_environment, create_bench_app, percentile
+
+
+def run(app, paths, workers: int, seconds: float):
+    timings = defaultdict(list)
+    statuses = Counter()
+    lock = threading.Lock()
+    start_line = threading.Barrier(workers)
+    stop_at = []
+
+    def worker(offset: int):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['identity'] = admin_identity()
+        start_line.wait()
+        if not stop_at:
+            stop_at.append(time.perf_counter() + seconds)
+        i = offset
+        while time.perf_counter() < stop_at[0]:
+            kind, path = paths[i % len(paths)]
+            i += workers
+            start = time.perf_counter()
+            status = client.get(path).status_code
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[(kind, status)] += 1
+                if status == 200:
+                    timings[kind].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=8, help='request threads')
+    parser.add_argument('--executor-workers', type=int, default=5, help='scan lane threads')
+    parser.add_argument('--point-workers', type=int, default=4, help='point lane threads')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=30.0, help='SQL_TIMEOUT_SECONDS for the executor')
+    parser.add_argument('--slow-every', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        from util.sql_util import SQLUtil
+
+        path = os.path.join(tmp, 'standin.db')
+        db = create_standin(args.jobs, path)
+        customer_ids = [row[0] for row in db.session.execute('SELECT CustomerID FROM Tbl_Workorders LIMIT 200')]
+        job_ids = [row[0] for row in db.session.execute('SELECT JobID FROM Tbl_Workorders LIMIT 200')]
+        db.session.remove()
+        paths = []
+        for i, (customer_id, job_id) in enumerate(zip(customer_ids, job_ids)):
+            if i % args.slow_every == 0:
+                paths.append(('slow', '/api/estimate/recent-estimates'))
+            paths.append(('fast', f'/api/estimate/customer/{customer_id}' if i % 2 else f'/api/estimate/job/{job_id}'))
+
+        print(f'jobs={args.jobs} request threads={args.workers} seconds={args.seconds} timeout={args.timeout}s')
+        print(f'{"path":<10}{"kind":<6}{"req/s":>8}{"p50 ms":>10}{"p99 ms":>10}  statuses')
+        for label, workers in (('sync', 0), ('executor', args.executor_workers)):
+            os.environ['SQL_EXECUTOR_WORKERS'] = str(workers)
+            os.environ['SQL_EXECUTOR_POINT_WORKERS'] = str(args.point_workers)
+            os.environ['SQL_TIMEOUT_SECONDS'] = str(args.timeout)
+            app = create_bench_app(SQLUtil(StandInDB(path)))
+            timings, statuses = run(app, paths, args.workers, args.seconds)
+            for kind in ('fast', 'slow'):
+                values = sorted(timings[kind])
+                outcomes = ' '.join(f'{status}={count}' for (k, status), count in sorted(statuses.items())
+                                    if k == kind)
+                p50 = statistics.median(values) * 1000 if values else float('nan')
+                p99 = percentile(values, 0.99) * 1000 if values else float('nan')
+                print(f'{label:<10}{kind:<6}{len(values) / args.seconds:>8.1f}{p50:>10.1f}{p99:>10.1f}  {outcomes}')
+            if app.config['DC_EXECUTOR'] is not None:
+                print(f'          executor {app.config["DC_EXECUTOR"].stats()}')
+
+
+if __name__ == '__main__':
+    main()
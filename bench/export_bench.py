@@ -0,0 +1,84 @@
+"""
+Streams /api/estimate/export through the Flask test client without buffering and reports rows per second, bytes
+sent and how far the process's resident memory rose above where it started while the export ran, sampled after
+every chunk. With --buffered the same rows are also built into a list of dicts and encoded in one call, as a
+jsonify'd view would be, for comparison.
+
+    python -m bench.export_bench --jobs 1000000 --db standin-1m.db
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from bench.standin_db import StandInDB
+from bench.suite import admin_identity, configure_environment, create_bench_app, open_standin
+
+PAGE_SIZE = resource.getpagesize()
+
+
+def rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=1000000)
+    parser.add_argument('--db', help='SQLite file to create the dataset in, or to reuse if it exists')
+    parser.add_argument('--query', default='', help="export filter, e.g. 'status=open&jobType=Contract'")
+    parser.add_argument('--buffered', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        os.environ['SQL_EXECUTOR_WORKERS'] = '0'
+        from util import json_util
+        from util.sql_util import EXPORT_NAMES, SQLUtil
+
+        path = args.db or os.path.join(tmp, 'standin.db')
+        open_standin(args.jobs, path).session.remove()
+        sql_util = SQLUtil(StandInDB(path))
+        app = create_bench_app(sql_util)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['identity'] = admin_identity()
+
+        print(f'jobs={args.jobs} query={args.query!r}')
+        print(f'{"mode":<10}{"rows":>10}{"seconds":>9}{"rows/s":>10}{"MB sent":>9}{"RSS rise MB":>13}'
+              f'{"at 10% MB":>11}')
+        for export_format in ('csv', 'ndjson'):
+            client.get(f'/api/estimate/export?format={export_format}&status=open&jobType=none').get_data()
+            start_rss = rss()
+            peak = early = 0
+            sent = lines = 0
+            start = time.perf_counter()
+            response = client.get(f'/api/estimate/export?format={export_format}&{args.query}', buffered=False)
+            for chunk in response.iter_encoded():
+                sent += len(chunk)
+                lines += chunk.count(b'\n')
+                peak = max(peak, rss() - start_rss)
+                if not early and lines >= args.jobs // 10:
+                    early = peak
+            response.close()
+            elapsed = time.perf_counter() - start
+            rows = lines - (export_format == 'csv')
+            print(f'{export_format:<10}{rows:>10}{elapsed:>9.2f}{rows / elapsed:>10.0f}{sent / 2 ** 20:>9.1f}'
+                  f'{peak / 2 ** 20:>13.1f}{early / 2 ** 20:>11.1f}')
+
+        if args.buffered:
+            start_rss = rss()
+            start = time.perf_counter()
+            with app.app_context():
+                rows = [dict(zip(EXPORT_NAMES, row)) for row in sql_util.stream_export().rows]
+                body = json_util.dumps_compact(rows)
+            elapsed = time.perf_counter() - start
+            peak = rss() - start_rss
+            print(f'{"buffered":<10}{len(rows):>10}{elapsed:>9.2f}{len(rows) / elapsed:>10.0f}'
+                  f'{len(body) / 2 ** 20:>9.1f}{peak / 2 ** 20:>13.1f}')
+        sql_util.source_db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
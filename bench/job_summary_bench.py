@@ -0,0 +1,72 @@
+"""
+Compares the live job result query against Tbl_web_job_summary on a seeded SQLite stand-in.
+
+    python -m bench.job_summary_bench --jobs 50000 --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from bench.standin_db import create_standin
+from util.job_summary_util import JobSummary
+from util.sql_util import SQLUtil
+
+METHODS = [
+    ('fetch_recent_estimates', ()),
+    ('fetch_recently_received_jobs', ()),
+    ('fetch_active_contracts', ()),
+    ('search_by_customer_name', ('ols',)),
+    ('search_by_company_name', ('homes',)),
+    ('search_by_job_address', ('grand%ave',)),
+    ('get_jobs_by_customer', (1,))
+]
+
+
+def time_method(sql_util: SQLUtil, name: str, args: tuple, repeat: int) -> float:
+    method = getattr(sql_util, name)
+    method(*args)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        method(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db = create_standin(args.jobs)
+    sql_util = SQLUtil(db)
+    job_summary = JobSummary(sql_util)
+    job_summary.ensure_table()
+
+    start = time.perf_counter()
+    job_summary.refresh()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    db.session.execute('UPDATE Tbl_Payments SET PaymentAmount = PaymentAmount + 1 WHERE JobID <= 10')
+    db.session.commit()
+    start = time.perf_counter()
+    changed = job_summary.refresh_changed()
+    refresh_ms = (time.perf_counter() - start) * 1000
+
+    print(f'jobs={args.jobs} summary build={build_ms:.1f}ms incremental refresh={refresh_ms:.1f}ms '
+          f'({changed} rows rewritten)')
+    print(f'{"method":<32}{"live ms":>10}{"summary ms":>12}{"speedup":>10}')
+    for name, method_args in METHODS:
+        sql_util.use_job_summary = False
+        live_rows = getattr(sql_util, name)(*method_args)
+        live_ms = time_method(sql_util, name, method_args, args.repeat)
+        sql_util.use_job_summary = True
+        summary_rows = getattr(sql_util, name)(*method_args)
+        summary_ms = time_method(sql_util, name, method_args, args.repeat)
+        assert len(live_rows) == len(summary_rows), name
+        print(f'{name:<32}{live_ms:>10.2f}{summary_ms:>12.2f}{live_ms / summary_ms:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures the per-call cost of a request log line with a RotatingFileHandler attached directly to the logger, as
+create_logger used to do, against the shared queue-backed handler, from several threads at once.
+
+    python -m bench.logging_bench --threads 8 --lines 20000
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from util import app_logger
+
+
+def run(logger: logging.Logger, threads: int, lines: int) -> list:
+    durations = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for i in range(lines):
+            start = time.perf_counter()
+            logger.info('GET /api/estimate/job/%s', i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            durations.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--lines', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct = logging.getLogger('bench-direct')
+        direct.setLevel(logging.INFO)
+        direct.propagate = False
+        handler = RotatingFileHandler(os.path.join(tmp, 'direct.log'), maxBytes=10000000, backupCount=10)
+        handler.setFormatter(logging.Formatter(app_logger.LOG_FORMAT))
+        direct.addHandler(handler)
+
+        os.environ['LOG_PATH'] = os.path.join(tmp, 'queued.log')
+        queued = app_logger.create_logger('bench-queued', False)
+        queued.propagate = False
+
+        print(f'{"handler":<10}{"p50 us":>10}{"p99 us":>10}{"max us":>10}{"total s":>10}')
+        for name, logger in [('direct', direct), ('queued', queued)]:
+            start = time.perf_counter()
+            durations = run(logger, args.threads, args.lines)
+            total = time.perf_counter() - start
+            p99 = durations[int(len(durations) * 0.99)]
+            print(f'{name:<10}{statistics.median(durations) * 1e6:>10.1f}{p99 * 1e6:>10.1f}'
+                  f'{durations[-1] * 1e6:>10.1f}{total:>10.2f}')
+        app_logger.shutdown()
+        handler.close()
+
+
+if __name__ == '__main__':
+    main()
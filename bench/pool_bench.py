@@ -0,0 +1,106 @@
+"""
+Runs concurrent request-shaped loads against a file-based SQLite stand-in through Flask-SQLAlchemy with the pool
+settings init_db uses, once on a cold pool and once after PoolManager.warm, and reports request latency and how
+many connections were opened while a request was waiting. --connect-ms adds a delay to every connect, standing in
+for the cost of opening an ODBC connection to Access.
+
+    python -m bench.pool_bench --threads 8 --requests 50 --connect-ms 150
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+from bench.standin_db import create_standin
+from util import metrics_util, pool_util
+from util.snapshot_util import register_access_dialect
+from util.sql_util import SQLUtil
+
+
+def create_app(path: str, pool_size: int, connect_ms: float):
+    app = Flask(__name__)
+    app.config['IS_DEV'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **pool_util.engine_options(),
+        'pool_size': pool_size,
+        'connect_args': {'check_same_thread': False}
+    }
+    sql_util = SQLUtil(SQLAlchemy(app))
+    with app.app_context():
+        engine = sql_util.source_db.engine
+        register_access_dialect(engine)
+        event.listen(engine, 'do_connect', lambda *args: time.sleep(connect_ms / 1000))
+        sql_util.pool = pool_util.PoolManager(app, engine)
+    return app, sql_util
+
+
+def run_load(app, sql_util: SQLUtil, customer_ids: list, threads: int, requests: int) -> list:
+    timings = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def worker(offset: int):
+        start_line.wait()
+        for i in range(requests):
+            customer_id = customer_ids[(offset * requests + i) % len(customer_ids)]
+            with app.test_request_context():
+                start = time.perf_counter()
+                sql_util.get_customer(customer_id)
+                sql_util.get_jobs_by_customer(customer_id)
+                sql_util.source_db.session.remove()
+                elapsed = time.perf_counter() - start
+            with lock:
+                timings.append(elapsed)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return timings
+
+
+def request_connects() -> int:
+    histogram = metrics_util.registry._values.get(('db_connect_seconds', (('context', 'request'),)))
+    return histogram.count if histogram is not None else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--connect-ms', type=float, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'standin.db')
+        seed = create_standin(args.jobs, path)
+        customer_ids = [row[0] for row in seed.session.execute('SELECT DISTINCT CustomerID FROM Tbl_Workorders')]
+        seed.session.remove()
+        seed.engine.dispose()
+
+        print(f'{"pool":<8}{"requests":>10}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}{"connects in requests":>22}')
+        for label in ('cold', 'warm'):
+            metrics_util.registry.reset()
+            app, sql_util = create_app(path, args.threads, args.connect_ms)
+            if label == 'warm':
+                sql_util.pool.warm()
+            timings = sorted(run_load(app, sql_util, customer_ids, args.threads, args.requests))
+            print(f'{label:<8}{len(timings):>10}{statistics.median(timings) * 1000:>10.1f}'
+                  f'{timings[int(len(timings) * 0.99)] * 1000:>10.1f}{timings[-1] * 1000:>10.1f}'
+                  f'{request_connects():>22}')
+            print(f'        pool {sql_util.pool.stats()}')
+            sql_util.source_db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
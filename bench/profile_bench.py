@@ -0,0 +1,79 @@
+"""
+Requests the busiest customer's page through the Flask test client with request profiling off, armed (PROFILE_DIR
+set but the request not chosen) and on for every request via the X-Profile header, and reports latency for each,
+then how many files the ring buffer kept and the hottest frames of the last profile by thread role.
+
+    python -m bench.profile_bench --jobs 100000 --requests 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+from bench.suite import admin_identity, configure_environment, create_bench_app, open_standin, percentile, \
+    sample_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--db', help='SQLite file to create the dataset in, or to reuse if it exists')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--max-files', type=int, default=50)
+    parser.add_argument('--interval-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        from bench.standin_db import StandInDB
+        from util import profile_util
+        from util.sql_util import SQLUtil
+
+        path = args.db or os.path.join(tmp, 'standin.db')
+        ids = sample_ids(open_standin(args.jobs, path))
+        route = f'/api/estimate/customer/{ids["busiest_customer"]}'
+        directory = os.path.join(tmp, 'profiles')
+
+        print(f'jobs={args.jobs} requests={args.requests} route={route}')
+        print(f'{"mode":<10}{"p50 ms":>9}{"p99 ms":>9}{"mean ms":>9}')
+        for mode in ('off', 'armed', 'profiled'):
+            app = create_bench_app(SQLUtil(StandInDB(path)))
+            if mode != 'off':
+                profile_util.Profiler(app, directory, max_files=args.max_files, interval=args.interval_ms / 1000)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['identity'] = admin_identity()
+            headers = {profile_util.PROFILE_HEADER: '1'} if mode == 'profiled' else {}
+            client.get(route, headers=headers)
+            timings = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = client.get(route, headers=headers)
+                response.get_data()
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f'{mode:<10}{statistics.median(timings) * 1000:>9.2f}{percentile(timings, 0.99) * 1000:>9.2f}'
+                  f'{statistics.mean(timings) * 1000:>9.2f}')
+            app.config['DC_DB'].source_db.engine.dispose()
+
+        files = sorted(os.listdir(directory))
+        print(f'profiles kept: {len(files)} of {args.requests + 1} written (max {args.max_files})')
+        print(f'last: {files[-1]}')
+        frames = {role: Counter() for role in ('request', 'sql')}
+        with open(os.path.join(directory, files[-1])) as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                names = stack.split(';')
+                for name in set(names[1:]):
+                    frames[names[0]][name] += int(count)
+        for role, counts in frames.items():
+            print(f'{role} samples by frame (inclusive):')
+            for name, count in counts.most_common(200):
+                if name.startswith(('util.', 'blueprints.')):
+                    print(f'  {count:>5}  {name}')
+
+
+if __name__ == '__main__':
+    main()
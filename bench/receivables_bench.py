@@ -0,0 +1,126 @@
+"""
+Loads the receivables columns from a copy of the stand-in, then reports how long the full load took, how much
+memory the columns hold per job and the peak traced while reloading them, an incremental refresh with nothing
+changed and after --edits payments, closes and new jobs, and latency of the unfiltered and filtered report,
+through the Flask test client as well. With --compare the outstanding total is also computed the way it is
+today, comparing TotalAmount and TotalPayments job by job over the streamed job results.
+
+    python -m bench.receivables_bench --jobs 1000000 --db standin-1m.db
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from bench.standin_db import StandInDB
+from bench.suite import admin_identity, configure_environment, create_bench_app, open_standin, percentile
+
+AS_OF = date(2024, 6, 1)
+
+
+def timed(f, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+
+def edit(db: StandInDB, edits: int, rng: random.Random) -> None:
+    """
+    Adds a payment to edits open jobs, closes edits more and adds edits new jobs with one contract line each.
+    """
+    with db.engine.begin() as conn:
+        open_jobs = [row[0] for row in conn.execute('SELECT JobID FROM Tbl_Workorders WHERE CloseDate IS NULL')]
+        max_job = conn.execute('SELECT MAX(JobID) FROM Tbl_Workorders').scalar()
+        chosen = rng.sample(open_jobs, 2 * edits)
+        conn.execute('INSERT INTO Tbl_Payments (JobID, PaymentDate, PaymentAmount) VALUES (?, ?, ?)',
+                     [(job_id, '2024-05-01 00:00:00', 100) for job_id in chosen[:edits]])
+        conn.execute("UPDATE Tbl_Workorders SET CloseDate = '2024-05-15 00:00:00' WHERE JobID = ?",
+                     [(job_id,) for job_id in chosen[edits:]])
+        new_jobs = range(max_job + 1, max_job + 1 + edits)
+        conn.execute('INSERT INTO Tbl_Workorders (JobID, CustomerID, JobType, ContractDate, CreateDate) '
+                     "VALUES (?, 1, 1, '2024-05-01 00:00:00', '2024-04-20 00:00:00')",
+                     [(job_id,) for job_id in new_jobs])
+        conn.execute('INSERT INTO Tbl_JobContracts (JobID, JobContractAmount) VALUES (?, 5000)',
+                     [(job_id,) for job_id in new_jobs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--db', help='SQLite file to create the dataset in, or to reuse if it exists; edits go to '
+                                     'a copy')
+    parser.add_argument('--edits', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--compare', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        from util.receivables_util import Receivables
+        from util.sql_util import SQLUtil
+
+        path = os.path.join(tmp, 'standin.db')
+        if args.db:
+            open_standin(args.jobs, args.db).engine.dispose()
+            shutil.copyfile(args.db, path)
+        else:
+            open_standin(args.jobs, path).engine.dispose()
+        db = StandInDB(path)
+        sql_util = SQLUtil(db)
+        receivables = sql_util.receivables = Receivables(sql_util)
+
+        receivables.full_refresh()
+        load_seconds = receivables.last_full_refresh_seconds
+        tracemalloc.start()
+        receivables.full_refresh()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = receivables.stats()
+        print(f'jobs={stats["jobs"]} invoices={stats["invoices"]} edits={args.edits}')
+        print(f'full load {load_seconds:.2f}s, {stats["jobs"] / load_seconds:.0f} jobs/s')
+        print(f'held {stats["bytes"] / 2 ** 20:.1f} MB, {stats["bytes"] / stats["jobs"]:.1f} bytes/job; '
+              f'load peak {peak / 2 ** 20:.1f} MB traced')
+
+        changed = receivables.refresh()
+        print(f'refresh, nothing changed: {receivables.last_refresh_seconds:.2f}s, {changed} changed')
+        edit(db, args.edits, random.Random(0))
+        reloaded = receivables.jobs_reloaded
+        changed = receivables.refresh()
+        print(f'refresh after edits: {receivables.last_refresh_seconds:.2f}s, {changed} changed, '
+              f'{receivables.jobs_reloaded - reloaded} jobs reloaded')
+
+        print(f'{"report":<28}{"p50 ms":>9}{"p99 ms":>9}')
+        for name, kwargs in (('all jobs', {}), ('open Contract jobs', {'status': 'open', 'job_type': 'Contract'})):
+            timings = timed(lambda: receivables.report(AS_OF, **kwargs), args.repeat)
+            print(f'{name:<28}{statistics.median(timings) * 1000:>9.2f}{percentile(timings, 0.99) * 1000:>9.2f}')
+
+        app = create_bench_app(sql_util)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['identity'] = admin_identity()
+        timings = timed(lambda: client.get(f'/api/estimate/receivables?asOf={AS_OF}').get_data(), args.repeat)
+        print(f'{"GET /receivables":<28}{statistics.median(timings) * 1000:>9.2f}'
+              f'{percentile(timings, 0.99) * 1000:>9.2f}')
+
+        if args.compare:
+            start = time.perf_counter()
+            with app.app_context():
+                table = sql_util.stream_export()
+                amount, payments = table.columns.index('TotalAmount'), table.columns.index('TotalPayments')
+                outstanding = sum(max((row[amount] or 0) - (row[payments] or 0), 0) for row in table.rows)
+            elapsed = time.perf_counter() - start
+            report = receivables.report(AS_OF)['totals']['outstanding']
+            print(f'job by job over SQL: {elapsed:.2f}s, outstanding {outstanding:.2f} (report {report:.2f})')
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
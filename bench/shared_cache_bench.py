@@ -0,0 +1,136 @@
+"""
+Runs the same request mix in --workers forked worker processes at once, each with its own SQLUtil and in-process
+ResultCache, once with only the in-process caches and once with a SharedResultStore under them, and reports how
+many SQL statements all workers executed between them, hit rates and latency by where each result came from: the
+worker's own cache, the shared store, or the database. Requests pick customers and jobs from a Zipf-like
+distribution, as a team working the same open jobs does.
+
+    python -m bench.shared_cache_bench --jobs 20000 --workers 4 --requests 2000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from bench.standin_db import StandInDB, create_standin
+from bench.suite import configure_environment, percentile
+
+TTLS = {
+    'fetch_dashboard': 60.0,
+    'get_customer': 60.0,
+    'get_jobs_by_customer': 60.0,
+    'get_job_details': 60.0
+}
+
+
+def run_worker(path: str, shared_path: str, requests: int, customers: list, jobs: list, seed: int) -> dict:
+    from util.cache_util import ResultCache
+    from util.shared_cache_util import SharedResultStore
+    from util.sql_util import SQLUtil
+
+    shared = SharedResultStore(shared_path, horizon=max(TTLS.values()), is_dev=True) if shared_path else None
+    sql_util = SQLUtil(StandInDB(path), cache=ResultCache(TTLS, max_entries=256, shared=shared))
+    statements = []
+    event.listen(sql_util.source_db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(customers))]
+    timings = defaultdict(list)
+    for _ in range(requests):
+        roll = rng.random()
+        if roll < 0.1:
+            calls = [lambda: sql_util.fetch_dashboard()]
+        elif roll < 0.6:
+            customer_id = str(rng.choices(customers, weights)[0])
+            calls = [lambda: sql_util.get_customer(customer_id),
+                     lambda: sql_util.get_jobs_by_customer(customer_id)]
+        else:
+            job_id = str(rng.choices(jobs, weights)[0])
+            calls = [lambda: sql_util.get_job_details(job_id)]
+        for call in calls:
+            hits, shared_hits = sql_util.cache.hits, shared.hits if shared is not None else 0
+            start = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - start
+            if sql_util.cache.hits > hits:
+                timings['local'].append(elapsed)
+            elif shared is not None and shared.hits > shared_hits:
+                timings['shared'].append(elapsed)
+            else:
+                timings['database'].append(elapsed)
+    return {'statements': len(statements), 'timings': timings, 'stats': sql_util.cache.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per worker')
+    parser.add_argument('--hot', type=int, default=500, help='customers and jobs requests pick from')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        path = os.path.join(tmp, 'standin.db')
+        seed = create_standin(args.jobs, path)
+        customers = [row[0] for row in seed.session.execute(
+            f'SELECT CustomerID FROM Tbl_Customers ORDER BY CustomerID LIMIT {args.hot}')]
+        jobs = [row[0] for row in seed.session.execute(
+            f'SELECT JobID FROM Tbl_Workorders ORDER BY JobID DESC LIMIT {args.hot}')]
+        seed.session.remove()
+        seed.engine.dispose()
+
+        print(f'jobs={args.jobs} workers={args.workers} requests/worker={args.requests} hot={args.hot}')
+        print(f'{"mode":<8}{"SQL":>8}{"local hit":>11}{"shared hit":>12}{"source":>10}{"calls":>8}'
+              f'{"p50 ms":>9}{"p99 ms":>9}{"wall s":>8}')
+        for mode in ('local', 'shared'):
+            shared_path = os.path.join(tmp, 'shared.db') if mode == 'shared' else None
+            if shared_path:
+                from util.shared_cache_util import SharedResultStore
+                SharedResultStore(shared_path, is_dev=True)
+            start = time.perf_counter()
+            children = []
+            for worker in range(args.workers):
+                read, write = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read)
+                    result = run_worker(path, shared_path, args.requests, customers, jobs, worker)
+                    with os.fdopen(write, 'w') as f:
+                        json.dump(result, f)
+                    os._exit(0)
+                os.close(write)
+                children.append((pid, read))
+            results = []
+            for pid, read in children:
+                with os.fdopen(read) as f:
+                    results.append(json.load(f))
+                os.waitpid(pid, 0)
+            wall = time.perf_counter() - start
+
+            timings = defaultdict(list)
+            for result in results:
+                for source, values in result['timings'].items():
+                    timings[source].extend(values)
+            calls = sum(map(len, timings.values()))
+            statements = sum(result['statements'] for result in results)
+            local_rate = len(timings['local']) / calls
+            shared_rate = len(timings['shared']) / max(1, calls - len(timings['local']))
+            for i, source in enumerate(('local', 'shared', 'database')):
+                values = sorted(timings[source])
+                prefix = f'{mode:<8}{statements:>8}{local_rate:>11.1%}{shared_rate:>12.1%}' if i == 0 \
+                    else ' ' * 39
+                latency = f'{statistics.median(values) * 1000:>9.3f}{percentile(values, 0.99) * 1000:>9.3f}' \
+                    if values else f'{"-":>9}{"-":>9}'
+                print(f'{prefix}{source:>10}{len(values):>8}{latency}' + (f'{wall:>8.2f}' if i == 0 else ''))
+            if mode == 'shared':
+                print(f'        worker 0 {results[0]["stats"]}')
+
+
+if __name__ == '__main__':
+    main()
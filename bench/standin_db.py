@@ -0,0 +1,232 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from util.snapshot_util import register_access_dialect
+
+TABLES = {
+    'Tbl_Customers': '''
+        CustomerID INTEGER PRIMARY KEY,
+        Customer VARCHAR(255),
+        CustomerLastName VARCHAR(255),
+        CompanyName VARCHAR(255),
+        CustomerFirstName2 VARCHAR(255),
+        CustomerLastName2 VARCHAR(255),
+        BillingContactFirstName VARCHAR(255),
+        BillingContactLastName VARCHAR(255),
+        BillingContactCompanyName VARCHAR(255),
+        BillingAddress VARCHAR(255),
+        BillingCity VARCHAR(255),
+        BillingState VARCHAR(255),
+        BillingZip VARCHAR(255),
+        BillingPhone1Type VARCHAR(255),
+        BillingPhone1 VARCHAR(255),
+        BillingExt1 VARCHAR(255),
+        BillingPhone2Type VARCHAR(255),
+        BillingPhone2 VARCHAR(255),
+        BillingExt2 VARCHAR(255),
+        BillingPhone3Type VARCHAR(255),
+        BillingPhone3 VARCHAR(255),
+        BillingExt3 VARCHAR(255),
+        BillingPhone4Type VARCHAR(255),
+        BillingFax VARCHAR(255),
+        BillingExt4 VARCHAR(255),
+        EmailOne VARCHAR(255),
+        EmailTwo VARCHAR(255)
+    ''',
+    'Tbl_Job_Types': '''
+        JobType INTEGER PRIMARY KEY,
+        JobTypeDescription VARCHAR(255)
+    ''',
+    'Tbl_Workorders': '''
+        JobID INTEGER PRIMARY KEY,
+        CustomerID INTEGER,
+        JobType INTEGER,
+        JobCustomer VARCHAR(255),
+        JobContact VARCHAR(255),
+        JobSecondContact VARCHAR(255),
+        JobAddress VARCHAR(255),
+        JobCity VARCHAR(255),
+        JobSt VARCHAR(255),
+        JobZip VARCHAR(255),
+        JobPhone1Type VARCHAR(255),
+        JobContactPhone1 VARCHAR(255),
+        JobPhone2Type VARCHAR(255),
+        JobContactPhone2 VARCHAR(255),
+        JobPhone3Type VARCHAR(255),
+        JobContactPhone3 VARCHAR(255),
+        JobPhone4Type VARCHAR(255),
+        JobContactPhone4 VARCHAR(255),
+        ContractDate DATETIME,
+        CreateDate DATETIME,
+        JobStart DATETIME,
+        CloseDate DATETIME
+    ''',
+    'Tbl_JobContracts': '''
+        JobContractID INTEGER PRIMARY KEY,
+        JobID INTEGER,
+        WorkDescriptionType VARCHAR(255),
+        JobContractDescription VARCHAR(255),
+        JobContractAmount CURRENCY
+    ''',
+    'Tbl_Payments': '''
+        PaymentID INTEGER PRIMARY KEY,
+        JobID INTEGER,
+        PaymentDate DATETIME,
+        PaymentAmount CURRENCY,
+        PaymentMethod VARCHAR(255)
+    ''',
+    'Tbl_Invoice': '''
+        InvoiceNumber INTEGER PRIMARY KEY,
+        JobID INTEGER,
+        InvoiceDate DATETIME
+    ''',
+    'Tbl_InvoiceDetail': '''
+        InvoiceDetailID INTEGER PRIMARY KEY,
+        InvoiceNumber INTEGER,
+        JobContractAmount CURRENCY
+    '''
+}
+
+INDEXES = {
+    'Tbl_Workorders': ['CustomerID', 'JobType', 'ContractDate', 'CreateDate'],
+    'Tbl_JobContracts': ['JobID'],
+    'Tbl_Payments': ['JobID'],
+    'Tbl_Invoice': ['JobID'],
+    'Tbl_InvoiceDetail': ['InvoiceNumber']
+}
+
+JOB_TYPES = ['Contract', 'Estimate', 'Service', 'Warranty', 'Time and Material']
+LAST_NAMES = ['Anderson', 'Baker', 'Carlson', 'Dvorak', 'Erickson', 'Fischer', 'Gonzalez', 'Hansen', 'Iverson',
+              'Johnson', 'Kowalski', 'Larson', 'Miller', 'Nguyen', 'Olson', 'Peterson', 'Quinn', 'Rasmussen',
+              'Schmidt', 'Thompson', 'Underwood', 'Vance', 'Weber', 'Young', 'Zimmerman']
+FIRST_NAMES = ['Ann', 'Bob', 'Carol', 'Dave', 'Emma', 'Frank', 'Grace', 'Hank', 'Ida', 'Joe', 'Kate', 'Luke']
+COMPANY_SUFFIXES = ['Construction', 'Builders', 'Properties', 'Homes', 'Remodeling', 'Holdings']
+STREETS = ['Main St', 'Oak Ave', 'Grand Ave', 'University Ave', 'Ingersoll Ave', 'Beaver Ave', 'Park Ave',
+           'Hickman Rd', 'Douglas Ave', 'Fleur Dr', 'Euclid Ave', 'Merle Hay Rd']
+WORK_TYPES = ['Concrete', 'Framing', 'Roofing', 'Siding', 'Windows', 'Drywall', 'Electrical', 'Plumbing']
+PAYMENT_METHODS = ['Check', 'Cash', 'Credit Card', 'ACH']
+
+
+class StandInDB:
+    """
+    A SQLite stand-in for the Access database exposing the same session/engine interface as
+    flask_sqlalchemy.SQLAlchemy, so SQLUtil can run its Access SQL unchanged outside of Flask.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.engine = create_engine(
+            f'sqlite:///{path}',
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool if path == ':memory:' else None
+        )
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+        register_access_dialect(self.engine)
+
+
+def create_schema(db: StandInDB) -> None:
+    with db.engine.begin() as conn:
+        for table, columns in TABLES.items():
+            conn.execute(f'CREATE TABLE {table} ({columns})')
+        for table, columns in INDEXES.items():
+            for column in columns:
+                conn.execute(f'CREATE INDEX IX_{table}_{column} ON {table} ({column})')
+
+
+def seed(db: StandInDB, jobs: int, seed_value=0) -> None:
+    """
+    Fills the schema with `jobs` work orders spread over roughly 20 years. Repeat customers are skewed so the
+    top 2% have dozens of jobs each, about 5% of customers have no jobs, and older jobs are mostly closed and paid.
+    """
+    rng = random.Random(seed_value)
+    customers = max(1, jobs // 3)
+    start = datetime(2004, 1, 1)
+    span = (datetime(2024, 1, 1) - start).total_seconds()
+
+    def fmt(value):
+        return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+    with db.engine.begin() as conn:
+        conn.execute(
+            'INSERT INTO Tbl_Job_Types (JobType, JobTypeDescription) VALUES (?, ?)',
+            list(enumerate(JOB_TYPES, start=1))
+        )
+
+        customer_rows = []
+        for customer_id in range(1, customers + 1):
+            last = rng.choice(LAST_NAMES)
+            first = rng.choice(FIRST_NAMES)
+            company = f'{last} {rng.choice(COMPANY_SUFFIXES)}' if rng.random() < 0.3 else None
+            customer_rows.append((
+                customer_id, f'{last}, {first}', last, company,
+                f'{rng.randint(100, 9999)} {rng.choice(STREETS)}', 'Des Moines', 'IA', '50309',
+                'Cell', f'515-555-{rng.randint(0, 9999):04d}', f'{first.lower()}@example.com'
+            ))
+        conn.execute('''
+            INSERT INTO Tbl_Customers (CustomerID, Customer, CustomerLastName, CompanyName, BillingAddress,
+                BillingCity, BillingState, BillingZip, BillingPhone1Type, BillingPhone1, EmailOne)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', customer_rows)
+
+        active_customers = max(1, int(customers * 0.95))
+        job_rows, contract_rows, payment_rows, invoice_rows, invoice_detail_rows = [], [], [], [], []
+        for job_id in range(1, jobs + 1):
+            customer_id = rng.randint(1, max(1, active_customers // 50)) \
+                if rng.random() < 0.2 \
+                else rng.randint(1, active_customers)
+            created = start + timedelta(seconds=span * job_id / jobs)
+            contracted = created + timedelta(days=rng.randint(1, 60)) if rng.random() < 0.7 else None
+            age = 1 - job_id / jobs
+            closed = contracted + timedelta(days=rng.randint(10, 120)) \
+                if contracted and rng.random() < 0.2 + 0.8 * age \
+                else None
+            job_rows.append((
+                job_id, customer_id, rng.randint(1, len(JOB_TYPES)), f'Job {job_id}', rng.choice(FIRST_NAMES),
+                f'{rng.randint(100, 9999)} {rng.choice(STREETS)}', 'Des Moines', 'IA', '50309',
+                fmt(contracted), fmt(created), fmt(contracted), fmt(closed)
+            ))
+
+            total = 0.0
+            for _ in range(rng.randint(0, 4)):
+                amount = round(rng.uniform(250, 25000), 2)
+                total += amount
+                contract_rows.append((job_id, rng.choice(WORK_TYPES), 'Scope of work', amount))
+            paid = total * (1 if closed else rng.random())
+            for _ in range(rng.randint(0, 3) if total else 0):
+                payment_rows.append((
+                    job_id, fmt(created + timedelta(days=rng.randint(1, 180))), round(paid / 3, 2),
+                    rng.choice(PAYMENT_METHODS)
+                ))
+            if contracted and total:
+                invoice_number = len(invoice_rows) + 1
+                invoice_rows.append((invoice_number, job_id, fmt(contracted + timedelta(days=rng.randint(1, 90)))))
+                invoice_detail_rows.append((invoice_number, round(total, 2)))
+
+        conn.execute('''
+            INSERT INTO Tbl_Workorders (JobID, CustomerID, JobType, JobCustomer, JobContact, JobAddress, JobCity,
+                JobSt, JobZip, ContractDate, CreateDate, JobStart, CloseDate)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', job_rows)
+        conn.execute('''
+            INSERT INTO Tbl_JobContracts (JobID, WorkDescriptionType, JobContractDescription, JobContractAmount)
+            VALUES (?, ?, ?, ?)
+        ''', contract_rows)
+        conn.execute(
+            'INSERT INTO Tbl_Payments (JobID, PaymentDate, PaymentAmount, PaymentMethod) VALUES (?, ?, ?, ?)',
+            payment_rows
+        )
+        conn.execute('INSERT INTO Tbl_Invoice (InvoiceNumber, JobID, InvoiceDate) VALUES (?, ?, ?)', invoice_rows)
+        conn.execute(
+            'INSERT INTO Tbl_InvoiceDetail (InvoiceNumber, JobContractAmount) VALUES (?, ?)',
+            invoice_detail_rows
+        )
+
+
+def create_standin(jobs: int, path=':memory:', seed_value=0) -> StandInDB:
+    db = StandInDB(path)
+    create_schema(db)
+    seed(db, jobs, seed_value)
+    return db
@@ -0,0 +1,135 @@
+"""
+Measures how long a fresh interpreter takes to import app.py, create the app and answer its first request, with
+the JWKS endpoint served by a local stand-in that answers after --jwks-delay seconds, standing in for Azure AD.
+With --preload the app is created in a parent process that then forks --workers workers, as gunicorn --preload
+does, and each worker reports how long its first request took and whether its log records still reach the sink.
+The database is a SQLite stand-in and sessions use the local SQLite store, so nothing else leaves the machine.
+
+    python -m bench.startup_bench --jobs 10000 --jwks-delay 2 --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.standin_db import create_standin
+
+CHILD = '''
+import json, os, sys, time
+start = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+application = module.app
+created = time.perf_counter()
+status = application.test_client().get('/api/hello').status_code
+served = time.perf_counter()
+result = {'import': imported - start, 'create': created - imported, 'first_request': served - created,
+          'status': status}
+if '--preload' in sys.argv:
+    workers = []
+    for _ in range(int(sys.argv[-1])):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            forked = time.perf_counter()
+            code = application.test_client().get('/api/hello').status_code
+            elapsed = time.perf_counter() - forked
+            import logging, threading
+            logging.getLogger('app').warning('worker %d served', os.getpid())
+            time.sleep(0.2)
+            os.write(write, json.dumps({'status': code, 'first_request': elapsed, 'threads': sorted(
+                thread.name for thread in threading.enumerate() if thread is not threading.main_thread())}).encode())
+            os._exit(0)
+        os.close(write)
+        workers.append((pid, read))
+    result['workers'] = []
+    for pid, read in workers:
+        os.waitpid(pid, 0)
+        with os.fdopen(read) as f:
+            result['workers'].append(json.loads(f.read()))
+print(json.dumps(result))
+'''
+
+
+def serve_jwks(delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({'keys': []}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except BrokenPipeError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10000)
+    parser.add_argument('--jwks-delay', type=float, default=2.0)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--preload', action='store_true')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = serve_jwks(args.jwks_delay)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'standin.db')
+        create_standin(args.jobs, path).session.remove()
+        env = dict(
+            os.environ,
+            DEV='1',
+            DATABASE_URI=f'sqlite:///{path}',
+            SESSION_SECRET='bench',
+            SESSION_BACKEND='local',
+            SESSION_STORE_PATH=os.path.join(tmp, 'sessions.db'),
+            APP_ID='bench-app',
+            TENANT_ID='bench-tenant',
+            ADMIN_GROUP_ID='bench-admins',
+            TIMECARD_GROUP_ID='bench-timecard',
+            JWKS_URL=f'http://127.0.0.1:{server.server_port}/keys',
+            SNAPSHOT_DIR=tmp,
+            PYTHONPATH=root
+        )
+        env.pop('JWKS_CACHE_PATH', None)
+        command = [sys.executable, '-c', CHILD] + (['--preload', str(args.workers)] if args.preload else [])
+
+        results = []
+        for _ in range(args.runs):
+            completed = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                sys.exit(completed.stderr)
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            results[-1]['worker_logs'] = completed.stderr.count(' served')
+
+        print(f'jobs={args.jobs} jwks delay={args.jwks_delay}s runs={args.runs}')
+        for phase in ('import', 'create', 'first_request'):
+            print(f'{phase:<16}{statistics.median(result[phase] for result in results) * 1000:>10.1f} ms')
+        if args.preload:
+            for i, worker in enumerate(results[-1]['workers']):
+                print(f'worker {i} first request {worker["first_request"] * 1000:.1f} ms status {worker["status"]} '
+                      f'threads {worker["threads"]}')
+            print(f'worker log records that reached the sink: {results[-1]["worker_logs"]} of {args.workers}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
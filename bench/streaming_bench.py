@@ -0,0 +1,56 @@
+"""
+Compares jsonify against the streaming JSON writer for the active contracts and address search results on a
+seeded SQLite stand-in, reporting time to first byte, total time and peak traced memory.
+
+    python -m bench.streaming_bench --jobs 100000
+"""
+import argparse
+import time
+import tracemalloc
+
+from flask import Flask, jsonify
+
+from bench.standin_db import create_standin
+from util import json_util
+from util.sql_util import SQLUtil
+
+
+def measure(app: Flask, respond) -> tuple:
+    with app.test_request_context():
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = respond()
+        chunks = iter(response.response)
+        first = next(chunks)
+        first_byte = time.perf_counter() - start
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        total = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        response.close()
+    return first_byte * 1000, total * 1000, peak / 2 ** 20, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    sql_util = SQLUtil(create_standin(args.jobs))
+    cases = [
+        ('active-contracts', sql_util.fetch_active_contracts, sql_util.stream_active_contracts),
+        ('address search', lambda: sql_util.search_by_job_address('ave'),
+         lambda: sql_util.stream_by_job_address('ave'))
+    ]
+
+    print(f'{"endpoint":<18}{"mode":<10}{"ttfb ms":>10}{"total ms":>10}{"peak MiB":>10}{"bytes":>12}')
+    for name, fetch, stream in cases:
+        for mode, respond in [('jsonify', lambda: jsonify(fetch())),
+                              ('stream', lambda: json_util.stream_json_array(stream()))]:
+            first_byte, total, peak, size = measure(app, respond)
+            print(f'{name:<18}{mode:<10}{first_byte:>10.1f}{total:>10.1f}{peak:>10.1f}{size:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Benchmarks every SQLUtil method and every estimate route on a seeded SQLite stand-in. Routes run through the
+Flask test client with an admin session already in place, so auth costs one session lookup and no token
+verification. Reports p50/p95/p99 latency, single-threaded throughput and peak traced memory per case and writes
+them as JSON so runs can be compared.
+
+    python -m bench.suite --jobs 100000 --repeat 50 --output bench-100k.json
+    python -m bench.suite --jobs 100000 --db standin-100k.db --compare bench-100k.json
+
+--db keeps the generated dataset in a file and reuses it on later runs, which matters from around 250k jobs.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bench.standin_db import StandInDB, create_standin
+
+BENCH_TENANT_ID = 'bench-tenant'
+BENCH_ADMIN_GROUP_ID = 'bench-admins'
+
+
+def configure_environment(tmp: str) -> None:
+    """
+    Sets the variables auth_util reads at import time, logging to stderr as in development. The JWKS key set is
+    loaded from an empty cache file and its refresh points at a closed local port, so nothing leaves the machine.
+    """
+    jwks_path = os.path.join(tmp, 'jwks.json')
+    with open(jwks_path, 'w') as f:
+        json.dump({'keys': []}, f)
+    os.environ.setdefault('DEV', '1')
+    os.environ.setdefault('APP_ID', 'bench-app')
+    os.environ.setdefault('TENANT_ID', BENCH_TENANT_ID)
+    os.environ.setdefault('ADMIN_GROUP_ID', BENCH_ADMIN_GROUP_ID)
+    os.environ.setdefault('TIMECARD_GROUP_ID', 'bench-timecard')
+    os.environ.setdefault('JWKS_URL', 'http://127.0.0.1:9/keys')
+    os.environ.setdefault('JWKS_CACHE_PATH', jwks_path)
+    os.environ.setdefault('JWKS_REFRESH_SECONDS', str(24 * 60 * 60))
+    logging.getLogger('jwks_util').disabled = True
+
+
+def open_standin(jobs: int, path: Optional[str]) -> StandInDB:
+    if path and os.path.exists(path):
+        return StandInDB(path)
+    return create_standin(jobs, path or ':memory:')
+
+
+def create_bench_app(sql_util):
+    from flask import Flask
+
+    from util import executor_util, metrics_util
+
+    app = Flask(__name__, static_folder=None)
+    app.config['IS_DEV'] = True
+    app.config['DC_DB'] = sql_util
+    app.config['DC_EXECUTOR'] = executor_util.init_executor(app)
+    app.secret_key = 'bench'
+    metrics_util.init_metrics(app)
+    with app.app_context():
+        from blueprints import estimate_blueprint
+
+        app.register_blueprint(estimate_blueprint.estimate, url_prefix='/api/estimate')
+    for name in ('estimate', 'estimate-auth_util'):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    return app
+
+
+def admin_identity() -> dict:
+    exp = int(time.time()) + 24 * 60 * 60
+    return {
+        'employee_id': 'bench',
+        'exp': exp,
+        'is_admin': True,
+        'name': 'Bench Admin',
+        'payload': {
+            'exp': exp,
+            'groups': [BENCH_ADMIN_GROUP_ID],
+            'ipaddr': '127.0.0.1',
+            'name': 'Bench Admin',
+            'oid': 'bench',
+            'tid': BENCH_TENANT_ID,
+            'unique_name': 'bench@example.com'
+        },
+        'user_principal_name': 'bench@example.com'
+    }
+
+
+def sample_ids(db: StandInDB) -> Dict[str, object]:
+    """
+    Picks arguments from the dataset: the customer with the most jobs, a customer with a typical number of jobs,
+    a job with contract lines, payments and an invoice, and a spread of 50 jobs for the bulk methods.
+    """
+    execute = db.session.execute
+    busiest = execute('''
+        SELECT CustomerID FROM Tbl_Workorders GROUP BY CustomerID ORDER BY COUNT(*) DESC LIMIT 1
+    ''').scalar()
+    typical = execute('''
+        SELECT CustomerID FROM Tbl_Workorders GROUP BY CustomerID HAVING COUNT(*) = 2 LIMIT 1
+    ''').scalar() or busiest
+    job_id = execute('''
+        SELECT Tbl_Invoice.JobID FROM Tbl_Invoice
+        INNER JOIN Tbl_Payments ON Tbl_Invoice.JobID = Tbl_Payments.JobID
+        ORDER BY Tbl_Invoice.JobID DESC LIMIT 1
+    ''').scalar()
+    max_job = execute('SELECT MAX(JobID) FROM Tbl_Workorders').scalar()
+    job_ids = sorted({max(1, max_job * i // 50) for i in range(1, 51)})
+    db.session.remove()
+    return {'busiest_customer': busiest, 'typical_customer': typical, 'job_id': job_id, 'job_ids': job_ids}
+
+
+def method_cases(sql_util, ids: dict) -> List[Tuple[str, Callable[[], object]]]:
+    customer, job_id, job_ids = ids['typical_customer'], ids['job_id'], ids['job_ids']
+    return [
+        ('fetch_recent_estimates', sql_util.fetch_recent_estimates),
+        ('fetch_recently_received_jobs', sql_util.fetch_recently_received_jobs),
+        ('fetch_active_contracts', sql_util.fetch_active_contracts),
+        ('fetch_active_contracts page', lambda: sql_util.fetch_active_contracts(50)),
+        ('stream_active_contracts', lambda: list(sql_util.stream_active_contracts())),
+        ('fetch_dashboard', sql_util.fetch_dashboard),
+        ('search_by_customer_name', lambda: sql_util.search_by_customer_name('ols')),
+        ('search_by_company_name', lambda: sql_util.search_by_company_name('homes')),
+        ('search_by_job_address', lambda: sql_util.search_by_job_address('grand%ave')),
+        ('search_by_job_address page', lambda: sql_util.search_by_job_address('grand%ave', 50)),
+        ('stream_by_job_address', lambda: list(sql_util.stream_by_job_address('grand%ave'))),
+        ('get_customer', lambda: sql_util.get_customer(customer)),
+        ('get_jobs_by_customer', lambda: sql_util.get_jobs_by_customer(customer)),
+        ('get_jobs_by_customer busiest', lambda: sql_util.get_jobs_by_customer(ids['busiest_customer'])),
+        ('get_job_details', lambda: sql_util.get_job_details(job_id)),
+        ('get_job_details_by_ids', lambda: sql_util.get_job_details_by_ids(job_ids)),
+        ('get_work_items_by_job', lambda: sql_util.get_work_items_by_job(job_id)),
+        ('get_payments_by_job', lambda: sql_util.get_payments_by_job(job_id)),
+        ('get_invoices_by_job', lambda: sql_util.get_invoices_by_job(job_id)),
+        ('get_work_items_by_jobs', lambda: sql_util.get_work_items_by_jobs(job_ids)),
+        ('get_payments_by_jobs', lambda: sql_util.get_payments_by_jobs(job_ids)),
+        ('get_invoices_by_jobs', lambda: sql_util.get_invoices_by_jobs(job_ids)),
+        ('get_payments_by_customer busiest', lambda: sql_util.get_payments_by_customer(ids['busiest_customer']))
+    ]
+
+
+def route_paths(ids: dict) -> List[str]:
+    customer, job_id = ids['typical_customer'], ids['job_id']
+    return [
+        '/api/estimate/recent-estimates',
+        '/api/estimate/recently-received',
+        '/api/estimate/active-contracts',
+        '/api/estimate/active-contracts?limit=50',
+        '/api/estimate/active-contracts?format=columnar',
+        '/api/estimate/dashboard',
+        '/api/estimate/dashboard?format=columnar',
+        '/api/estimate/search?query=ols&searchType=customer',
+        '/api/estimate/search?query=homes&searchType=company',
+        '/api/estimate/search?query=grand ave&searchType=address',
+        '/api/estimate/search?query=grand ave&searchType=address&limit=50',
+        '/api/estimate/search?query=grand ave&searchType=address&format=columnar',
+        f'/api/estimate/customer/{customer}',
+        f'/api/estimate/customer/{ids["busiest_customer"]}?limit=25',
+        f'/api/estimate/customer/{ids["busiest_customer"]}?include=workItems,payments,invoices',
+        f'/api/estimate/job/{job_id}',
+        f'/api/estimate/jobs?ids={",".join(map(str, ids["job_ids"]))}',
+        '/api/estimate/export?format=csv',
+        '/api/estimate/export?format=ndjson',
+        '/api/estimate/receivables',
+        '/api/estimate/receivables?asOf=2024-06-01',
+        '/api/estimate/receivables?asOf=2024-06-01&status=open',
+        '/api/estimate/cache'
+    ]
+
+
+def route_case(client, path: str) -> Callable[[], int]:
+    def request():
+        response = client.get(path)
+        size = len(response.get_data())
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+        return size
+
+    return request
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(kind: str, name: str, run: Callable[[], object], repeat: int) -> dict:
+    run()
+    timings = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call_start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    timings.sort()
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'kind': kind,
+        'name': name,
+        'repeat': repeat,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'throughput_per_s': repeat / elapsed,
+        'peak_mib': peak / 2 ** 20
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: List[dict], previous: Dict[Tuple[str, str], dict] = None) -> None:
+    header = f'{"kind":<8}{"name":<72}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"ops/s":>9}{"peak MiB":>10}'
+    print(header + (f'{"p50 vs prev":>13}' if previous else ''))
+    for result in results:
+        line = f'{result["kind"]:<8}{result["name"][:71]:<72}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}' \
+               f'{result["p99_ms"]:>9.2f}{result["throughput_per_s"]:>9.1f}{result["peak_mib"]:>10.2f}'
+        if previous:
+            before = previous.get((result['kind'], result['name']))
+            line += f'{(result["p50_ms"] / before["p50_ms"] - 1) * 100:>+12.1f}%' if before else f'{"new":>13}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--db', help='SQLite file to create the dataset in, or to reuse if it exists')
+    parser.add_argument('--only', choices=['methods', 'routes'])
+    parser.add_argument('--job-summary', action='store_true', help='read job results from Tbl_web_job_summary')
+    parser.add_argument('--search-index', action='store_true', help='answer name and address searches in memory')
+    parser.add_argument('--snapshot', action='store_true', help='read from a local snapshot of the stand-in')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare p50 latency against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        from util.sql_util import SQLUtil
+
+        start = time.perf_counter()
+        db = open_standin(args.jobs, args.db)
+        setup_seconds = time.perf_counter() - start
+        sql_util = SQLUtil(db)
+        if args.job_summary:
+            from util.job_summary_util import JobSummary
+
+            job_summary = JobSummary(sql_util)
+            job_summary.ensure_table()
+            job_summary.refresh()
+            sql_util.use_job_summary = True
+        if args.search_index:
+            from util.search_index_util import SearchIndex
+
+            sql_util.search_index = SearchIndex(sql_util)
+            sql_util.search_index.refresh()
+        if args.snapshot:
+            from util.snapshot_util import Snapshot
+
+            sql_util.snapshot = Snapshot(sql_util, os.path.join(tmp, 'snapshot.db'), max_staleness=float('inf'))
+            sql_util.snapshot.full_refresh()
+
+        ids = sample_ids(db)
+        results = []
+        if args.only != 'routes':
+            for name, run in method_cases(sql_util, ids):
+                results.append(measure('method', name, run, args.repeat))
+                sql_util.remove_sessions()
+        if args.only != 'methods':
+            from util.receivables_util import Receivables
+
+            # Loaded before the first route, as start_db does before a worker serves, so the report routes
+            # measure the report and not 503s while it loads.
+            sql_util.receivables = Receivables(sql_util)
+            sql_util.receivables.full_refresh()
+            if not sql_util.receivables.ready:
+                raise RuntimeError('The receivables report did not load')
+            app = create_bench_app(sql_util)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['identity'] = admin_identity()
+            for path in route_paths(ids):
+                results.append(measure('route', path, route_case(client, path), args.repeat))
+
+        jobs = db.session.execute('SELECT COUNT(*) FROM Tbl_Workorders').scalar()
+        db.session.remove()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'jobs': jobs,
+            'repeat': args.repeat,
+            'job_summary': args.job_summary,
+            'search_index': args.search_index,
+            'snapshot': args.snapshot,
+            'setup_seconds': setup_seconds,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version
+        },
+        'results': results
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(result['kind'], result['name']): result for result in json.load(f)['results']}
+
+    print(f'jobs={jobs} repeat={args.repeat} setup={setup_seconds:.1f}s commit={report["meta"]["commit"]}')
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,83 @@
 from flask import Blueprint, current_app, jsonify, request as req
+from werkzeug.exceptions import BadRequest, NotFound, ServiceUnavailable
 from flask_cors import cross_origin
 
 from util.app_util import CROSS_ORIGIN_HEADERS, app_db
-from util import app_logger, auth_util, validation_util
+from util.sql_util import JOB_RESULT_NAMES, Table
+from util import app_logger, auth_util, executor_util, export_util, job_detail_util, json_util, pagination_util, \
+    validation_util
+from util.version_util import DataVersion, conditional
 
 estimate = Blueprint('estimate', __name__)
 logger = app_logger.create_logger('estimate', current_app.config['IS_DEV'])
 requires_auth = auth_util.init_auth('estimate')
 
+MAX_BULK_JOBS = 100
+
 
 @estimate.route('/recent-estimates', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.current)
 def recent_estimates():
     logger.info('GET /api/estimate/recent-estimates')
-    return jsonify(app_db().fetch_recent_estimates())
+    if json_util.wants_columnar():
+        return json_util.table_response(executor_util.call(app_db().fetch_recent_estimates, columnar=True))
+    return jsonify(executor_util.call(app_db().fetch_recent_estimates))
 
 
 @estimate.route('/recently-received', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.current)
 def recently_received_jobs():
     logger.info('GET /api/estimate/recently-received')
-    return jsonify(app_db().fetch_recently_received_jobs())
+    if json_util.wants_columnar():
+        return json_util.table_response(executor_util.call(app_db().fetch_recently_received_jobs, columnar=True))
+    return jsonify(executor_util.call(app_db().fetch_recently_received_jobs))
 
 
 @estimate.route('/active-contracts', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.current)
 def active_contracts():
     logger.info('GET /api/estimate/active-contracts')
-    return jsonify(app_db().fetch_active_contracts())
+    limit = pagination_util.parse_limit(req.args.get('limit'))
+    columnar = json_util.wants_columnar()
+    if limit is None:
+        if columnar:
+            return json_util.table_response(app_db().stream_active_contracts(columnar=True))
+        return json_util.stream_json_array(app_db().stream_active_contracts())
+
+    cursor = pagination_util.decode_cursor(req.args.get('cursor'))
+    if columnar:
+        table, next_cursor = pagination_util.page_table(
+            executor_util.call(app_db().fetch_active_contracts, limit, cursor, columnar=True), limit, 'CreateDate'
+        )
+        return json_util.table_response(table, nextCursor=next_cursor)
+    return jsonify(pagination_util.page(executor_util.call(app_db().fetch_active_contracts, limit, cursor), limit,
+                                        'CreateDate'))
+
+
+@estimate.route('/dashboard', methods=['GET'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+@conditional(DataVersion.current)
+def dashboard():
+    logger.info('GET /api/estimate/dashboard')
+    if json_util.wants_columnar():
+        views = executor_util.call(app_db().fetch_dashboard, columnar=True)
+        return json_util.compact_response({
+            name: {'columns': table.columns, 'rows': table.rows} for name, table in views.items()
+        })
+    return jsonify(executor_util.call(app_db().fetch_dashboard))
 
 
 @estimate.route('/search', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.current)
 def search_customer():
     query: str = req.args.get('query').strip().lower().replace(' ', '%') \
         if req.args.get('query') \
@@ -46,12 +88,32 @@ def search_customer():
     logger.info('GET /api/estimate/search?query=%s&searchType=%s', query, search_type)
 
     db = app_db()
+    columnar = json_util.wants_columnar()
     if search_type == 'customer':
-        return jsonify(db.search_by_customer_name(query))
+        if columnar:
+            return json_util.table_response(executor_util.call(db.search_by_customer_name, query, columnar=True))
+        return jsonify(executor_util.call(db.search_by_customer_name, query))
     elif search_type == 'company':
-        return jsonify(db.search_by_company_name(query))
+        if columnar:
+            return json_util.table_response(executor_util.call(db.search_by_company_name, query, columnar=True))
+        return jsonify(executor_util.call(db.search_by_company_name, query))
     elif search_type == 'address':
-        return jsonify(db.search_by_job_address(query))
+        limit = pagination_util.parse_limit(req.args.get('limit'))
+        if limit is None:
+            if columnar:
+                return json_util.table_response(db.stream_by_job_address(query, columnar=True))
+            return json_util.stream_json_array(db.stream_by_job_address(query))
+        cursor = pagination_util.decode_cursor(req.args.get('cursor'))
+        if columnar:
+            table, next_cursor = pagination_util.page_table(
+                executor_util.call(db.search_by_job_address, query, limit, cursor, columnar=True), limit,
+                'ContractDate'
+            )
+            return json_util.table_response(table, nextCursor=next_cursor)
+        return jsonify(pagination_util.page(executor_util.call(db.search_by_job_address, query, limit, cursor), limit,
+                                            'ContractDate'))
+    elif columnar:
+        return json_util.table_response(Table(JOB_RESULT_NAMES, []))
     else:
         return jsonify([])
 
@@ -59,26 +121,124 @@ def search_customer():
 @estimate.route('/customer/<customer_id>', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.customer)
 def customer(customer_id: str):
     logger.info('GET /api/estimate/customer/%s', customer_id)
     validation_util.require_numeric(customer_id)
 
+    limit = pagination_util.parse_limit(req.args.get('limit'))
+    columnar = json_util.wants_columnar()
+    include = job_detail_util.parse_include(req.args.get('include'))
+
+    cursor = pagination_util.decode_cursor(req.args.get('cursor')) if limit is not None else None
     db = app_db()
-    data = db.get_customer(customer_id)
-    data['jobs'] = db.get_jobs_by_customer(customer_id)
+    calls = {
+        'customer': (db.get_customer, (customer_id,), {}),
+        'jobs': (db.get_jobs_by_customer, (customer_id, limit, cursor), {'columnar': columnar})
+    }
+    if limit is None:
+        calls.update(job_detail_util.customer_child_calls(db, customer_id, include))
+    results = executor_util.gather(calls, executor_util.POINT_LANE)
+    data = dict(results['customer'])
+    jobs = results['jobs']
+    next_cursor = None
+    if limit is not None:
+        if columnar:
+            jobs, next_cursor = pagination_util.page_table(jobs, limit, 'ContractDate')
+        else:
+            page = pagination_util.page(jobs, limit, 'ContractDate')
+            jobs, next_cursor = page['items'], page['nextCursor']
+    if include:
+        children = {name: results[name] for name in include} if limit is None \
+            else job_detail_util.load_children(db, job_detail_util.job_ids(jobs), include)
+        jobs = job_detail_util.expand_jobs(jobs, children)
+    if columnar:
+        if limit is not None:
+            data['jobsNextCursor'] = next_cursor
+        data['jobs'] = {'columns': jobs.columns, 'rows': jobs.rows}
+        return json_util.compact_response(data)
+    data['jobs'] = jobs
+    if limit is not None:
+        data['jobsNextCursor'] = next_cursor
     return jsonify(data)
 
 
 @estimate.route('/job/<job_id>', methods=['GET'])
 @cross_origin(headers=CROSS_ORIGIN_HEADERS)
 @requires_auth(admin_required=True)
+@conditional(DataVersion.job)
 def job(job_id: str):
     logger.info('GET /api/estimate/job/%s', job_id)
     validation_util.require_numeric(job_id)
 
-    db = app_db()
-    data = db.get_job_details(job_id)
-    data['workItems'] = db.get_work_items_by_job(job_id)
-    data['payments'] = db.get_payments_by_job(job_id)
-    data['invoices'] = db.get_invoices_by_job(job_id)
-    return jsonify(data)
+    data, timings = job_detail_util.load_job(app_db(), job_id)
+    logger.info('GET /api/estimate/job/%s timings %s', job_id, timings)
+    response = jsonify(data)
+    response.headers['Server-Timing'] = job_detail_util.server_timing(timings)
+    return response
+
+
+@estimate.route('/jobs', methods=['GET'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+@conditional(DataVersion.current)
+def jobs():
+    ids = [job_id.strip() for job_id in req.args.get('ids', '').split(',') if job_id.strip()]
+    logger.info('GET /api/estimate/jobs?ids=%s', ','.join(ids))
+    for job_id in ids:
+        validation_util.require_numeric(job_id)
+    job_ids = list(dict.fromkeys(int(job_id) for job_id in ids))
+    if len(job_ids) > MAX_BULK_JOBS:
+        raise BadRequest(f'At most {MAX_BULK_JOBS} jobs can be requested at once')
+
+    data, timings = job_detail_util.load_jobs(app_db(), job_ids)
+    logger.info('GET /api/estimate/jobs timings %s', timings)
+    response = jsonify(data)
+    response.headers['Server-Timing'] = job_detail_util.server_timing(timings)
+    return response
+
+
+@estimate.route('/export', methods=['GET'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+@conditional(DataVersion.current)
+def export():
+    export_filter = export_util.parse_filter(req.args)
+    export_format = export_util.parse_format(req.args.get('format'))
+    logger.info('GET /api/estimate/export?format=%s filter=%s', export_format, export_filter)
+    return export_util.export_response(app_db().stream_export(**export_filter), export_format)
+
+
+@estimate.route('/receivables', methods=['GET'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+def receivables():
+    # Not conditional: the report depends on the day it is aged to as well as the data.
+    report_filter = export_util.parse_filter(req.args)
+    as_of = export_util.parse_date('asOf', req.args.get('asOf'))
+    logger.info('GET /api/estimate/receivables?asOf=%s filter=%s', as_of, report_filter)
+    report = app_db().receivables
+    if report is None:
+        raise NotFound('The receivables report is not enabled')
+    if not report.ready:
+        raise ServiceUnavailable('The receivables report is still loading')
+    return jsonify(report.report(as_of.date() if as_of is not None else None, **report_filter))
+
+
+@estimate.route('/cache', methods=['GET'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+def cache_stats():
+    logger.info('GET /api/estimate/cache')
+    cache = app_db().cache
+    return jsonify(cache.stats() if cache is not None else {})
+
+
+@estimate.route('/cache', methods=['DELETE'])
+@cross_origin(headers=CROSS_ORIGIN_HEADERS)
+@requires_auth(admin_required=True)
+def invalidate_cache():
+    method: str = req.args.get('method')
+    logger.info('DELETE /api/estimate/cache?method=%s', method)
+    cache = app_db().cache
+    return jsonify({'invalidated': cache.invalidate(method) if cache is not None else 0})
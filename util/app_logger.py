@@ -1,12 +1,61 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import threading
 from os import environ
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'name': record.name,
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes a random `rate` fraction of INFO and lower records; warnings and errors are always kept.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def sample_rates() -> Dict[str, float]:
+    """
+    Parses LOG_SAMPLE_RATES, e.g. 'estimate=0.1,app=0.5', into per-logger sampling rates.
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in environ.get('LOG_SAMPLE_RATES', '').split(','))):
+        name, rate = item.split('=')
+        rates[name.strip()] = float(rate)
+    return rates
 
 
 # noinspection SpellCheckingInspection
-def create_logger(name, is_dev):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+def _create_sink(is_dev) -> logging.Handler:
     if is_dev:
         handler = logging.StreamHandler()
     else:
@@ -17,9 +66,74 @@ def create_logger(name, is_dev):
             backupCount=10
         )
     handler.setLevel(logging.INFO)
+    handler.setFormatter(JSONFormatter() if environ.get('LOG_FORMAT') == 'json' else logging.Formatter(LOG_FORMAT))
+    return handler
+
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+def _shared_handler(is_dev) -> QueueHandler:
+    """
+    Returns the process-wide QueueHandler, starting the QueueListener that drains it into the one stream or
+    rotating file sink on first use, so request threads never block on file I/O or rotation.
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            log_queue = queue.SimpleQueue()
+            _listener = QueueListener(log_queue, _create_sink(is_dev), respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown)
+            _queue_handler = QueueHandler(log_queue)
+            _queue_handler.setLevel(logging.INFO)
+        return _queue_handler
+
+
+def shutdown() -> None:
+    """
+    Flushes queued records to the sink and stops the listener thread.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _stop_before_fork() -> None:
+    """
+    Drains the queue and stops the listener thread before the process forks, so that the child neither inherits
+    a sink lock the thread was holding nor writes out records the parent was about to write.
+    """
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork() -> None:
+    """
+    Restarts the listener in the parent, and in the child, e.g. a worker forked from a preloading parent, where
+    no threads survive the fork, to keep draining the queue its loggers write to.
+    """
+    if _listener is not None:
+        _listener.start()
+
+
+def _reset_after_fork_in_child() -> None:
+    global _lock
+    _lock = threading.Lock()
+    _restart_after_fork()
+
+
+os.register_at_fork(before=_stop_before_fork, after_in_parent=_restart_after_fork,
+                    after_in_child=_reset_after_fork_in_child)
+
+
+def create_logger(name, is_dev):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
 
-    logger.addHandler(handler)
+    handler = _shared_handler(is_dev)
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+        rate = sample_rates().get(name)
+        if rate is not None:
+            logger.addFilter(SamplingFilter(rate))
     return logger
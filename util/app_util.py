@@ -2,7 +2,7 @@ from flask import current_app
 
 from util.sql_util import SQLUtil
 
-CROSS_ORIGIN_HEADERS = ['Content-Type', 'Authorization']
+CROSS_ORIGIN_HEADERS = ['Content-Type', 'Authorization', 'X-Profile']
 
 
 def app_db() -> SQLUtil:
@@ -1,15 +1,18 @@
 from datetime import datetime
 from os import environ
+import time
 
 # noinspection PyProtectedMember
 from flask import current_app, request as req, _request_ctx_stack, session
 from functools import wraps
 from jose import jwt
-import requests
-from typing import Dict
-from werkzeug.exceptions import Forbidden, HTTPException, Unauthorized
+from jose.backends.base import Key
+from typing import Optional
+from werkzeug.exceptions import Forbidden, Unauthorized
 
+from util import metrics_util, token_cache_util
 from util.app_logger import create_logger
+from util.jwks_util import DEFAULT_MIN_REFRESH_SECONDS, DEFAULT_REFRESH_SECONDS, JWKSManager
 from util.type_util import SessionIdentity, JWTClaims
 
 APP_ID = environ['APP_ID']
@@ -35,7 +38,7 @@ def get_token_auth_header():
 
 
 def set_session(claims: JWTClaims) -> SessionIdentity:
-    session['identity'] = {
+    identity: SessionIdentity = {
         'employee_id': claims['oid'].replace('-', ''),
         'exp': claims['exp'],
         'is_admin': 'groups' in claims and ADMIN_GROUP_ID in claims['groups'],
@@ -43,6 +46,8 @@ def set_session(claims: JWTClaims) -> SessionIdentity:
         'payload': claims,
         'user_principal_name': claims['unique_name']
     }
+    if session.get('identity') != identity:
+        session['identity'] = identity
     return session['identity']
 
 
@@ -53,20 +58,24 @@ def init_auth(name):
         def decorator(f):
             @wraps(f)
             def decorated(*args, **kwargs):
+                start = time.perf_counter()
                 identity: SessionIdentity = session.get('identity', {})
                 if is_active_session(identity):
                     validate_permissions(admin_required, identity)
                     _request_ctx_stack.top.current_user = identity['payload']
+                    metrics_util.observe_since('auth_seconds', start, source='session')
                     if with_session:
                         return f(identity, *args, **kwargs)
                     else:
                         return f(*args, **kwargs)
 
                 token = get_token_auth_header()
-                rsa_key = build_rsa_key(token)
-                if rsa_key:
-                    payload = decode_token(rsa_key, token, logger)
-
+                payload = token_cache.get(token)
+                source = 'token_cache'
+                if payload is None:
+                    payload = verify_token(token, logger)
+                    source = 'verify'
+                if payload:
                     updated_identity: SessionIdentity = set_session(payload)
                     logger.info(
                         f"{updated_identity['name']} with employee_id {updated_identity['employee_id']} logged in from IP address {updated_identity['payload']['ipaddr']}"
@@ -74,6 +83,7 @@ def init_auth(name):
                     validate_permissions(admin_required, updated_identity)
 
                     _request_ctx_stack.top.current_user = payload
+                    metrics_util.observe_since('auth_seconds', start, source=source)
                     if with_session:
                         return f(updated_identity, *args, **kwargs)
                     else:
@@ -110,21 +120,26 @@ def is_active_session(identity: SessionIdentity) -> bool:
     )
 
 
-def build_rsa_key(token: str) -> Dict[str, any]:
+def build_rsa_key(token: str) -> Optional[Key]:
     unverified_header = jwt.get_unverified_header(token)
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            return {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    return {}
-
-
-def decode_token(rsa_key: Dict[str, any], token: str, logger):
+    return jwks_manager.get_key(unverified_header.get('kid'))
+
+
+def verify_token(token: str, logger) -> Optional[JWTClaims]:
+    rsa_key = build_rsa_key(token)
+    if not rsa_key:
+        return None
+
+    start = time.perf_counter()
+    try:
+        payload = decode_token(rsa_key, token, logger)
+    finally:
+        token_cache.record_verification(time.perf_counter() - start)
+    token_cache.put(token, payload)
+    return payload
+
+
+def decode_token(rsa_key: Key, token: str, logger):
     try:
         return jwt.decode(
             token=token,
@@ -144,15 +159,24 @@ def decode_token(rsa_key: Dict[str, any], token: str, logger):
         raise Unauthorized()
 
 
-def execute_request(url, headers=None):
-    res = requests.get(url, headers=headers)
-    status_code = res.status_code
-
-    if status_code == 200:
-        return res.json()
-    else:
-        raise HTTPException(f'unable to call {url}. Status code: {str(status_code)}')
-
-
-jwks = execute_request(f'https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys?appid={APP_ID}')
+def start_jwks() -> None:
+    """
+    Loads the cached signing keys and starts refreshing them in the background. Run in each process that serves
+    requests, since the refresh thread doesn't survive a fork.
+    """
+    jwks_manager.load()
+    jwks_manager.start()
+
+
+token_cache = token_cache_util.VerifiedTokenCache(
+    max_entries=int(environ.get('TOKEN_CACHE_MAX_ENTRIES', token_cache_util.DEFAULT_MAX_ENTRIES)),
+    max_bytes=int(environ.get('TOKEN_CACHE_MAX_BYTES', token_cache_util.DEFAULT_MAX_BYTES))
+)
+jwks_manager = JWKSManager(
+    environ.get('JWKS_URL', f'https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys?appid={APP_ID}'),
+    cache_path=environ.get('JWKS_CACHE_PATH'),
+    refresh_interval=float(environ.get('JWKS_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)),
+    min_refresh_interval=float(environ.get('JWKS_MIN_REFRESH_SECONDS', DEFAULT_MIN_REFRESH_SECONDS)),
+    is_dev='DEV' in environ
+)
 # noinspection SpellCheckingInspection
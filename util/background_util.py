@@ -0,0 +1,44 @@
+import threading
+from typing import Callable, Optional
+
+from util import app_logger
+
+
+class PeriodicTask:
+    """
+    Runs `task` every `interval` seconds on a daemon thread inside an app context, removing the scoped
+    SQLAlchemy session afterwards so connections are returned to the pool between runs. A task may return the
+    number of rows it changed, which is logged when non-zero.
+    """
+
+    def __init__(self, app, db, name: str, interval: float, task: Callable[[], Optional[int]]):
+        self.app = app
+        self.db = db
+        self.name = name
+        self.interval = interval
+        self.task = task
+        self.logger = app_logger.create_logger(name, app.config['IS_DEV'])
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'PeriodicTask':
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    changed = self.task()
+                    if changed:
+                        self.logger.info('%s refreshed %d rows', self.name, changed)
+                except Exception as e:
+                    self.logger.error('Unable to run %s', self.name, exc_info=e)
+                    self.db.session.rollback()
+                finally:
+                    self.db.session.remove()
@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from util.shared_cache_util import SharedResultStore
+
+DEFAULT_TTLS = {
+    'fetch_recent_estimates': 30.0,
+    'fetch_recently_received_jobs': 30.0,
+    'fetch_active_contracts': 60.0,
+    'fetch_dashboard': 30.0
+}
+DEFAULT_MAX_ENTRIES = 256
+
+CacheKey = Tuple[Hashable, ...]
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultCache:
+    """
+    TTL + LRU cache for SQLUtil results. Concurrent misses for the same key are coalesced so only one caller
+    queries the database while the others wait for its result. Cached values are shared between callers and
+    must not be mutated. With a shared store, a miss is looked up there before querying, results loaded here are
+    written to it for the other worker processes, and entries another process invalidated are dropped.
+    """
+
+    def __init__(self, ttls: Dict[str, float] = None, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic,
+                 shared: SharedResultStore = None):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.shared = shared
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, Any, float]]' = OrderedDict()
+        self._flights: Dict[CacheKey, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_invalidations = 0
+
+    def get_or_load(self, name: str, args: tuple, loader: Callable[[], Any]) -> Any:
+        ttl = self.ttls.get(name)
+        if not ttl:
+            return loader()
+
+        key = (name,) + args
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value, loaded_at = entry
+                if expires <= self.clock():
+                    del self._entries[key]
+                    self.expirations += 1
+                elif self.shared is not None and self.shared.invalidated_since(name, args, loaded_at):
+                    del self._entries[key]
+                    self.shared_invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            loaded_at = time.time()
+            stored = self.shared.get(name, args) if self.shared is not None else None
+            if stored is not None:
+                flight.result, expires_at, loaded_at = stored
+                ttl = expires_at - time.time()
+            else:
+                flight.result = loader()
+                if self.shared is not None:
+                    self.shared.put(name, args, flight.result, ttl, loaded_at)
+            with self._lock:
+                self._entries[key] = (self.clock() + ttl, flight.result, loaded_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, name: str = None, *args) -> int:
+        """
+        Drops every entry when called without arguments, every entry for one SQLUtil method when given a name,
+        or a single entry when given a name and that call's arguments, here and in the shared store. Returns the
+        number of entries dropped here.
+        """
+        if self.shared is not None:
+            self.shared.invalidate(name, args)
+        with self._lock:
+            if name is None:
+                keys = list(self._entries)
+            elif args:
+                keys = [(name,) + args] if (name,) + args in self._entries else []
+            else:
+                keys = [key for key in self._entries if key[0] == name]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+        if self.shared is not None:
+            stats['shared_invalidations'] = self.shared_invalidations
+            stats.update({f'shared_{name}': value for name, value in self.shared.stats().items()})
+        return stats
+
+
+def cached(f):
+    """
+    Routes a SQLUtil method through the instance's ResultCache, if it has one, keyed by method name and arguments.
+    """
+
+    @wraps(f)
+    def decorated(self, *args, **kwargs):
+        if self.cache is None:
+            return f(self, *args, **kwargs)
+        key = args + tuple(sorted(kwargs.items())) if kwargs else args
+        return self.cache.get_or_load(f.__name__, key, lambda: f(self, *args, **kwargs))
+
+    return decorated
+
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """
+    Parses 'fetch_recent_estimates=30,fetch_active_contracts=60' into a TTL dict.
+    """
+    ttls = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, seconds = item.split('=')
+        ttls[name.strip()] = float(seconds)
+    return ttls
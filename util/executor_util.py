@@ -0,0 +1,211 @@
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError
+from os import environ
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event
+from werkzeug.exceptions import GatewayTimeout, ServiceUnavailable
+
+from util import app_logger, pool_util, profile_util
+
+SCAN_LANE = 'scan'
+POINT_LANE = 'point'
+DEFAULT_POINT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_TIMEOUT_SECONDS = 30.0
+RETRY_AFTER_SECONDS = 5
+
+Call = Tuple[Callable, tuple, dict]
+
+
+class _CallState:
+    __slots__ = ('lock', 'cursor', 'connection', 'started', 'cancelled')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cursor = None
+        self.connection = None
+        self.started = False
+        self.cancelled = False
+
+
+class QueryExecutor:
+    """
+    Runs blocking SQLUtil calls on bounded pools of threads, each in an app context of its own, so a request
+    can wait on several at once and stops waiting after a timeout. A call that times out is cancelled: dropped if
+    it has not started, and otherwise interrupted by cancelling the statement its thread is executing. When every
+    worker of a lane is busy and queue_size calls are already waiting for it, new calls are rejected with 503
+    instead of queueing behind a stalled database.
+
+    Each lane has threads of its own: lookups of one customer or job run on the point lane, so they are never
+    queued behind dashboard, search, export or bulk calls on the scan lane.
+    """
+
+    def __init__(self, lanes: Dict[str, int], queue_size: int, timeout: float):
+        self.timeout = timeout
+        self._lanes = {
+            lane: (ThreadPoolExecutor(workers, thread_name_prefix=f'sql-{lane}'),
+                   threading.BoundedSemaphore(workers + queue_size))
+            for lane, workers in lanes.items()
+        }
+        self._current = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {f'{lane}_{name}': 0 for lane in lanes
+                       for name in ('submitted', 'rejected', 'timed_out', 'interrupted')}
+        self.logger = app_logger.create_logger('executor', current_app.config['IS_DEV'])
+
+    def watch(self, engine) -> None:
+        """
+        Tracks the statement each worker is executing on engine, so that it can be interrupted.
+        """
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def call(self, f: Callable, *args, timeout: float = None, lane: str = SCAN_LANE, **kwargs) -> Any:
+        return self.gather({'result': (f, args, kwargs)}, timeout, lane)['result']
+
+    def gather(self, calls: Dict[str, Call], timeout: float = None, lane: str = SCAN_LANE) -> Dict[str, Any]:
+        """
+        Runs every (f, args, kwargs) in calls concurrently on lane and returns their results by name, raising the
+        first exception any of them raised. Raises GatewayTimeout, after cancelling the calls still running, when
+        they have not all finished within timeout seconds.
+        """
+        app = current_app._get_current_object()
+        profile = profile_util.current()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        submitted = {}
+        try:
+            for name, (f, args, kwargs) in calls.items():
+                submitted[name] = self._submit(lane, app, f, args, kwargs, profile)
+            return {
+                name: future.result(max(deadline - time.monotonic(), 0))
+                for name, (future, _) in submitted.items()
+            }
+        except TimeoutError:
+            self._count(lane, 'timed_out')
+            raise GatewayTimeout(f'The database did not respond within {timeout:g}s')
+        finally:
+            for future, state in submitted.values():
+                if not future.done():
+                    self._cancel(lane, future, state)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _submit(self, lane: str, app, f: Callable, args: tuple, kwargs: dict,
+                profile: Optional[profile_util.RequestProfile]) -> Tuple[Future, _CallState]:
+        executor, slots = self._lanes[lane]
+        if not slots.acquire(blocking=False):
+            self._count(lane, 'rejected')
+            raise ServiceUnavailable('Too many database calls are waiting', retry_after=RETRY_AFTER_SECONDS)
+        self._count(lane, 'submitted')
+        state = _CallState()
+        try:
+            future = executor.submit(self._run, app, state, f, args, kwargs, profile)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future, state
+
+    def _run(self, app, state: _CallState, f: Callable, args: tuple, kwargs: dict,
+             profile: Optional[profile_util.RequestProfile]) -> Any:
+        with state.lock:
+            if state.cancelled:
+                raise CancelledError()
+            state.started = True
+        if profile is not None:
+            profile.attach('sql')
+        with app.app_context():
+            self._current.state = state
+            try:
+                return f(*args, **kwargs)
+            finally:
+                with state.lock:
+                    state.cursor = state.connection = None
+                self._current.state = None
+                app.config['DC_DB'].remove_sessions()
+                if profile is not None:
+                    profile.detach()
+
+    def _cancel(self, lane: str, future: Future, state: _CallState) -> None:
+        with state.lock:
+            state.cancelled = True
+            if future.cancel() or not state.started or state.cursor is None:
+                return
+            cursor, connection = state.cursor, state.connection
+        try:
+            if hasattr(cursor, 'cancel'):
+                cursor.cancel()
+            elif hasattr(connection, 'interrupt'):
+                connection.interrupt()
+            self._count(lane, 'interrupted')
+        except Exception as e:
+            self.logger.warning('Unable to interrupt a timed out statement', exc_info=e)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state: Optional[_CallState] = getattr(self._current, 'state', None)
+        if state is not None:
+            with state.lock:
+                state.cursor, state.connection = cursor, conn.connection.dbapi_connection
+
+    def _count(self, lane: str, name: str) -> None:
+        with self._stats_lock:
+            self._stats[f'{lane}_{name}'] += 1
+
+
+def init_executor(app) -> Optional[QueryExecutor]:
+    """
+    Creates the executor for the app's SQLUtil, watching the source and snapshot engines. The scan lane has
+    SQL_EXECUTOR_WORKERS threads, DB_POOL_SIZE by default, and the point lane SQL_EXECUTOR_POINT_WORKERS, so that
+    by default both lanes busy at once still fit in the connection pool with its overflow and no call waits for a
+    connection while holding a thread. SQL_EXECUTOR_WORKERS=0 disables the executor, running every call on the
+    request thread without a timeout.
+    """
+    workers = int(environ.get('SQL_EXECUTOR_WORKERS', environ.get('DB_POOL_SIZE', pool_util.DEFAULT_POOL_SIZE)))
+    if workers == 0:
+        return None
+    sql_util = app.config['DC_DB']
+    with app.app_context():
+        executor = QueryExecutor(
+            {
+                SCAN_LANE: workers,
+                POINT_LANE: int(environ.get('SQL_EXECUTOR_POINT_WORKERS', DEFAULT_POINT_WORKERS))
+            },
+            int(environ.get('SQL_EXECUTOR_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+            float(environ.get('SQL_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+        )
+        executor.watch(sql_util.source_db.engine)
+    if sql_util.snapshot is not None:
+        executor.watch(sql_util.snapshot.engine)
+    return executor
+
+
+def call(f: Callable, *args, **kwargs) -> Any:
+    """
+    Runs f(*args, **kwargs) on the scan lane of the app's executor, or right here when it has none.
+    """
+    executor = current_app.config.get('DC_EXECUTOR')
+    return executor.call(f, *args, **kwargs) if executor is not None else f(*args, **kwargs)
+
+
+def call_point(f: Callable, *args, **kwargs) -> Any:
+    """
+    Runs f(*args, **kwargs), a lookup of one customer or job, on the point lane of the app's executor, or right
+    here when it has none.
+    """
+    executor = current_app.config.get('DC_EXECUTOR')
+    return executor.call(f, *args, lane=POINT_LANE, **kwargs) if executor is not None else f(*args, **kwargs)
+
+
+def gather(calls: Dict[str, Call], lane: str = SCAN_LANE) -> Dict[str, Any]:
+    """
+    Runs calls concurrently on lane of the app's executor, or one after another here when it has none.
+    """
+    executor = current_app.config.get('DC_EXECUTOR')
+    if executor is not None:
+        return executor.gather(calls, lane=lane)
+    return {name: f(*args, **kwargs) for name, (f, args, kwargs) in calls.items()}
@@ -0,0 +1,118 @@
+import csv
+import io
+import re
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, Optional, Sequence
+
+from flask import current_app, stream_with_context
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest
+
+from util import json_util
+from util.sql_util import Table
+
+EXPORT_CHUNK_ROWS = 1000
+STATUSES = ('open', 'closed')
+MAX_JOB_TYPE_LENGTH = 255
+# Leading characters that make spreadsheet applications evaluate a cell as a formula.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# A cell starting with one of them in written CSV; the writer quotes cells containing a carriage return.
+FORMULA_CELL = re.compile(r'(?:^|,)(?:"[=+\-@\t\r]|[=+\-@\t])', re.MULTILINE)
+
+
+def parse_date(name: str, value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise BadRequest(f'{name} must be a date formatted as YYYY-MM-DD')
+
+
+def parse_filter(args: MultiDict) -> dict:
+    """
+    Parses the export filter from the query string into SQLUtil.stream_export's arguments: the contract date
+    range from and to, both inclusive, jobType, a job type description, and status, 'open' or 'closed'.
+    """
+    contract_to = parse_date('to', args.get('to'))
+    job_type = (args.get('jobType') or '').strip() or None
+    status = args.get('status') or None
+    if job_type is not None and len(job_type) > MAX_JOB_TYPE_LENGTH:
+        raise BadRequest(f'jobType must be at most {MAX_JOB_TYPE_LENGTH} characters')
+    if status is not None and status not in STATUSES:
+        raise BadRequest(f'status must be one of {", ".join(STATUSES)}')
+    return {
+        'contract_from': parse_date('from', args.get('from')),
+        'contract_to': contract_to + timedelta(days=1) if contract_to is not None else None,
+        'job_type': job_type,
+        'status': status
+    }
+
+
+def encode_csv(table: Table, chunk_rows=EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Encodes a Table as CSV with a header row, writing chunk_rows rows per chunk as the rows are consumed. Text
+    that a spreadsheet would evaluate as a formula is prefixed with a quote; a chunk is only re-encoded value by
+    value when one of its cells starts with a formula character.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.columns)
+    rows = iter(table.rows)
+    chunk = list(islice(rows, chunk_rows))
+    while chunk:
+        start = buffer.tell()
+        writer.writerows(chunk)
+        if FORMULA_CELL.search(buffer.getvalue(), start):
+            buffer.seek(start)
+            buffer.truncate()
+            writer.writerows(map(_escape_formulas, chunk))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        chunk = list(islice(rows, chunk_rows))
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _escape_formulas(row: Sequence) -> Sequence:
+    if not any(isinstance(value, str) and value.startswith(FORMULA_PREFIXES) for value in row):
+        return row
+    return [f"'{value}" if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) else value for value in row]
+
+
+def encode_ndjson(table: Table, chunk_rows=EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Encodes a Table as newline-delimited JSON, one object keyed by column per row, formatted as jsonify does,
+    yielding chunk_rows rows per chunk as the rows are consumed.
+    """
+    columns = table.columns
+    rows = iter(table.rows)
+    chunk = list(islice(rows, chunk_rows))
+    while chunk:
+        yield ''.join([json_util.dumps_compact(dict(zip(columns, row))) + '\n' for row in chunk])
+        chunk = list(islice(rows, chunk_rows))
+
+
+FORMATS = {
+    'csv': ('text/csv', encode_csv),
+    'ndjson': ('application/x-ndjson', encode_ndjson)
+}
+
+
+def parse_format(value: Optional[str]) -> str:
+    export_format = value or 'csv'
+    if export_format not in FORMATS:
+        raise BadRequest(f'format must be one of {", ".join(FORMATS)}')
+    return export_format
+
+
+def export_response(table: Table, export_format: str, filename='jobs'):
+    """
+    Streams a Table as a file download in export_format.
+    """
+    mimetype, encode = FORMATS[export_format]
+    response = current_app.response_class(stream_with_context(encode(table)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{export_format}'
+    return response
@@ -0,0 +1,133 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.exceptions import BadRequest
+
+from util import executor_util
+from util.sql_util import SQLUtil, Table
+
+JOB_PARTS = {
+    'details': 'get_job_details',
+    'workItems': 'get_work_items_by_job',
+    'payments': 'get_payments_by_job',
+    'invoices': 'get_invoices_by_job'
+}
+
+BULK_JOB_PARTS = {
+    'details': 'get_job_details_by_ids',
+    'workItems': 'get_work_items_by_jobs',
+    'payments': 'get_payments_by_jobs',
+    'invoices': 'get_invoices_by_jobs'
+}
+
+CHILD_PARTS = ['workItems', 'payments', 'invoices']
+
+CUSTOMER_CHILD_PARTS = {
+    'workItems': 'get_work_items_by_customer',
+    'payments': 'get_payments_by_customer',
+    'invoices': 'get_invoices_by_customer'
+}
+
+Timings = Dict[str, float]
+Children = Dict[str, Dict[int, List[dict]]]
+
+
+def _timed(f: Callable, arg) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    return f(arg), (time.perf_counter() - start) * 1000
+
+
+def _run_parts(sql_util: SQLUtil, parts: Dict[str, str], arg, lane: str) -> Tuple[Dict[str, Any], Timings]:
+    """
+    Runs each SQLUtil method in parts concurrently on lane of the query executor, each on its own pooled
+    connection, and returns the results and the milliseconds each took, keyed by part name.
+    """
+    start = time.perf_counter()
+    timed = executor_util.gather({
+        name: (_timed, (getattr(sql_util, method), arg), {}) for name, method in parts.items()
+    }, lane)
+    results = {name: result for name, (result, _) in timed.items()}
+    timings = {name: duration for name, (_, duration) in timed.items()}
+    timings['total'] = (time.perf_counter() - start) * 1000
+    return results, timings
+
+
+def load_job(sql_util: SQLUtil, job_id) -> Tuple[dict, Timings]:
+    results, timings = _run_parts(sql_util, JOB_PARTS, job_id, executor_util.POINT_LANE)
+    data = dict(results['details'])
+    data['workItems'] = results['workItems']
+    data['payments'] = results['payments']
+    data['invoices'] = results['invoices']
+    return data, timings
+
+
+def load_jobs(sql_util: SQLUtil, job_ids: List[int]) -> Tuple[List[dict], Timings]:
+    """
+    Loads many jobs with one IN-batched query per part instead of four queries per job. Jobs that don't exist
+    are left out; the rest keep the order of job_ids.
+    """
+    results, timings = _run_parts(sql_util, BULK_JOB_PARTS, job_ids, executor_util.SCAN_LANE)
+    jobs = []
+    for job_id in job_ids:
+        details = results['details'].get(job_id)
+        if details is None:
+            continue
+        data = dict(details)
+        data['workItems'] = results['workItems'].get(job_id, [])
+        data['payments'] = results['payments'].get(job_id, [])
+        data['invoices'] = results['invoices'].get(job_id, [])
+        jobs.append(data)
+    return jobs, timings
+
+
+def parse_include(value: Optional[str]) -> List[str]:
+    """
+    Parses include=workItems,payments,invoices into the child parts to load with each job, in CHILD_PARTS order.
+    """
+    names = {name.strip() for name in (value or '').split(',') if name.strip()}
+    if not names.issubset(CHILD_PARTS):
+        raise BadRequest(f'include may only name {", ".join(CHILD_PARTS)}')
+    return [name for name in CHILD_PARTS if name in names]
+
+
+def customer_child_calls(sql_util: SQLUtil, customer_id, include: List[str]) -> Dict[str, executor_util.Call]:
+    """
+    executor_util calls loading each included part for every job of the customer, one query per part.
+    """
+    return {name: (getattr(sql_util, CUSTOMER_CHILD_PARTS[name]), (customer_id,), {}) for name in include}
+
+
+def load_children(sql_util: SQLUtil, job_ids: List[int], include: List[str]) -> Children:
+    """
+    Loads each included part for job_ids, one page of a customer's jobs, with the IN-batched bulk queries,
+    concurrently.
+    """
+    return executor_util.gather({
+        name: (getattr(sql_util, BULK_JOB_PARTS[name]), (job_ids,), {}) for name in include
+    }, executor_util.POINT_LANE)
+
+
+def job_ids(jobs) -> List[int]:
+    if isinstance(jobs, Table):
+        index = jobs.columns.index('JobID')
+        return [row[index] for row in jobs.rows if row[index] is not None]
+    return [job['JobID'] for job in jobs if job['JobID'] is not None]
+
+
+def expand_jobs(jobs, children: Children):
+    """
+    Adds each loaded part to every job, as a field of the job's dict or as a column of a Table, with an empty list
+    for jobs that have no such rows. jobs may be a cached result, so it is copied rather than changed.
+    """
+    if isinstance(jobs, Table):
+        index = jobs.columns.index('JobID')
+        return Table(jobs.columns + list(children), [
+            tuple(row) + tuple(rows.get(row[index], []) for rows in children.values()) for row in jobs.rows
+        ])
+    return [
+        dict(job, **{name: rows.get(job['JobID'], []) for name, rows in children.items()}) for job in jobs
+    ]
+
+
+def server_timing(timings: Timings) -> str:
+    return ', '.join(f'{name};dur={duration:.1f}' for name, duration in timings.items())
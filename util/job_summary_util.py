@@ -0,0 +1,342 @@
+import os
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+
+from util.background_util import PeriodicTask
+from util.sql_util import JOB_RESULT_COLUMNS, JOB_SUMMARY_TABLE, TABLE_WATERMARKS, JobScope, SQLUtil
+
+SUMMARY_COLUMNS = {
+    'CloseDate': 'DATETIME',
+    'JobCustomerID': 'INTEGER',
+    'CustomerID': 'INTEGER',
+    'JobID': 'INTEGER',
+    'Customer': 'VARCHAR(255)',
+    'CustomerLastName': 'VARCHAR(255)',
+    'CompanyName': 'VARCHAR(255)',
+    'ContractDate': 'DATETIME',
+    'CreateDate': 'DATETIME',
+    'JobAddress': 'VARCHAR(255)',
+    'JobTypeDescription': 'VARCHAR(255)',
+    'TotalAmount': 'CURRENCY',
+    'TotalPayments': 'CURRENCY'
+}
+
+SUMMARY_INDEXES = ['JobID', 'JobCustomerID', 'ContractDate', 'CreateDate']
+SUMMARY_KEY_INDEX = f'UX_{JOB_SUMMARY_TABLE}_Key'
+LOCK_TABLE = f'{JOB_SUMMARY_TABLE}_lock'
+DEFAULT_FULL_REFRESH_SECONDS = 60 * 60
+DEFAULT_LEASE_SECONDS = 10 * 60
+
+# Per-job values of one source table, compared against the summary columns they feed to find the changed jobs
+# once the table's watermark moves.
+JOB_CHANGE_QUERIES = {
+    'Tbl_Workorders': (
+        'SELECT JobID, CustomerID, ContractDate, CreateDate, CloseDate, JobAddress FROM Tbl_Workorders',
+        ['JobCustomerID', 'ContractDate', 'CreateDate', 'CloseDate', 'JobAddress']
+    ),
+    'Tbl_JobContracts': (
+        'SELECT JobID, SUM(JobContractAmount) FROM Tbl_JobContracts '
+        'WHERE JobContractAmount IS NOT NULL GROUP BY JobID',
+        ['TotalAmount']
+    ),
+    'Tbl_Payments': (
+        'SELECT JobID, SUM(PaymentAmount) FROM Tbl_Payments WHERE PaymentAmount IS NOT NULL GROUP BY JobID',
+        ['TotalPayments']
+    )
+}
+
+SummaryKey = Tuple[Optional[int], Optional[int]]
+
+
+class JobSummary:
+    """
+    Materializes the SQLUtil job result projection into Tbl_web_job_summary, one row per (CustomerID, JobID), so that
+    the dashboard and search queries no longer aggregate Tbl_JobContracts and Tbl_Payments on every request.
+    Customers without jobs keep their single row with a NULL JobID, matching the LEFT JOIN in the live query.
+
+    Every worker reads the table but only the holder of a lease kept in Tbl_web_job_summary_lock writes it; another
+    worker takes the lease over once it has not been renewed for lease_seconds. refresh_changed() compares the
+    TABLE_WATERMARKS of the source tables and, for each table that moved, finds the jobs whose values differ from
+    the summary with a query of that table alone, then rewrites only those rows. Edits the watermarks miss, such as
+    a renamed customer or a changed job type, are picked up by refresh(), which diffs the whole projection and
+    runs every full_refresh_interval seconds once started.
+    """
+
+    def __init__(self, sql_util: SQLUtil, full_refresh_interval: float = DEFAULT_FULL_REFRESH_SECONDS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.sql_util = sql_util
+        self.db = sql_util.get_db()
+        self.full_refresh_interval = full_refresh_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.columns = ', '.join(f'[{name}]' for name in SUMMARY_COLUMNS)
+        self.source_query = JobSummary.build_source_query()
+        self.watermarks: Optional[Dict[str, tuple]] = None
+        self.full_refreshed_at: Optional[float] = None
+
+    @staticmethod
+    def build_source_query(scope: JobScope = JobScope()) -> str:
+        return f'''
+            {JOB_RESULT_COLUMNS['CloseDate']} AS CloseDate,
+            {JOB_RESULT_COLUMNS['JobCustomerID']} AS JobCustomerID,
+            {SQLUtil.build_job_result_query(scope)}
+        '''
+
+    def ensure_table(self) -> None:
+        """
+        Creates the summary table with a unique (CustomerID, JobID) index. A table created before the index
+        existed is refilled without its duplicate rows before the index is added. Only the lease holder, or a
+        process that owns the database, may call this.
+        """
+        if JOB_SUMMARY_TABLE not in inspect(self.db.engine).get_table_names():
+            column_definitions = ', '.join(f'[{name}] {sql_type}' for name, sql_type in SUMMARY_COLUMNS.items())
+            self.db.session.execute(f'CREATE TABLE {JOB_SUMMARY_TABLE} ({column_definitions})')
+            for column in SUMMARY_INDEXES:
+                self.db.session.execute(
+                    f'CREATE INDEX IX_{JOB_SUMMARY_TABLE}_{column} ON {JOB_SUMMARY_TABLE} ([{column}])'
+                )
+            self._create_key_index()
+            self.db.session.commit()
+            return
+        try:
+            self._create_key_index()
+            self.db.session.commit()
+        except DBAPIError:
+            # Either the index exists already or the table holds duplicate keys from before it did.
+            self.db.session.rollback()
+            duplicates = self.db.session.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT [CustomerID], [JobID] FROM {JOB_SUMMARY_TABLE}
+                    GROUP BY [CustomerID], [JobID] HAVING COUNT(*) > 1
+                ) AS Duplicates
+            ''').scalar()
+            if duplicates:
+                self.db.session.execute(f'DELETE FROM {JOB_SUMMARY_TABLE}')
+                self.db.session.execute(f'INSERT INTO {JOB_SUMMARY_TABLE} ({self.columns}) SELECT {self.source_query}')
+                self._create_key_index()
+                self.db.session.commit()
+
+    def ensure_lock(self) -> None:
+        """
+        Creates the lease table and its single row unless another worker already has.
+        """
+        if LOCK_TABLE not in inspect(self.db.engine).get_table_names():
+            try:
+                self.db.session.execute(f'''
+                    CREATE TABLE {LOCK_TABLE} (
+                        [LockID] INTEGER CONSTRAINT PK_{LOCK_TABLE} PRIMARY KEY,
+                        [Owner] VARCHAR(255),
+                        [Expires] DOUBLE,
+                        [FilledAt] DOUBLE
+                    )
+                ''')
+                self.db.session.commit()
+            except DBAPIError:
+                self.db.session.rollback()
+        try:
+            self.db.session.execute(f'INSERT INTO {LOCK_TABLE} ([LockID]) VALUES (0)')
+            self.db.session.commit()
+        except DBAPIError:
+            self.db.session.rollback()
+
+    def acquire(self) -> bool:
+        """
+        Takes or renews the lease. Returns whether this process holds it and may write the summary.
+        """
+        now = time.time()
+        result = self.db.session.execute(f'''
+            UPDATE {LOCK_TABLE} SET [Owner] = :owner, [Expires] = :expires
+            WHERE [LockID] = 0 AND ([Owner] IS NULL OR [Owner] = :owner OR [Expires] < :now)
+        ''', {'owner': self.owner, 'expires': now + self.lease_seconds, 'now': now})
+        self.db.session.commit()
+        return result.rowcount == 1
+
+    def is_filled(self) -> bool:
+        """
+        Whether a lease holder has filled the summary, so it can be read.
+        """
+        return self.db.session.execute(f'SELECT [FilledAt] FROM {LOCK_TABLE} WHERE [LockID] = 0').scalar() \
+            is not None
+
+    def refresh(self) -> int:
+        """
+        Diffs the live job results against the summary and rewrites only the rows that were added, changed,
+        removed or duplicated. Returns the number of (CustomerID, JobID) rows rewritten.
+        """
+        watermarks = self._watermarks()
+        summarized: Dict[SummaryKey, tuple] = {}
+        duplicated: Set[SummaryKey] = set()
+        for row in self.db.session.execute(f'SELECT {self.columns} FROM {JOB_SUMMARY_TABLE}'):
+            key = (row['CustomerID'], row['JobID'])
+            if key in summarized:
+                duplicated.add(key)
+            summarized[key] = tuple(row)
+        if not summarized:
+            result = self.db.session.execute(
+                f'INSERT INTO {JOB_SUMMARY_TABLE} ({self.columns}) SELECT {self.source_query}'
+            )
+            changed = result.rowcount
+        else:
+            live = {(row['CustomerID'], row['JobID']): tuple(row)
+                    for row in self.db.session.execute(f'SELECT {self.source_query}')}
+            stale = {key for key, row in summarized.items() if live.get(key) != row} | duplicated
+            fresh = {key for key, row in live.items() if summarized.get(key) != row or key in duplicated}
+            self._delete(sorted(stale, key=repr))
+            self._insert(sorted(fresh, key=repr))
+            changed = len(stale | fresh)
+        self.db.session.commit()
+        self.watermarks = watermarks
+        self.full_refreshed_at = time.monotonic()
+        return changed
+
+    def refresh_changed(self) -> int:
+        """
+        Rewrites the rows of the jobs and customers whose source rows changed since the last refresh, found
+        through the watermarks, or nothing when none of them moved. Falls back to refresh() when there is no
+        previous refresh to compare with. Returns the number of jobs and customers rewritten.
+        """
+        if self.watermarks is None:
+            return self.refresh()
+        watermarks = self._watermarks()
+        moved = [table for table, watermark in watermarks.items() if self.watermarks.get(table) != watermark]
+        if not moved:
+            return 0
+        job_ids, customer_ids = self._changed_keys(moved)
+        self.refresh_jobs(job_ids, customer_ids)
+        self.watermarks = watermarks
+        return len(job_ids) + len(customer_ids)
+
+    def refresh_jobs(self, job_ids: Iterable[int], customer_ids: Iterable[int] = ()) -> None:
+        """
+        Rewrites the rows of these jobs and the job-less rows of these customers from the live job results.
+        """
+        keys = [(None, job_id) for job_id in job_ids] + [(customer_id, None) for customer_id in customer_ids]
+        self._delete(keys)
+        self._insert(keys)
+        self.db.session.commit()
+
+    def start(self, app, interval: float) -> PeriodicTask:
+        return PeriodicTask(app, self.db, 'job_summary', interval, self._scheduled_refresh).start()
+
+    def load(self) -> None:
+        """
+        Fills or catches up the summary when this process holds the lease, then lets SQLUtil read it once it has
+        been filled by any process.
+        """
+        self.ensure_lock()
+        if self.acquire():
+            self._refresh_as_leader()
+        self.sql_util.use_job_summary = self.is_filled()
+
+    def _scheduled_refresh(self) -> int:
+        changed = self._refresh_as_leader() if self.acquire() else 0
+        if not self.sql_util.use_job_summary:
+            self.sql_util.use_job_summary = self.is_filled()
+        if changed:
+            self.sql_util.data_changed([JOB_SUMMARY_TABLE])
+        return changed
+
+    def _refresh_as_leader(self) -> int:
+        if self.full_refreshed_at is None:
+            self.ensure_table()
+        if self.full_refreshed_at is None \
+                or time.monotonic() - self.full_refreshed_at >= self.full_refresh_interval:
+            changed = self.refresh()
+        else:
+            changed = self.refresh_changed()
+        self.db.session.execute(f'UPDATE {LOCK_TABLE} SET [FilledAt] = :now WHERE [LockID] = 0',
+                                {'now': time.time()})
+        self.db.session.commit()
+        return changed
+
+    def _watermarks(self) -> Dict[str, tuple]:
+        return {table: tuple(self.db.session.execute(query).fetchone()) for table, query in TABLE_WATERMARKS.items()}
+
+    def _changed_keys(self, tables: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        The jobs whose values in the moved tables differ from the summary, including jobs only one side has, and
+        the customers that gained or lost their job-less row as a result or were added or removed.
+        """
+        summarized: Dict[int, tuple] = {}
+        job_customers: Dict[int, int] = {}
+        customers_summarized = set()
+        columns = [name for table in tables if table in JOB_CHANGE_QUERIES for name in JOB_CHANGE_QUERIES[table][1]]
+        for row in self.db.session.execute(
+                f'SELECT [CustomerID], [JobID]{"".join(f", [{name}]" for name in columns)} FROM {JOB_SUMMARY_TABLE}'):
+            customers_summarized.add(row[0])
+            if row[1] is not None:
+                summarized[row[1]] = tuple(row[2:])
+                job_customers[row[1]] = row[0]
+
+        job_ids: Set[int] = set()
+        customer_ids: Set[int] = set()
+        offset = 0
+        for table in tables:
+            if table not in JOB_CHANGE_QUERIES:
+                continue
+            query, names = JOB_CHANGE_QUERIES[table]
+            live = {row[0]: tuple(row[1:]) for row in self.db.session.execute(query)}
+            if table == 'Tbl_Workorders':
+                job_ids.update(live.keys() ^ summarized.keys())
+                customer_ids.update(values[0] for job_id, values in live.items() if job_id not in summarized)
+            width = len(names)
+            for job_id, values in summarized.items():
+                if values[offset:offset + width] != live.get(job_id, (None,) * width):
+                    job_ids.add(job_id)
+            offset += width
+        if 'Tbl_Customers' in tables:
+            live_customers = {row[0] for row in self.db.session.execute('SELECT CustomerID FROM Tbl_Customers')}
+            customer_ids.update(live_customers ^ customers_summarized)
+        customer_ids.update(job_customers[job_id] for job_id in job_ids if job_id in job_customers)
+        return sorted(job_ids), sorted(customer_id for customer_id in customer_ids if customer_id is not None)
+
+    def _create_key_index(self) -> None:
+        self.db.session.execute(
+            f'CREATE UNIQUE INDEX {SUMMARY_KEY_INDEX} ON {JOB_SUMMARY_TABLE} ([CustomerID], [JobID])'
+        )
+
+    def _delete(self, keys: List[SummaryKey]) -> None:
+        job_ids, customer_ids = JobSummary._split_keys(keys)
+        for batch in SQLUtil.batches(job_ids):
+            placeholders, params = SQLUtil.bind_list('job_id', batch)
+            self.db.session.execute(f'''
+                DELETE FROM {JOB_SUMMARY_TABLE}
+                WHERE [JobID] IN ({placeholders})
+                OR ([JobID] IS NULL AND [CustomerID] IN (
+                    SELECT [CustomerID] FROM Tbl_Workorders WHERE [JobID] IN ({placeholders})
+                ))
+            ''', params)
+        for batch in SQLUtil.batches(customer_ids):
+            placeholders, params = SQLUtil.bind_list('customer_id', batch)
+            self.db.session.execute(f'''
+                DELETE FROM {JOB_SUMMARY_TABLE}
+                WHERE [JobID] IS NULL AND [CustomerID] IN ({placeholders})
+            ''', params)
+
+    def _insert(self, keys: List[SummaryKey]) -> None:
+        job_ids, customer_ids = JobSummary._split_keys(keys)
+        for batch in SQLUtil.batches(job_ids):
+            placeholders, params = SQLUtil.bind_list('job_id', batch)
+            self.db.session.execute(f'''
+                INSERT INTO {JOB_SUMMARY_TABLE} ({self.columns})
+                SELECT {JobSummary.build_source_query(JobScope(job_ids=len(batch)))}
+                WHERE {JOB_RESULT_COLUMNS['JobID']} IN ({placeholders})
+            ''', params)
+        for batch in SQLUtil.batches(customer_ids):
+            placeholders, params = SQLUtil.bind_list('customer_id', batch)
+            self.db.session.execute(f'''
+                INSERT INTO {JOB_SUMMARY_TABLE} ({self.columns})
+                SELECT {JobSummary.build_source_query(JobScope(no_job=True))}
+                WHERE {JOB_RESULT_COLUMNS['JobID']} IS NULL
+                AND {JOB_RESULT_COLUMNS['CustomerID']} IN ({placeholders})
+            ''', params)
+
+    @staticmethod
+    def _split_keys(keys: List[SummaryKey]) -> Tuple[List[int], List[int]]:
+        job_ids = sorted({job_id for _, job_id in keys if job_id is not None})
+        customer_ids = sorted({customer_id for customer_id, job_id in keys if job_id is None})
+        return job_ids, customer_ids
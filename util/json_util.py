@@ -0,0 +1,135 @@
+import json as stdlib_json
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+from typing import Iterable, Iterator
+
+from flask import current_app, json, jsonify, request, stream_with_context
+
+from util.sql_util import Table
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_BUFFER_SIZE = 65536
+TABLE_CHUNK_ROWS = 500
+COLUMNAR_MIMETYPE = 'application/vnd.dc-estimates.columnar+json'
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('', 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def is_pretty() -> bool:
+    return bool(current_app.config.get('JSONIFY_PRETTYPRINT_REGULAR')) or current_app.debug
+
+
+def encode_json_array(rows: Iterable, buffer_size=STREAM_BUFFER_SIZE) -> Iterator[str]:
+    """
+    Encodes rows as a JSON array one row at a time, yielding roughly buffer_size characters per chunk. Rows are
+    encoded with the app's JSON encoder and jsonify's compact separators, so Decimal and datetime values and the
+    concatenated output are identical to jsonify(list(rows)).
+    """
+    dumps = partial(json.dumps, separators=(',', ':'))
+    buffer = ['[']
+    size = 1
+    separator = ''
+    for row in rows:
+        encoded = dumps(row)
+        buffer.append(separator)
+        buffer.append(encoded)
+        separator = ','
+        size += len(encoded) + 1
+        if size >= buffer_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(']\n')
+    yield ''.join(buffer)
+
+
+def stream_json_array(rows: Iterable):
+    """
+    Streams rows as a JSON array response. Falls back to jsonify when pretty printing is on, since indented
+    output can't be produced row by row.
+    """
+    if is_pretty():
+        return jsonify(list(rows))
+    return current_app.response_class(
+        stream_with_context(encode_json_array(rows)),
+        mimetype='application/json'
+    )
+
+
+def http_date(value: date) -> str:
+    """
+    Formats a date or datetime as werkzeug.http.http_date does, the format jsonify uses, without going through
+    email.utils. Naive datetimes are taken to be UTC.
+    """
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return f'{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month]} {value.year:04d} ' \
+           f'{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT'
+
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (Decimal, uuid.UUID)):
+        return str(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+_encoder = stdlib_json.JSONEncoder(separators=(',', ':'), default=_default)
+
+
+def dumps_compact(value) -> str:
+    """
+    Encodes value as compact JSON, formatting dates, Decimals and UUIDs as jsonify does. Uses orjson when it is
+    installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    return _encoder.encode(value)
+
+
+def wants_columnar() -> bool:
+    return request.args.get('format') == 'columnar' or request.accept_mimetypes.best == COLUMNAR_MIMETYPE
+
+
+def encode_table(table: Table, chunk_rows=TABLE_CHUNK_ROWS, **fields) -> Iterator[str]:
+    """
+    Encodes a Table as {"columns": [...], **fields, "rows": [[...], ...]}, encoding chunk_rows rows per chunk as
+    the rows are consumed.
+    """
+    head = dumps_compact({'columns': table.columns, **fields})
+    yield head[:-1] + ',"rows":['
+    rows = iter(table.rows)
+    separator = ''
+    chunk = list(islice(rows, chunk_rows))
+    while chunk:
+        yield separator + dumps_compact(chunk)[1:-1]
+        separator = ','
+        chunk = list(islice(rows, chunk_rows))
+    yield ']}\n'
+
+
+def table_response(table: Table, **fields):
+    """
+    Responds with a Table in the columnar format, encoded in one call when its rows are a list and streamed
+    otherwise.
+    """
+    if isinstance(table.rows, list):
+        body = dumps_compact({'columns': table.columns, **fields, 'rows': table.rows}) + '\n'
+    else:
+        body = stream_with_context(encode_table(table, **fields))
+    return current_app.response_class(body, mimetype='application/json')
+
+
+def compact_response(value):
+    return current_app.response_class(dumps_compact(value) + '\n', mimetype='application/json')
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from jose import jwk
+from jose.backends.base import Key
+
+from util.app_logger import create_logger
+
+DEFAULT_REFRESH_SECONDS = 6 * 60 * 60
+DEFAULT_MIN_REFRESH_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 10
+
+
+class JWKSManager:
+    """
+    Holds the signing keys published at a JWKS url as pre-constructed RS256 keys indexed by kid. Keys are refreshed
+    on a schedule in the background and, at most once per min_refresh_interval, when a token names a kid that
+    isn't known yet, so key rotations are picked up without a restart. The last good key set is written to
+    cache_path so a restart can serve tokens before the first fetch completes.
+    """
+
+    def __init__(self, url: str, cache_path: str = None, refresh_interval: float = DEFAULT_REFRESH_SECONDS,
+                 min_refresh_interval: float = DEFAULT_MIN_REFRESH_SECONDS, is_dev=False):
+        self.url = url
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.logger = create_logger('jwks_util', is_dev)
+        self.keys: Dict[str, Key] = {}
+        self.last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> None:
+        """
+        Loads the key set persisted at cache_path. Without one, no keys are known until the refresh thread's first
+        fetch or until a token names a kid, so loading never waits on the network.
+        """
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path) as f:
+                    self.keys = JWKSManager.construct_keys(json.load(f))
+                self.logger.info('Loaded %d signing keys from %s', len(self.keys), self.cache_path)
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.error('Unable to load cached signing keys from %s', self.cache_path, exc_info=e)
+
+    def get_key(self, kid: str) -> Optional[Key]:
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.last_refresh >= self.min_refresh_interval:
+            self.logger.info('Unknown kid %s, refreshing signing keys', kid)
+            try:
+                self.refresh(force=False)
+            except Exception as e:
+                self.logger.error('Unable to refresh signing keys', exc_info=e)
+            key = self.keys.get(kid)
+        return key
+
+    def refresh(self, force=True) -> bool:
+        """
+        Fetches the key set and swaps it in. Concurrent callers share a single fetch; unless forced, a refresh
+        is skipped when another finished less than min_refresh_interval ago. Returns whether keys were fetched.
+        """
+        with self._refresh_lock:
+            if not force and time.monotonic() - self.last_refresh < self.min_refresh_interval:
+                return False
+            self.last_refresh = time.monotonic()
+            res = requests.get(self.url, timeout=REQUEST_TIMEOUT_SECONDS)
+            if res.status_code != 200:
+                raise requests.HTTPError(f'unable to call {self.url}. Status code: {res.status_code}')
+            jwks = res.json()
+            self.keys = JWKSManager.construct_keys(jwks)
+            self._persist(jwks)
+            return True
+
+    def start(self) -> 'JWKSManager':
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self):
+        interval = self.refresh_interval if self.last_refresh else 0
+        while not self._stop.wait(interval):
+            interval = self.refresh_interval
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error('Unable to refresh signing keys', exc_info=e)
+
+    def _persist(self, jwks: dict) -> None:
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = f'{self.cache_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(jwks, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.logger.error('Unable to persist signing keys to %s', self.cache_path, exc_info=e)
+
+    @staticmethod
+    def construct_keys(jwks: dict) -> Dict[str, Key]:
+        return {
+            key['kid']: jwk.construct({
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }, algorithm='RS256')
+            for key in jwks['keys']
+            if key.get('kty') == 'RSA'
+        }
@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from util import app_logger
+
+
+class Lifecycle:
+    """
+    The per-process half of the app's startup: opening connections, loading caches and starting background
+    threads, none of which survive a fork. create_app only registers these steps, so the app can be created in a
+    parent process and preloaded before workers are forked from it. Each process then runs the steps once, in
+    order, before its first request, or earlier when ensure_started is called, e.g. from a gunicorn post_fork hook.
+    A step that fails is logged and skipped so the process still serves what it can.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = app_logger.create_logger('startup', app.config['IS_DEV'])
+        self.steps: List[Tuple[str, Callable[[], None]]] = []
+        self.timings: Dict[str, float] = {}
+        self.pid: Optional[int] = None
+        self._lock = threading.Lock()
+        app.before_request(self.ensure_started)
+
+    def on_start(self, name: str, step: Callable[[], None]) -> None:
+        self.steps.append((name, step))
+
+    def ensure_started(self) -> None:
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            start = time.perf_counter()
+            with self.app.app_context():
+                for name, step in self.steps:
+                    step_start = time.perf_counter()
+                    try:
+                        step()
+                    except Exception as e:
+                        self.logger.error('Unable to start %s', name, exc_info=e)
+                    self.timings[name] = time.perf_counter() - step_start
+            self.timings['total'] = time.perf_counter() - start
+            self.pid = os.getpid()
+            self.logger.info('Started process %d in %.3fs', self.pid, self.timings['total'])
+
+    def stats(self) -> Dict[str, float]:
+        return dict(self.timings)
+
+
+def init_lifecycle(app) -> Lifecycle:
+    lifecycle = app.config['DC_LIFECYCLE'] = Lifecycle(app)
+    return lifecycle
+
+
+def on_start(app, name: str, step: Callable[[], None]) -> None:
+    """
+    Runs step in every process that serves app, before its first request.
+    """
+    app.config['DC_LIFECYCLE'].on_start(name, step)
+
+
+def run_in_background(app, name: str, steps: List[Tuple[str, Callable[[], None]]]) -> threading.Thread:
+    """
+    Runs steps one after another on a daemon thread inside an app context, logging how long each took, so slow
+    loads at startup don't hold up requests.
+    """
+    logger = app_logger.create_logger('startup', app.config['IS_DEV'])
+
+    def run():
+        with app.app_context():
+            for step_name, step in steps:
+                start = time.perf_counter()
+                try:
+                    step()
+                    logger.info('Loaded %s in %.2fs', step_name, time.perf_counter() - start)
+                except Exception as e:
+                    logger.error('Unable to load %s', step_name, exc_info=e)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,218 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 25, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+HISTOGRAMS = {
+    'http_request_seconds': ('Time from the start of a request until its response is returned', LATENCY_BUCKETS),
+    'auth_seconds': ('Time spent authenticating a request, by how it was authenticated', LATENCY_BUCKETS),
+    'json_serialize_seconds': ('Time spent building JSON responses', LATENCY_BUCKETS),
+    'sql_method_seconds': ('Time spent in a SQLUtil method, including row conversion', LATENCY_BUCKETS),
+    'sql_query_seconds': ('Time spent executing statements on the database cursor', LATENCY_BUCKETS),
+    'sql_convert_seconds': ('Time spent converting fetched rows to dicts', LATENCY_BUCKETS),
+    'sql_rows': ('Rows returned by a SQLUtil method', ROW_BUCKETS),
+    'db_pool_wait_seconds': ('Time a checkout waited for a pooled connection, including any connecting',
+                             LATENCY_BUCKETS),
+    'db_connect_seconds': ('Time spent opening database connections, by whether a request was waiting on it',
+                           LATENCY_BUCKETS)
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Fixed-bucket histograms keyed by name and labels. An observation is a bisect and three additions under one
+    lock, cheap enough to record on every query and request. Collectors registered with add_collector are read
+    at render time for gauges that other components already keep, such as cache statistics.
+    """
+
+    def __init__(self, histograms: Dict[str, Tuple[str, tuple]] = None):
+        self.histograms = dict(HISTOGRAMS if histograms is None else histograms)
+        self._values: Dict[Tuple[str, Labels], Histogram] = {}
+        self._collectors: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = Histogram(self.histograms[name][1])
+            histogram.observe(value)
+
+    def add_collector(self, name: str, help_text: str, collect: Callable[[], Dict[str, float]]) -> None:
+        self._collectors.append((name, help_text, collect))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> str:
+        """
+        Renders every histogram and collector in the Prometheus text exposition format.
+        """
+        with self._lock:
+            snapshot = [(name, labels, list(h.counts), h.sum, h.count) for (name, labels), h in self._values.items()]
+        lines = []
+        for name, (help_text, buckets) in self.histograms.items():
+            series = [entry for entry in snapshot if entry[0] == name]
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for _, labels, counts, total, count in sorted(series, key=lambda entry: entry[1]):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        for name, help_text, collect in self._collectors:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for key, value in collect().items():
+                lines.append(f'{name}{format_labels((("stat", key),))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+
+def current_method() -> Optional[str]:
+    return getattr(_local, 'method', None)
+
+
+def count_rows(result) -> Optional[int]:
+    """
+    Counts the rows in a SQLUtil result: a list of rows, a Table, a single row dict, or a dict of rows or row
+    lists keyed by JobID. Returns None for streamed results, whose rows aren't known yet.
+    """
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(getattr(result, 'rows', None), list):
+        return len(result.rows)
+    if isinstance(result, dict):
+        values = list(result.values())
+        if values and all(isinstance(value, list) for value in values):
+            return sum(map(len, values))
+        if values and all(isinstance(value, dict) for value in values):
+            return len(values)
+        return 1 if values else 0
+    return None
+
+
+def instrumented(f):
+    """
+    Records the duration and row count of a SQLUtil method, and names the statements it executes after it in
+    sql_query_seconds and the slow query log.
+    """
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        previous = getattr(_local, 'method', None)
+        _local.method = f.__name__
+        start = time.perf_counter()
+        try:
+            result = f(*args, **kwargs)
+        finally:
+            _local.method = previous
+        registry.observe('sql_method_seconds', time.perf_counter() - start, method=f.__name__)
+        rows = count_rows(result)
+        if rows is not None:
+            registry.observe('sql_rows', rows, method=f.__name__)
+        return result
+
+    return decorated
+
+
+def observe_since(name: str, start: float, **labels) -> None:
+    registry.observe(name, time.perf_counter() - start, **labels)
+
+
+def instrument_engine(engine, slow_query_seconds: float = None, logger=None) -> None:
+    """
+    Times every statement executed on engine's cursors, labelled by the SQLUtil method running it, and logs
+    statements taking at least slow_query_seconds with their parameters.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        method = current_method() or 'other'
+        registry.observe('sql_query_seconds', elapsed, method=method)
+        if slow_query_seconds is not None and elapsed >= slow_query_seconds and logger is not None:
+            logger.warning('Slow query %s took %.1f ms with parameters %s', method, elapsed * 1000, parameters)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        endpoint = request.endpoint if has_request_context() else None
+        observe_since('json_serialize_seconds', start, endpoint=endpoint or 'none')
+        return response
+
+
+def init_metrics(app) -> None:
+    """
+    Times every request and every jsonify response of app.
+    """
+    app.json_provider_class = TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            observe_since('http_request_seconds', start, endpoint=request.endpoint or 'none',
+                          method=request.method, status=response.status_code)
+        return response
@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from werkzeug.exceptions import BadRequest
+
+from util.sql_util import Table
+
+MAX_PAGE_SIZE = 500
+
+Cursor = Tuple[Optional[object], int]
+
+
+def parse_limit(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    if not value.isdigit() or not 0 < int(value) <= MAX_PAGE_SIZE:
+        raise BadRequest(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return int(value)
+
+
+def encode_cursor(sort_value, job_id: int) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([sort_value, job_id]).encode()).decode()
+
+
+def decode_cursor(value: Optional[str]) -> Optional[Cursor]:
+    if not value:
+        return None
+    try:
+        sort_value, job_id = json.loads(base64.urlsafe_b64decode(value.encode()))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        raise BadRequest('Invalid cursor')
+    if not isinstance(job_id, int):
+        raise BadRequest('Invalid cursor')
+    return sort_value, job_id
+
+
+def page(rows: List[dict], limit: int, sort_column: str) -> dict:
+    """
+    Trims rows fetched with limit + 1 to one page and derives the cursor of the next page, if there is one.
+    """
+    if len(rows) <= limit:
+        return {'items': rows, 'nextCursor': None}
+    rows = rows[:limit]
+    return {'items': rows, 'nextCursor': encode_cursor(rows[-1][sort_column], rows[-1]['JobID'])}
+
+
+def page_table(table: Table, limit: int, sort_column: str) -> Tuple[Table, Optional[str]]:
+    """
+    Like page, for a Table fetched with limit + 1 rows. Returns the page and the next page's cursor.
+    """
+    if len(table.rows) <= limit:
+        return table, None
+    rows = table.rows[:limit]
+    last = rows[-1]
+    return Table(table.columns, rows), encode_cursor(last[table.columns.index(sort_column)],
+                                                     last[table.columns.index('JobID')])
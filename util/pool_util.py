@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import Dict, Optional
+
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from util import app_logger, metrics_util
+from util.background_util import PeriodicTask
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT_SECONDS = 30.0
+DEFAULT_VALIDATE_SECONDS = 60.0
+
+
+def engine_options() -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the source database, from the DB_POOL_* environment variables.
+    """
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'max_overflow': int(environ.get('DB_POOL_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT_SECONDS', DEFAULT_POOL_TIMEOUT_SECONDS)),
+        'pool_pre_ping': 'DB_POOL_PRE_PING' in environ
+    }
+    if 'DB_POOL_RECYCLE_SECONDS' in environ:
+        options['pool_recycle'] = float(environ['DB_POOL_RECYCLE_SECONDS'])
+    return options
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waited for a connection, including any time spent connecting.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics_util.observe_since('db_pool_wait_seconds', start)
+
+
+class PoolManager:
+    """
+    Keeps the source engine's connection pool ready for requests. warm fills the pool with pool_size connections
+    at startup, and validate, run periodically, takes each idle connection out in turn, pings it and returns it,
+    so that dead or recycled connections are replaced here rather than on a request.
+    """
+
+    def __init__(self, app, engine):
+        self.engine = engine
+        self.logger = app_logger.create_logger('db_pool', app.config['IS_DEV'])
+        self.invalidated = 0
+        self.last_warm_seconds = 0.0
+        event.listen(engine, 'do_connect', self._before_connect)
+        event.listen(engine, 'connect', self._after_connect)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def warm(self, count: Optional[int] = None) -> int:
+        """
+        Opens connections in parallel until count, by default pool_size, are idle in the pool. Returns the number
+        opened.
+        """
+        pool = self.engine.pool
+        missing = (pool.size() if count is None else count) - pool.checkedin()
+        if missing <= 0:
+            return 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(missing, thread_name_prefix='db_pool') as executor:
+            connections = list(executor.map(lambda _: self.engine.raw_connection(), range(missing)))
+        for connection in connections:
+            connection.close()
+        self.last_warm_seconds = time.perf_counter() - start
+        return missing
+
+    def validate(self) -> int:
+        """
+        Pings every idle connection once, replacing those that fail, and tops the pool back up. Checking a
+        connection out also reconnects it once it is older than pool_recycle. Returns the number replaced.
+        """
+        replaced = 0
+        for _ in range(self.engine.pool.checkedin()):
+            connection = self.engine.raw_connection()
+            try:
+                self.engine.dialect.do_ping(connection.dbapi_connection)
+            except Exception as e:
+                self.logger.warning('Replacing a pooled connection that failed its ping', exc_info=e)
+                connection.invalidate(e)
+                replaced += 1
+            else:
+                connection.close()
+        if replaced:
+            # The pool reconnects an invalidated connection the next time it is checked out, so cycle through the
+            # idle connections again to do that here.
+            for _ in range(self.engine.pool.checkedin()):
+                self.engine.raw_connection().close()
+        self.warm()
+        return replaced
+
+    def start(self, app, db, interval: float) -> PeriodicTask:
+        return PeriodicTask(app, db, 'db_pool', interval, self._scheduled_validate).start()
+
+    def stats(self) -> Dict[str, float]:
+        pool = self.engine.pool
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'invalidated': self.invalidated,
+            'last_warm_seconds': self.last_warm_seconds
+        }
+
+    def _scheduled_validate(self) -> None:
+        replaced = self.validate()
+        if replaced:
+            self.logger.info('Replaced %d pooled connections', replaced)
+
+    @staticmethod
+    def _before_connect(dialect, connection_record, cargs, cparams):
+        connection_record.info['connect_start'] = time.perf_counter()
+
+    @staticmethod
+    def _after_connect(dbapi_connection, connection_record):
+        start = connection_record.info.pop('connect_start', None)
+        if start is not None:
+            metrics_util.observe_since('db_connect_seconds', start,
+                                       context='request' if has_request_context() else 'background')
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidated += 1
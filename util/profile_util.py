@@ -0,0 +1,171 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from os import environ
+from typing import Dict, Optional
+
+from flask import g, request, session
+
+from util import app_logger, auth_util
+
+PROFILE_HEADER = 'X-Profile'
+DEFAULT_MAX_FILES = 200
+DEFAULT_INTERVAL_MS = 1.0
+UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+_local = threading.local()
+
+
+class RequestProfile:
+    """
+    Samples the stacks of the request thread, and of the executor threads while they run calls submitted from it,
+    every interval seconds on a thread of its own, counting each distinct stack as a line of collapsed-stack
+    ("root;caller;callee count") output, the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.threads: Dict[int, str] = {threading.get_ident(): 'request'}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self) -> 'RequestProfile':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self._stop.set()
+        self._thread.join()
+
+    def attach(self, role: str) -> None:
+        """
+        Samples the calling thread, e.g. an executor thread running a call for this request, until detach.
+        """
+        self.threads[threading.get_ident()] = role
+
+    def detach(self) -> None:
+        self.threads.pop(threading.get_ident(), None)
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, role in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is not None and ident != own:
+                    self.stacks[RequestProfile.collapse(role, frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def collapse(role: str, frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{frame.f_globals.get("__name__", "?")}:{code.co_qualname}')
+            frame = frame.f_back
+        names.append(role)
+        return ';'.join(reversed(names))
+
+
+class Profiler:
+    """
+    Profiles single requests on demand: those sent with an X-Profile header by a session that already holds an
+    active admin identity, and sample_rate of all other requests. A profile covers the request from before
+    requires_auth runs until its context is torn down, after any streamed body has been sent, and is written to
+    directory as a .folded file named after the request. Only the newest max_files files are kept, so the
+    directory is a ring buffer shared by every worker process. The file's name is returned in the X-Profile
+    response header.
+    """
+
+    def __init__(self, app, directory: str, sample_rate: float = 0.0, max_files: int = DEFAULT_MAX_FILES,
+                 interval: float = DEFAULT_INTERVAL_MS / 1000):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.interval = interval
+        self.logger = app_logger.create_logger('profile', app.config['IS_DEV'])
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+        app.before_request(self._start)
+        app.after_request(self._name)
+        app.teardown_request(self._finish)
+
+    def _start(self) -> None:
+        if PROFILE_HEADER in request.headers:
+            identity = session.get('identity', {})
+            requested = auth_util.is_active_session(identity) and auth_util.is_admin(identity)
+        else:
+            requested = False
+        if requested or (self.sample_rate and random.random() < self.sample_rate):
+            g.profile = _local.profile = RequestProfile(self.interval).start()
+
+    def _name(self, response):
+        profile: Optional[RequestProfile] = g.get('profile')
+        if profile is not None:
+            self._sequence += 1
+            path = UNSAFE_FILENAME_CHARS.sub('_', request.path.strip('/'))[:80]
+            g.profile_file = f'{time.time_ns()}-{os.getpid()}-{self._sequence}-{request.method}-{path}-' \
+                             f'{response.status_code}.folded'
+            response.headers[PROFILE_HEADER] = g.profile_file
+        return response
+
+    def _finish(self, exception=None) -> None:
+        profile: Optional[RequestProfile] = g.pop('profile', None)
+        if profile is None:
+            return
+        _local.profile = None
+        profile.stop()
+        filename = g.pop('profile_file', None) or f'{time.time_ns()}-{os.getpid()}-error.folded'
+        try:
+            tmp_path = os.path.join(self.directory, f'.{filename}.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(profile.collapsed())
+            os.replace(tmp_path, os.path.join(self.directory, filename))
+            self._prune()
+        except OSError as e:
+            self.logger.error('Unable to write profile %s', filename, exc_info=e)
+            return
+        self.logger.info('Profiled %s %s in %.1fms: %d samples written to %s', request.method, request.path,
+                         profile.elapsed * 1000, profile.samples, filename)
+
+    def _prune(self) -> None:
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+        for name in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def current() -> Optional[RequestProfile]:
+    """
+    The profile of the request the calling thread is serving, if it is being profiled.
+    """
+    return getattr(_local, 'profile', None)
+
+
+def init_profiling(app) -> Optional[Profiler]:
+    """
+    Enables request profiling when PROFILE_DIR is set. Without it no hook is registered, so requests pay nothing.
+    """
+    if 'PROFILE_DIR' not in environ:
+        return None
+    return Profiler(
+        app,
+        environ['PROFILE_DIR'],
+        float(environ.get('PROFILE_SAMPLE_RATE', 0)),
+        int(environ.get('PROFILE_MAX_FILES', DEFAULT_MAX_FILES)),
+        float(environ.get('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL_MS)) / 1000
+    )
@@ -0,0 +1,420 @@
+import threading
+import time
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from util.background_util import PeriodicTask
+from util.sql_util import JOB_RESULT_COLUMNS, STATEMENT_CACHE_SIZE, JobScope, SQLUtil, render_statement
+from util.version_util import GLOBAL_WATERMARKS
+
+DEFAULT_FULL_REFRESH_SECONDS = 60 * 60
+LOAD_CHUNK_ROWS = 10000
+# Upper bounds, in days since the date, of every aging bucket but the last; undated amounts get a bucket of their own.
+AGING_BOUNDS = [31, 61, 91]
+AGING_BUCKETS = ['0-30', '31-60', '61-90', '91+', 'undated']
+NO_JOB_TYPE = -1
+
+
+class JobColumns(NamedTuple):
+    """
+    One entry per job, sorted by JobID. Dates are days, NaT when NULL, and amounts are cents; TotalInvoiced is
+    summed from the invoices.
+    """
+    job_id: np.ndarray
+    job_type: np.ndarray
+    contract_date: np.ndarray
+    close_date: np.ndarray
+    total_amount: np.ndarray
+    total_payments: np.ndarray
+    total_invoiced: np.ndarray
+
+
+class InvoiceColumns(NamedTuple):
+    """
+    One entry per invoice, sorted by job, InvoiceDate and InvoiceNumber. job_row is the job's index in
+    JobColumns and open_amount the part of the amount its job's payments have not covered, paying the oldest
+    invoices first.
+    """
+    invoice_number: np.ndarray
+    job_id: np.ndarray
+    invoice_date: np.ndarray
+    amount: np.ndarray
+    job_row: np.ndarray
+    open_amount: np.ndarray
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def job_totals_statement(scope: JobScope, dialect: str) -> TextClause:
+    """
+    JobID, JobType, ContractDate, CloseDate, TotalAmount and TotalPayments of the jobs in scope.
+    """
+    body = f'''
+            Tbl_Workorders.[JobID],
+            Tbl_Workorders.[JobType],
+            Tbl_Workorders.[ContractDate],
+            Tbl_Workorders.[CloseDate],
+            JobContracts.[TotalAmount],
+            Payments.[TotalPayments]
+        FROM (Tbl_Workorders
+        LEFT JOIN (
+            {SQLUtil.build_aggregate_query('Tbl_JobContracts', 'JobContractAmount', 'TotalAmount', scope)}
+        ) JobContracts ON Tbl_Workorders.[JobID] = JobContracts.[JobID])
+        LEFT JOIN (
+            {SQLUtil.build_aggregate_query('Tbl_Payments', 'PaymentAmount', 'TotalPayments', scope)}
+        ) Payments ON Tbl_Workorders.[JobID] = Payments.[JobID]
+    '''
+    return render_statement(body, scope.predicates(JOB_RESULT_COLUMNS), (), None, dialect)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def invoice_statement(scope: JobScope, dialect: str) -> TextClause:
+    """
+    InvoiceNumber, JobID, InvoiceDate and the summed detail amount of every invoice of the jobs in scope.
+    """
+    source, predicates = SQLUtil.build_invoice_source(scope)
+    return text(f'''
+        SELECT Tbl_Invoice.[InvoiceNumber],
+               Tbl_Invoice.[JobID],
+               Tbl_Invoice.[InvoiceDate],
+               SUM(Tbl_InvoiceDetail.[JobContractAmount]) AS InvoiceAmount
+        FROM {source}
+        WHERE {' AND '.join(predicates)}
+        GROUP BY Tbl_Invoice.[InvoiceNumber], Tbl_Invoice.[JobID], Tbl_Invoice.[InvoiceDate]
+    ''')
+
+
+def ids(values: Sequence) -> np.ndarray:
+    return np.array(values, dtype=np.int64)
+
+
+def codes(values: Sequence) -> np.ndarray:
+    return np.nan_to_num(np.array(values, dtype=np.float64), nan=NO_JOB_TYPE).astype(np.int32)
+
+
+def days(values: Sequence) -> np.ndarray:
+    return np.array(values, dtype='datetime64[s]').astype('datetime64[D]')
+
+
+def cents(values: Sequence) -> np.ndarray:
+    return np.rint(np.nan_to_num(np.array(values, dtype=np.float64)) * 100).astype(np.int64)
+
+
+def dollars(value) -> float:
+    return round(float(value) / 100, 2)
+
+
+JOB_CONVERTERS = [ids, codes, days, days, cents, cents]
+INVOICE_CONVERTERS = [ids, ids, days, cents]
+
+Columns = List[np.ndarray]
+
+
+class Receivables:
+    """
+    Per-job contract, payment and invoice totals held as NumPy columns, JobColumns and InvoiceColumns, about 90
+    bytes per job with one invoice, from which report() computes outstanding balances, aging buckets and per job
+    type rollups with whole-column operations instead of comparing TotalAmount and TotalPayments job by job.
+
+    refresh() reloads incrementally, as Snapshot does: jobs newer than the newest loaded JobID and every job that
+    is open in either the loaded columns or the database, with their invoices, and nothing at all while the
+    DataVersion watermarks of the tables are unchanged. Payments and invoices added to closed jobs, and edits the
+    watermarks miss, are picked up by full_refresh(), which reloads every job and runs every full_refresh_interval
+    seconds once started. Each refresh builds new columns and swaps them in at once, so a report never sees a
+    partial reload. Reads go to the snapshot while it is fresh.
+    """
+
+    def __init__(self, sql_util: SQLUtil, full_refresh_interval: float = DEFAULT_FULL_REFRESH_SECONDS):
+        self.sql_util = sql_util
+        self.full_refresh_interval = full_refresh_interval
+        self._columns: Tuple[JobColumns, InvoiceColumns, Dict[int, str]] = (
+            JobColumns(*(convert(()) for convert in JOB_CONVERTERS), cents(())),
+            InvoiceColumns(*(convert(()) for convert in INVOICE_CONVERTERS), ids(()), cents(())),
+            {}
+        )
+        self._lock = threading.Lock()
+        self.refreshed_at: Optional[float] = None
+        self.full_refreshed_at: Optional[float] = None
+        self.last_refresh_seconds = 0.0
+        self.last_full_refresh_seconds = 0.0
+        self.watermarks: Optional[list] = None
+        self.refreshes = 0
+        self.full_refreshes = 0
+        self.unchanged_refreshes = 0
+        self.jobs_reloaded = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.refreshed_at is not None
+
+    def stats(self) -> Dict[str, float]:
+        jobs, invoices, _ = self._columns
+        age = time.monotonic() - self.refreshed_at if self.refreshed_at is not None else -1
+        return {
+            'ready': int(self.ready),
+            'jobs': len(jobs.job_id),
+            'invoices': len(invoices.invoice_number),
+            'bytes': sum(column.nbytes for column in (*jobs, *invoices)),
+            'age_seconds': age,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_full_refresh_seconds': self.last_full_refresh_seconds,
+            'refreshes': self.refreshes,
+            'full_refreshes': self.full_refreshes,
+            'unchanged_refreshes': self.unchanged_refreshes,
+            'jobs_reloaded': self.jobs_reloaded
+        }
+
+    def full_refresh(self) -> int:
+        """
+        Reloads every job. Returns the number of jobs and invoices that were added, changed or removed.
+        """
+        with self._lock:
+            start = time.monotonic()
+            db = self.sql_util.db
+            watermarks = Receivables._watermarks(db)
+            job_types = Receivables._load_job_types(db)
+            fetched_jobs, fetched_invoices = Receivables._load(db, JobScope(), {})
+            old_jobs, old_invoices, old_job_types = self._columns
+            changed = Receivables._changed(list(old_jobs[:len(JOB_CONVERTERS)]), fetched_jobs) \
+                + Receivables._changed(list(old_invoices[:len(INVOICE_CONVERTERS)]), fetched_invoices) \
+                + int(job_types != old_job_types)
+            self._publish(fetched_jobs, fetched_invoices, job_types)
+            self.watermarks = watermarks
+            self.last_full_refresh_seconds = time.monotonic() - start
+            self.refreshed_at = self.full_refreshed_at = start
+            self.full_refreshes += 1
+            self.jobs_reloaded += len(fetched_jobs[0])
+            return changed
+
+    def refresh(self) -> int:
+        """
+        Reloads new and open jobs and the jobs closed since the last refresh, unless the watermarks are unchanged.
+        Falls back to a full refresh when nothing has been loaded yet. Returns the number of jobs and invoices
+        that were added, changed or removed.
+        """
+        if self.refreshed_at is None:
+            return self.full_refresh()
+        with self._lock:
+            start = time.monotonic()
+            db = self.sql_util.db
+            watermarks = Receivables._watermarks(db)
+            if watermarks == self.watermarks:
+                self.last_refresh_seconds = time.monotonic() - start
+                self.refreshed_at = start
+                self.unchanged_refreshes += 1
+                return 0
+            old_jobs, old_invoices, old_job_types = self._columns
+            open_before = old_jobs.job_id[np.isnat(old_jobs.close_date)]
+            max_job = int(old_jobs.job_id[-1]) if len(old_jobs.job_id) else 0
+
+            loads = [
+                Receivables._load(db, JobScope(open_jobs=True), {}),
+                Receivables._load(db, JobScope(closed_jobs=True, after_job=True), {'after_job': max_job})
+            ]
+            closed = np.setdiff1d(open_before, loads[0][0][0], assume_unique=True)
+            for batch in SQLUtil.batches(closed.tolist()):
+                _, params = SQLUtil.bind_list('job_id', batch)
+                loads.append(Receivables._load(db, JobScope(job_ids=len(batch)), params))
+            fetched_jobs = Receivables._unique([Receivables._concatenate(columns) for columns in
+                                                zip(*(jobs for jobs, _ in loads))])
+            fetched_invoices = Receivables._unique([Receivables._concatenate(columns) for columns in
+                                                    zip(*(invoices for _, invoices in loads))])
+            job_types = Receivables._load_job_types(db)
+
+            reloaded = np.union1d(open_before, fetched_jobs[0])
+            kept_jobs = ~np.isin(old_jobs.job_id, reloaded)
+            kept_invoices = ~np.isin(old_invoices.job_id, reloaded) \
+                & ~np.isin(old_invoices.invoice_number, fetched_invoices[0])
+            changed = Receivables._changed([column[~kept_jobs] for column in old_jobs[:len(JOB_CONVERTERS)]],
+                                           fetched_jobs) \
+                + Receivables._changed([column[~kept_invoices] for column in old_invoices[:len(INVOICE_CONVERTERS)]],
+                                       fetched_invoices) \
+                + int(job_types != old_job_types)
+            self._publish(
+                [np.concatenate([old[kept_jobs], new]) for old, new in zip(old_jobs, fetched_jobs)],
+                [np.concatenate([old[kept_invoices], new]) for old, new in zip(old_invoices, fetched_invoices)],
+                job_types
+            )
+            self.watermarks = watermarks
+            self.last_refresh_seconds = time.monotonic() - start
+            self.refreshed_at = start
+            self.refreshes += 1
+            self.jobs_reloaded += len(fetched_jobs[0])
+            return changed
+
+    def report(self, as_of: date = None, contract_from: datetime = None, contract_to: datetime = None,
+               job_type: str = None, status: str = None) -> dict:
+        """
+        Summarizes the jobs contracted on or after contract_from and before contract_to, of the job type with this
+        description, and 'open' or 'closed', as of the day as_of, today by default: their totals, how much is
+        outstanding, meaning TotalAmount less TotalPayments where that is positive, aged by ContractDate, the
+        open amounts of their invoices aged by InvoiceDate, and the same totals per job type.
+        """
+        jobs, invoices, job_types = self._columns
+        today = np.datetime64(as_of or date.today(), 'D')
+        selected = np.ones(len(jobs.job_id), dtype=bool)
+        if status is not None:
+            selected &= np.isnat(jobs.close_date) == (status == 'open')
+        if contract_from is not None:
+            selected &= jobs.contract_date >= np.datetime64(contract_from, 's').astype('datetime64[D]')
+        if contract_to is not None:
+            selected &= jobs.contract_date < np.datetime64(contract_to, 's').astype('datetime64[D]')
+        if job_type is not None:
+            selected &= np.isin(jobs.job_type, [code for code, name in job_types.items() if name == job_type])
+
+        balance = jobs.total_amount - jobs.total_payments
+        outstanding = np.where(selected & (balance > 0), balance, 0)
+        owing = outstanding > 0
+        open_invoices = selected[invoices.job_row] & (invoices.open_amount > 0)
+
+        type_codes, type_index = np.unique(jobs.job_type[selected], return_inverse=True)
+
+        def per_type(weights: np.ndarray = None) -> np.ndarray:
+            return np.bincount(type_index, weights, minlength=len(type_codes))
+
+        totals = {name: per_type(column[selected]) for name, column in (
+            ('TotalAmount', jobs.total_amount),
+            ('TotalPayments', jobs.total_payments),
+            ('TotalInvoiced', jobs.total_invoiced),
+            ('outstanding', outstanding),
+            ('openJobs', np.isnat(jobs.close_date)),
+            ('jobsOutstanding', owing)
+        )}
+        totals['jobs'] = per_type()
+        return {
+            'asOf': str(today),
+            'ageSeconds': round(time.monotonic() - self.refreshed_at, 1) if self.refreshed_at is not None else None,
+            'totals': Receivables._totals({name: column.sum() for name, column in totals.items()}),
+            'agingByContractDate': Receivables._aging(today, jobs.contract_date[owing], outstanding[owing], 'jobs'),
+            'agingByInvoiceDate': Receivables._aging(today, invoices.invoice_date[open_invoices],
+                                                     invoices.open_amount[open_invoices], 'invoices'),
+            'jobTypes': [
+                {'JobTypeDescription': job_types.get(int(code)),
+                 **Receivables._totals({name: column[i] for name, column in totals.items()})}
+                for i, code in enumerate(type_codes)
+            ]
+        }
+
+    def start(self, app, interval: float) -> PeriodicTask:
+        return PeriodicTask(app, self.sql_util.get_db(), 'receivables', interval, self._scheduled_refresh).start()
+
+    def _scheduled_refresh(self) -> int:
+        try:
+            if self.full_refreshed_at is None \
+                    or time.monotonic() - self.full_refreshed_at >= self.full_refresh_interval:
+                return self.full_refresh()
+            return self.refresh()
+        finally:
+            self.sql_util.remove_sessions()
+
+    def _publish(self, jobs: Columns, invoices: Columns, job_types: Dict[int, str]) -> None:
+        """
+        Sorts and indexes the loaded columns, drops invoices of jobs that no longer exist and swaps the result in.
+        """
+        jobs = Receivables._unique(jobs)
+        invoices = Receivables._unique(invoices)
+        job_id, invoice_job_id = jobs[0], invoices[1]
+        job_row = np.minimum(np.searchsorted(job_id, invoice_job_id), max(len(job_id) - 1, 0))
+        found = job_id[job_row] == invoice_job_id if len(job_id) else np.zeros(len(invoice_job_id), dtype=bool)
+        invoices = [column[found] for column in invoices]
+        job_row = job_row[found]
+        order = np.lexsort((invoices[0], invoices[2], job_row))
+        invoices = [column[order] for column in invoices]
+        job_row = job_row[order]
+
+        amount = invoices[3]
+        total_invoiced = np.rint(np.bincount(job_row, amount, minlength=len(job_id))).astype(np.int64)
+        open_amount = Receivables._open_amounts(job_row, amount, jobs[5])
+        self._columns = (JobColumns(*jobs, total_invoiced), InvoiceColumns(*invoices, job_row, open_amount),
+                         job_types)
+
+    @staticmethod
+    def _open_amounts(job_row: np.ndarray, amount: np.ndarray, total_payments: np.ndarray) -> np.ndarray:
+        """
+        Applies each job's payments to its invoices, grouped by job and oldest first, returning what is left of
+        each invoice's amount.
+        """
+        if not len(job_row):
+            return amount.copy()
+        billed = np.cumsum(amount)
+        starts = np.flatnonzero(np.concatenate(([True], job_row[1:] != job_row[:-1])))
+        lengths = np.diff(np.append(starts, len(job_row)))
+        billed -= np.repeat(billed[starts] - amount[starts], lengths)
+        return np.minimum(np.maximum(billed - total_payments[job_row], 0), np.maximum(amount, 0))
+
+    @staticmethod
+    def _aging(today: np.datetime64, dates: np.ndarray, amounts: np.ndarray, counted: str) -> List[dict]:
+        buckets = np.digitize((today - dates).astype(np.int64), AGING_BOUNDS)
+        buckets[np.isnat(dates)] = len(AGING_BUCKETS) - 1
+        counts = np.bincount(buckets, minlength=len(AGING_BUCKETS))
+        sums = np.bincount(buckets, amounts, minlength=len(AGING_BUCKETS))
+        return [{'bucket': bucket, counted: int(count), 'balance': dollars(total)}
+                for bucket, count, total in zip(AGING_BUCKETS, counts, sums)]
+
+    @staticmethod
+    def _totals(sums: Dict[str, np.ndarray]) -> dict:
+        return {name: int(value) if name in ('jobs', 'openJobs', 'jobsOutstanding') else dollars(value)
+                for name, value in sums.items()}
+
+    @staticmethod
+    def _load(db, scope: JobScope, params: dict) -> Tuple[Columns, Columns]:
+        dialect = db.engine.dialect.name
+        jobs = Receivables._fetch(db.session.execute(job_totals_statement(scope, dialect), params), JOB_CONVERTERS)
+        invoices = Receivables._fetch(db.session.execute(invoice_statement(scope, dialect), params),
+                                      INVOICE_CONVERTERS)
+        return jobs, invoices
+
+    @staticmethod
+    def _watermarks(db) -> list:
+        return [tuple(db.session.execute(query).fetchone()) for query in GLOBAL_WATERMARKS]
+
+    @staticmethod
+    def _load_job_types(db) -> Dict[int, str]:
+        return {job_type: description for job_type, description in
+                db.session.execute('SELECT JobType, JobTypeDescription FROM Tbl_Job_Types')}
+
+    @staticmethod
+    def _fetch(result, converters: List[Callable[[Sequence], np.ndarray]]) -> Columns:
+        """
+        Converts a result into one array per column, LOAD_CHUNK_ROWS rows at a time, so only a chunk of rows is
+        held in memory besides the arrays.
+        """
+        chunks = [[] for _ in converters]
+        rows = result.fetchmany(LOAD_CHUNK_ROWS)
+        while rows:
+            for chunk, convert, values in zip(chunks, converters, zip(*rows)):
+                chunk.append(convert(values))
+            rows = result.fetchmany(LOAD_CHUNK_ROWS)
+        return [Receivables._concatenate(chunk) if chunk else convert(()) for chunk, convert in zip(chunks, converters)]
+
+    @staticmethod
+    def _concatenate(arrays: Sequence[np.ndarray]) -> np.ndarray:
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    @staticmethod
+    def _unique(columns: Columns) -> Columns:
+        """
+        Sorts columns by the first, keeping the last row of each key.
+        """
+        keys = columns[0]
+        _, last = np.unique(keys[::-1], return_index=True)
+        order = len(keys) - 1 - last
+        return [column[order] for column in columns]
+
+    @staticmethod
+    def _changed(old: Columns, new: Columns) -> int:
+        """
+        Counts the keys, in the first column, that only one side has or whose values differ. Each side has
+        unique keys.
+        """
+        _, old_index, new_index = np.intersect1d(old[0], new[0], assume_unique=True, return_indices=True)
+        differs = np.zeros(len(old_index), dtype=bool)
+        for old_column, new_column in zip(old[1:], new[1:]):
+            if old_column.dtype.kind == 'M':
+                old_column, new_column = old_column.view(np.int64), new_column.view(np.int64)
+            differs |= old_column[old_index] != new_column[new_index]
+        return len(old[0]) + len(new[0]) - 2 * len(old_index) + int(differs.sum())
@@ -0,0 +1,172 @@
+import heapq
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from util.background_util import PeriodicTask
+
+SEARCH_FIELDS = ['CustomerLastName', 'CompanyName', 'JobAddress']
+
+ANCHOR = '\x02\x02'
+
+RowKey = Tuple[int, Optional[int]]
+
+
+def trigrams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def like_to_regex(pattern: str):
+    """
+    Compiles a LIKE pattern, with % and _ wildcards, into an equivalent anchored regular expression.
+    """
+    parts = []
+    for char in pattern:
+        if char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+def like_trigrams(pattern: str) -> Set[str]:
+    """
+    Returns the trigrams every value matching the LIKE pattern must contain. The leading literal is padded with
+    the anchor so short prefixes such as 'ol%' still narrow the candidates.
+    """
+    segments = re.split('[%_]', pattern)
+    grams = set()
+    for i, segment in enumerate(segments):
+        if i == 0 and segment:
+            segment = ANCHOR + segment
+        grams.update(trigrams(segment))
+    return grams
+
+
+class _FieldIndex:
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = {}
+        self.rows: Dict[str, Set[RowKey]] = {}
+
+    def add(self, value: str, key: RowKey) -> None:
+        keys = self.rows.get(value)
+        if keys is None:
+            keys = self.rows[value] = set()
+            for gram in trigrams(ANCHOR + value):
+                self.postings.setdefault(gram, set()).add(value)
+        keys.add(key)
+
+    def remove(self, value: str, key: RowKey) -> None:
+        keys = self.rows.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.rows[value]
+            for gram in trigrams(ANCHOR + value):
+                values = self.postings.get(gram)
+                if values is not None:
+                    values.discard(value)
+                    if not values:
+                        del self.postings[gram]
+
+    def match(self, pattern: str) -> Set[RowKey]:
+        candidates: Iterable[str] = self.rows
+        posting_sets = [self.postings.get(gram, set()) for gram in like_trigrams(pattern)]
+        if posting_sets:
+            posting_sets.sort(key=len)
+            candidates = set(posting_sets[0]).intersection(*posting_sets[1:])
+
+        regex = like_to_regex(pattern)
+        matches = set()
+        for value in candidates:
+            if regex.fullmatch(value):
+                matches.update(self.rows[value])
+        return matches
+
+
+class SearchIndex:
+    """
+    In-memory trigram index over the lowercased CustomerLastName, CompanyName and JobAddress of every job
+    result row. Searches take the same LIKE pattern SQLUtil would send to Access and return the matching
+    (CustomerID, JobID) keys ranked by ContractDate descending, so only those rows need to be hydrated.
+    """
+
+    def __init__(self, sql_util):
+        self.sql_util = sql_util
+        self.db = sql_util.get_db()
+        self.fields = {field: _FieldIndex() for field in SEARCH_FIELDS}
+        self.rows: Dict[RowKey, tuple] = {}
+        self.ready = False
+        self._lock = threading.RLock()
+
+    def refresh(self) -> int:
+        """
+        Reloads the searchable columns and updates the postings of rows that were added, changed or removed.
+        Returns the number of rows updated.
+        """
+        live = {}
+        for row in self.db.session.execute('''
+            SELECT Tbl_Customers.[CustomerID],
+                   Tbl_Workorders.[JobID],
+                   Tbl_Workorders.[ContractDate],
+                   Tbl_Customers.[CustomerLastName],
+                   Tbl_Customers.[CompanyName],
+                   Tbl_Workorders.[JobAddress]
+            FROM Tbl_Customers
+            LEFT JOIN Tbl_Workorders
+                ON Tbl_Customers.[CustomerID] = Tbl_Workorders.[CustomerID]
+        '''):
+            live[(row[0], row[1])] = (row[2],) + tuple(value.lower() if value is not None else None for value in row[3:])
+
+        with self._lock:
+            stale = [key for key, row in self.rows.items() if live.get(key) != row]
+            fresh = [key for key, row in live.items() if self.rows.get(key) != row]
+            for key in stale:
+                self._remove(key)
+            for key in fresh:
+                self._add(key, live[key])
+            self.ready = True
+        return len(set(stale).union(fresh))
+
+    def search(self, field: str, pattern: str, limit: int = None, after: tuple = None) -> List[RowKey]:
+        """
+        Returns matching keys ranked by ContractDate, then JobID, descending. `after` is a
+        (ContractDate, JobID) keyset cursor; only keys ranked below it are returned.
+        """
+        with self._lock:
+            keys = self.fields[field].match(pattern)
+            if after is not None:
+                after_rank = (after[0] is not None, after[0] or 0, after[1])
+                keys = [key for key in keys if self._rank(key) < after_rank]
+            if limit is not None:
+                return heapq.nlargest(limit, keys, key=self._rank)
+            return sorted(keys, key=self._rank, reverse=True)
+
+    def start(self, app, interval: float) -> PeriodicTask:
+        return PeriodicTask(app, self.db, 'search_index', interval, self._scheduled_refresh).start()
+
+    def _scheduled_refresh(self) -> int:
+        changed = self.refresh()
+        if changed:
+            self.sql_util.data_changed()
+        return changed
+
+    def _rank(self, key: RowKey):
+        contract_date = self.rows[key][0]
+        return contract_date is not None, contract_date or 0, key[1] or 0
+
+    def _add(self, key: RowKey, row: tuple) -> None:
+        self.rows[key] = row
+        for field, value in zip(SEARCH_FIELDS, row[1:]):
+            if value is not None:
+                self.fields[field].add(value, key)
+
+    def _remove(self, key: RowKey) -> None:
+        row = self.rows.pop(key)
+        for field, value in zip(SEARCH_FIELDS, row[1:]):
+            if value is not None:
+                self.fields[field].remove(value, key)
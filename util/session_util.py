@@ -0,0 +1,218 @@
+import hashlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from os import environ
+
+from flask.sessions import SessionInterface, SessionMixin
+from flask_session.sessions import SqlAlchemySessionInterface
+from itsdangerous import BadSignature, Signer, want_bytes
+from werkzeug.datastructures import CallbackDict
+
+from util import lifecycle_util
+from util.background_util import PeriodicTask
+
+SESSION_TABLE = 'Tbl_web_sessions'
+DEFAULT_CLEANUP_SECONDS = 300
+
+
+class LocalSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid: str = None, new=False, digest: str = None, expiry: float = 0.0):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.digest = digest
+        self.expiry = expiry
+        self.permanent = True
+        self.modified = False
+
+
+class LocalSessionInterface(SessionInterface):
+    """
+    Keeps sessions in a local SQLite file in WAL mode, shared by every worker process on the host, with only a
+    signed session id in the cookie. A row is written only when the session's contents change or when less than
+    half of its lifetime is left, and expired rows are deleted in one statement at most every cleanup_interval
+    seconds, so a typical authenticated request costs a single primary key read.
+    """
+
+    def __init__(self, path: str, cleanup_interval: float = DEFAULT_CLEANUP_SECONDS):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        # Not one of the thread-local connections, which a process forked from this one must not share.
+        conn = LocalSessionInterface._connect(path)
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expiry REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS IX_sessions_expiry ON sessions (expiry)')
+        conn.close()
+
+    def open_session(self, app, request) -> LocalSession:
+        signed_sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if signed_sid:
+            try:
+                sid = self._signer(app).unsign(signed_sid).decode()
+                row = self._connection().execute(
+                    'SELECT data, expiry FROM sessions WHERE sid = ? AND expiry > ?', (sid, time.time())
+                ).fetchone()
+                if row is not None:
+                    data, expiry = row
+                    return LocalSession(json.loads(data), sid, digest=LocalSessionInterface._digest(data),
+                                        expiry=expiry)
+            except BadSignature:
+                pass
+        return LocalSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session: LocalSession, response) -> None:
+        self._maybe_cleanup()
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                with self._connection() as conn:
+                    conn.execute('DELETE FROM sessions WHERE sid = ?', (session.sid,))
+                response.delete_cookie(app.config['SESSION_COOKIE_NAME'], domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        data = json.dumps(dict(session), sort_keys=True, separators=(',', ':'))
+        extend = session.expiry - now < lifetime / 2
+        if LocalSessionInterface._digest(data) == session.digest and not extend:
+            return
+
+        expiry = now + lifetime if extend else session.expiry
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expiry) VALUES (?, ?, ?)',
+                         (session.sid, data, expiry))
+        if session.new or extend:
+            response.set_cookie(
+                app.config['SESSION_COOKIE_NAME'],
+                self._signer(app).sign(session.sid.encode()).decode(),
+                expires=datetime.utcfromtimestamp(expiry),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+    def _maybe_cleanup(self) -> None:
+        now = time.time()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        with self._connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE expiry <= ?', (now,))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = LocalSessionInterface._connect(self.path)
+        return conn
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @staticmethod
+    def _signer(app) -> Signer:
+        return Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
+
+    @staticmethod
+    def _digest(data: str) -> str:
+        return hashlib.sha1(data.encode()).hexdigest()
+
+
+class CheckedSqlAlchemySessionInterface(SqlAlchemySessionInterface):
+    """
+    Flask-Session's SQLAlchemy sessions, writing a row only when the session's contents change or when less than
+    half of its lifetime is left, as LocalSessionInterface does, instead of on every request. Expired rows are
+    left to expire_sqlalchemy_sessions.
+    """
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid and self.use_signer:
+            signer = self._get_signer(app)
+            if signer is None:
+                return None
+            try:
+                sid = signer.unsign(sid).decode()
+            except BadSignature:
+                sid = None
+        if sid:
+            saved = self.sql_session_model.query.filter_by(session_id=self.key_prefix + sid).first()
+            if saved is not None and saved.expiry > datetime.utcnow():
+                try:
+                    data = want_bytes(saved.data)
+                    session = self.session_class(self.serializer.loads(data), sid=sid)
+                    session.saved_data, session.saved_expiry = data, saved.expiry
+                    return session
+                except Exception:
+                    pass
+        return self.session_class(sid=sid or self._generate_sid(), permanent=self.permanent)
+
+    def save_session(self, app, session, response) -> None:
+        saved_data = getattr(session, 'saved_data', None)
+        if session and saved_data is not None and self.serializer.dumps(dict(session)) == saved_data:
+            if not session.permanent \
+                    or session.saved_expiry - datetime.utcnow() > app.permanent_session_lifetime / 2:
+                return
+        super().save_session(app, session, response)
+
+
+def expire_sqlalchemy_sessions(db) -> int:
+    """
+    Deletes every expired Flask-Session row from Tbl_web_sessions in one statement; Flask-Session itself only
+    removes an expired row when its cookie is presented again.
+    """
+    result = db.session.execute(f'DELETE FROM {SESSION_TABLE} WHERE expiry <= :now', {'now': datetime.utcnow()})
+    db.session.commit()
+    return result.rowcount
+
+
+def init_session(app) -> None:
+    """
+    Configures the session backend chosen by SESSION_BACKEND: 'sqlalchemy' (default) keeps the sessions on the
+    Access database with CheckedSqlAlchemySessionInterface and 'local' uses LocalSessionInterface at
+    SESSION_STORE_PATH. Either way only a session id is sent to the client, since the session holds the token's
+    claims.
+    """
+    backend = environ.get('SESSION_BACKEND', 'sqlalchemy')
+    app.config['SESSION_COOKIE_SECURE'] = True
+    if 'SESSION_LIFETIME_SECONDS' in environ:
+        app.permanent_session_lifetime = timedelta(seconds=int(environ['SESSION_LIFETIME_SECONDS']))
+    cleanup_interval = float(environ.get('SESSION_CLEANUP_SECONDS', DEFAULT_CLEANUP_SECONDS))
+    if backend == 'local':
+        app.session_interface = LocalSessionInterface(environ['SESSION_STORE_PATH'], cleanup_interval)
+    elif backend == 'sqlalchemy':
+        db = app.config['DC_DB'].get_db()
+        app.session_interface = CheckedSqlAlchemySessionInterface(
+            app,
+            db,
+            SESSION_TABLE,
+            app.config.get('SESSION_KEY_PREFIX', 'session:'),
+            app.config.get('SESSION_USE_SIGNER', False),
+            app.config.get('SESSION_PERMANENT', True)
+        )
+        cleanup = PeriodicTask(app, db, 'session_cleanup', cleanup_interval, lambda: expire_sqlalchemy_sessions(db))
+        lifecycle_util.on_start(app, 'session_cleanup', cleanup.start)
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend}')
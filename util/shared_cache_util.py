@@ -0,0 +1,251 @@
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from util import app_logger
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SYNC_SECONDS = 1.0
+COMPRESS_MIN_BYTES = 4096
+EVICT_BATCH = 16
+ALL = '*'
+
+
+class SharedResultStore:
+    """
+    The process-shared tier under ResultCache: SQLUtil results kept in a local SQLite file in WAL mode, shared by
+    every worker process on the host, so one worker's query warms all of them. Values are pickled, and
+    zlib-compressed above COMPRESS_MIN_BYTES; each row keeps its own expiry, and once the stored values, totalled
+    by triggers, outgrow max_bytes the rows closest to expiring are evicted, expired ones first. The file must
+    only be writable by the app's user, as values are unpickled from it.
+
+    Invalidations are recorded with the time they happened. A result whose load started before a matching
+    invalidation is never stored, and other processes drop matching entries from their in-process caches within
+    sync_interval seconds. Errors reading or writing the file are logged and treated as misses.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, horizon: float = 3600.0,
+                 sync_interval: float = DEFAULT_SYNC_SECONDS, is_dev=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_value_bytes = max_bytes // 4
+        self.horizon = horizon
+        self.sync_interval = sync_interval
+        self.logger = app_logger.create_logger('shared_cache', is_dev)
+        self._local = threading.local()
+        self._epochs: Dict[Tuple[str, str], float] = {}
+        self._synced = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.errors = 0
+        # Not one of the thread-local connections, which a process forked from this one must not share.
+        conn = SharedResultStore._connect(path)
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    loaded_at REAL NOT NULL,
+                    PRIMARY KEY (name, key)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS IX_results_expires ON results (expires)')
+            conn.execute('CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)')
+            conn.execute('INSERT OR IGNORE INTO usage (id, bytes) VALUES (0, 0)')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS TR_results_insert AFTER INSERT ON results
+                BEGIN UPDATE usage SET bytes = bytes + NEW.size; END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS TR_results_update AFTER UPDATE OF size ON results
+                BEGIN UPDATE usage SET bytes = bytes + NEW.size - OLD.size; END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS TR_results_delete AFTER DELETE ON results
+                BEGIN UPDATE usage SET bytes = bytes - OLD.size; END
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS invalidations (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    at REAL NOT NULL,
+                    PRIMARY KEY (name, key)
+                )
+            ''')
+        conn.close()
+
+    def get(self, name: str, args: tuple) -> Optional[Tuple[Any, float, float]]:
+        """
+        Returns the stored value for this call with its expiry and the time its load started, both as wall clock
+        times, or None.
+        """
+        try:
+            row = self._connection().execute(
+                'SELECT value, compressed, expires, loaded_at FROM results WHERE name = ? AND key = ? AND expires > ?',
+                (name, SharedResultStore.key(args), time.time())
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, compressed, expires, loaded_at = row
+            value = pickle.loads(zlib.decompress(value) if compressed else value)
+        except (sqlite3.Error, pickle.UnpicklingError, zlib.error, EOFError, AttributeError, ImportError) as e:
+            self.errors += 1
+            self.logger.error('Unable to read %s from the shared result cache', name, exc_info=e)
+            return None
+        self.hits += 1
+        return value, expires, loaded_at
+
+    def put(self, name: str, args: tuple, value: Any, ttl: float, loaded_at: float) -> bool:
+        """
+        Stores value unless it can't be pickled, is larger than a quarter of max_bytes, or a matching
+        invalidation happened after loaded_at. Returns whether it was stored.
+        """
+        now = time.time()
+        if now - loaded_at > self.horizon:
+            self.skipped += 1
+            return False
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self.skipped += 1
+            return False
+        compressed = len(data) >= COMPRESS_MIN_BYTES
+        if compressed:
+            data = zlib.compress(data, 1)
+        if len(data) > self.max_value_bytes:
+            self.skipped += 1
+            return False
+
+        key = SharedResultStore.key(args)
+        try:
+            with self._connection() as conn:
+                stored = conn.execute('''
+                    INSERT INTO results (name, key, value, compressed, size, expires, loaded_at)
+                    SELECT ?, ?, ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM invalidations
+                        WHERE at >= ? AND (name = ? OR name = ? AND key IN ('', ?))
+                    )
+                    ON CONFLICT (name, key) DO UPDATE SET value = excluded.value, compressed = excluded.compressed,
+                        size = excluded.size, expires = excluded.expires, loaded_at = excluded.loaded_at
+                ''', (name, key, data, compressed, len(data), now + ttl, loaded_at, loaded_at, ALL, name,
+                      key)).rowcount
+                evicted = self._evict(conn) if stored else 0
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.logger.error('Unable to write %s to the shared result cache', name, exc_info=e)
+            return False
+        if not stored:
+            self.skipped += 1
+            return False
+        self.puts += 1
+        self.evictions += evicted
+        return True
+
+    def invalidate(self, name: str = None, args: tuple = None) -> int:
+        """
+        Drops every stored result, every result for one SQLUtil method, or a single result, as
+        ResultCache.invalidate does, and records the invalidation for the other processes. Returns the number of
+        rows dropped.
+        """
+        now = time.time()
+        epoch = (name or ALL, SharedResultStore.key(args) if name and args else '')
+        try:
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO invalidations (name, key, at) VALUES (?, ?, ?)', (*epoch, now))
+                conn.execute('DELETE FROM invalidations WHERE at < ?', (now - self.horizon,))
+                if name is None:
+                    dropped = conn.execute('DELETE FROM results').rowcount
+                elif args:
+                    dropped = conn.execute('DELETE FROM results WHERE name = ? AND key = ?', (name, epoch[1])).rowcount
+                else:
+                    dropped = conn.execute('DELETE FROM results WHERE name = ?', (name,)).rowcount
+        except sqlite3.Error as e:
+            self.errors += 1
+            self.logger.error('Unable to invalidate the shared result cache', exc_info=e)
+            return 0
+        self._epochs = {**self._epochs, epoch: now}
+        return dropped
+
+    def invalidated_since(self, name: str, args: tuple, loaded_at: float) -> bool:
+        """
+        Whether any process invalidated this call's result after its load started, as of the last sync of the
+        recorded invalidations, which happens at most once per sync_interval.
+        """
+        epochs = self._sync()
+        if not epochs:
+            return False
+        at = max(epochs.get((ALL, ''), 0.0), epochs.get((name, ''), 0.0))
+        if at < loaded_at and args:
+            at = epochs.get((name, SharedResultStore.key(args)), 0.0)
+        return at >= loaded_at
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            conn = self._connection()
+            entries = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            size = conn.execute('SELECT bytes FROM usage').fetchone()[0]
+        except sqlite3.Error:
+            entries, size = 0, 0
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'puts': self.puts,
+            'skipped': self.skipped,
+            'evictions': self.evictions,
+            'errors': self.errors
+        }
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """
+        Deletes the rows closest to expiring, expired ones first, until the stored values fit in max_bytes.
+        """
+        evicted = 0
+        while conn.execute('SELECT bytes FROM usage').fetchone()[0] > self.max_bytes:
+            evicted += conn.execute(
+                'DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY expires LIMIT ?)',
+                (EVICT_BATCH,)
+            ).rowcount
+        return evicted
+
+    def _sync(self) -> Dict[Tuple[str, str], float]:
+        now = time.monotonic()
+        if now - self._synced >= self.sync_interval:
+            self._synced = now
+            try:
+                self._epochs = {(name, key): at for name, key, at in
+                                self._connection().execute('SELECT name, key, at FROM invalidations')}
+            except sqlite3.Error as e:
+                self.errors += 1
+                self.logger.error('Unable to read shared result cache invalidations', exc_info=e)
+        return self._epochs
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = SharedResultStore._connect(self.path)
+        return conn
+
+    @staticmethod
+    def key(args: tuple) -> str:
+        return repr(args)
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
@@ -0,0 +1,407 @@
+import atexit
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from util.background_util import PeriodicTask
+from util.sql_util import FETCH_CHUNK_SIZE, TABLE_WATERMARKS, SQLUtil
+
+JOB_TABLES = ['Tbl_InvoiceDetail', 'Tbl_Invoice', 'Tbl_JobContracts', 'Tbl_Payments', 'Tbl_Workorders']
+SNAPSHOT_TABLES = ['Tbl_Job_Types', 'Tbl_Customers'] + JOB_TABLES
+
+SNAPSHOT_INDEXES = {
+    'Tbl_Job_Types': ['JobType'],
+    'Tbl_Customers': ['CustomerID'],
+    'Tbl_Workorders': ['JobID', 'CustomerID', 'JobType', 'ContractDate', 'CreateDate', 'CloseDate'],
+    'Tbl_JobContracts': ['JobID'],
+    'Tbl_Payments': ['JobID'],
+    'Tbl_Invoice': ['JobID', 'InvoiceNumber'],
+    'Tbl_InvoiceDetail': ['InvoiceNumber']
+}
+
+DECIMAL_ALIASES = {'TotalAmount', 'TotalPayments', 'InvoiceAmount'}
+CURRENCY_PLACES = Decimal('0.0001')
+
+DEFAULT_FULL_REFRESH_SECONDS = 60 * 60
+
+TOP_PATTERN = re.compile(r'^(\s*SELECT\s+)TOP\s+(\d+)\s', re.IGNORECASE)
+
+DECLARED_TYPES = [
+    (bool, 'INTEGER'),
+    (int, 'INTEGER'),
+    (float, 'REAL'),
+    (Decimal, 'DECIMAL'),
+    (datetime, 'TIMESTAMP'),
+    (date, 'DATE'),
+    (bytes, 'BLOB'),
+    (str, 'TEXT')
+]
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+
+def register_access_dialect(engine) -> None:
+    """
+    Lets a SQLite engine run SQLUtil's Access SQL unchanged: adds LCASE and rewrites a leading SELECT TOP n
+    into a LIMIT.
+    """
+
+    def register_functions(dbapi_connection, _):
+        dbapi_connection.create_function('LCASE', 1, lambda value: value.lower() if value is not None else None)
+
+    def rewrite_top(conn, cursor, statement, parameters, context, executemany):
+        match = TOP_PATTERN.match(statement)
+        if match:
+            statement = f'{match.group(1)}{statement[match.end():].rstrip()} LIMIT {match.group(2)}'
+        return statement, parameters
+
+    event.listen(engine, 'connect', register_functions)
+    event.listen(engine, 'before_cursor_execute', rewrite_top, retval=True)
+
+
+def declared_type(values: Iterable) -> str:
+    for value in values:
+        if value is not None:
+            for python_type, sql_type in DECLARED_TYPES:
+                if isinstance(value, python_type):
+                    return sql_type
+    return ''
+
+
+class Snapshot:
+    """
+    A local SQLite copy of the Tbl_* tables SQLUtil reads, exposing the same engine/session interface as
+    flask_sqlalchemy.SQLAlchemy. SQLUtil sends reads here while the copy is at most max_staleness seconds old
+    and to the source database otherwise.
+
+    refresh() copies incrementally: jobs newer than the newest copied JobID, every job that is open (no
+    CloseDate) in either copy along with its contract lines, payments and invoices, new customers and the job
+    types, unless the TABLE_WATERMARKS of the source are unchanged. Edits to closed jobs and existing customers
+    are picked up by full_refresh(), which rebuilds every table and runs every full_refresh_interval seconds once
+    started. Each refresh is a single SQLite transaction, so readers never see a partial copy, and compares the
+    rows it replaced with the rows it copied, so cached results are only dropped when the copy changed.
+    """
+
+    def __init__(self, sql_util: SQLUtil, path: str, max_staleness: float,
+                 full_refresh_interval: float = DEFAULT_FULL_REFRESH_SECONDS):
+        self.sql_util = sql_util
+        self.source = sql_util.get_db()
+        self.path = path
+        self.max_staleness = max_staleness
+        self.full_refresh_interval = full_refresh_interval
+        self.engine = create_engine(
+            f'sqlite:///{path}',
+            poolclass=QueuePool,
+            native_datetime=True,
+            connect_args={'check_same_thread': False, 'detect_types': sqlite3.PARSE_DECLTYPES}
+        )
+        register_access_dialect(self.engine)
+        event.listen(self.engine, 'connect', self._configure_connection)
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+        self.job_summary = None
+        self.decimal_columns: Set[str] = set()
+        self._converters = (None, None)
+        self._lock = threading.Lock()
+        self.refreshed_at: Optional[float] = None
+        self.full_refreshed_at: Optional[float] = None
+        self.last_refresh_seconds = 0.0
+        self.last_full_refresh_seconds = 0.0
+        self.watermarks: Optional[list] = None
+        self.refreshes = 0
+        self.full_refreshes = 0
+        self.unchanged_refreshes = 0
+        self.rows_copied = 0
+
+    def is_fresh(self) -> bool:
+        refreshed_at = self.refreshed_at
+        return refreshed_at is not None and time.monotonic() - refreshed_at <= self.max_staleness
+
+    def age(self) -> Optional[float]:
+        return time.monotonic() - self.refreshed_at if self.refreshed_at is not None else None
+
+    def stats(self) -> Dict[str, float]:
+        age = self.age()
+        full_age = time.monotonic() - self.full_refreshed_at if self.full_refreshed_at is not None else None
+        return {
+            'fresh': int(self.is_fresh()),
+            'age_seconds': age if age is not None else -1,
+            'full_age_seconds': full_age if full_age is not None else -1,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_full_refresh_seconds': self.last_full_refresh_seconds,
+            'refreshes': self.refreshes,
+            'full_refreshes': self.full_refreshes,
+            'unchanged_refreshes': self.unchanged_refreshes,
+            'rows_copied': self.rows_copied
+        }
+
+    def full_refresh(self) -> List[str]:
+        """
+        Rebuilds every table from the source. Returns the tables whose rows changed.
+        """
+        with self._lock:
+            start = time.monotonic()
+            watermarks = Snapshot._watermarks(self.source)
+            copied = 0
+            changed: List[str] = []
+            decimal_columns = set()
+            with self.engine.begin() as conn:
+                existing = {row[0] for row in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )}
+                for table in SNAPSHOT_TABLES:
+                    if table in existing:
+                        Snapshot._save_rows(conn, table, '1 = 1', {})
+                        conn.exec_driver_sql(f'DROP TABLE {table}')
+                    copied += self._copy(conn, table, f'SELECT * FROM {table}', {}, decimal_columns, create=True)
+                    for column in SNAPSHOT_INDEXES.get(table, []):
+                        conn.exec_driver_sql(f'CREATE INDEX IX_{table}_{column} ON {table} ([{column}])')
+                    if table not in existing or Snapshot._rows_differ(conn, table, '1 = 1', {}):
+                        changed.append(table)
+            self.decimal_columns = decimal_columns | DECIMAL_ALIASES if decimal_columns else set()
+            self._refresh_job_summary(changed)
+            self.watermarks = watermarks
+            self.last_full_refresh_seconds = time.monotonic() - start
+            self.refreshed_at = self.full_refreshed_at = start
+            self.full_refreshes += 1
+            self.rows_copied += copied
+            return changed
+
+    def refresh(self) -> List[str]:
+        """
+        Copies new and open jobs, their child rows, new customers and the job types, unless the watermarks are
+        unchanged. Falls back to a full refresh when nothing has been copied yet. Returns the tables whose rows
+        changed.
+        """
+        if self.refreshed_at is None:
+            return self.full_refresh()
+        with self._lock:
+            start = time.monotonic()
+            watermarks = Snapshot._watermarks(self.source)
+            if watermarks == self.watermarks:
+                self._refresh_job_summary([])
+                self.last_refresh_seconds = time.monotonic() - start
+                self.refreshed_at = start
+                self.unchanged_refreshes += 1
+                return []
+            copied = 0
+            changed: List[str] = []
+            with self.engine.begin() as conn:
+                max_job = conn.exec_driver_sql('SELECT MAX(JobID) FROM Tbl_Workorders').scalar() or 0
+                max_customer = conn.exec_driver_sql('SELECT MAX(CustomerID) FROM Tbl_Customers').scalar() or 0
+                open_before = Snapshot._ids(conn.exec_driver_sql(
+                    'SELECT JobID FROM Tbl_Workorders WHERE CloseDate IS NULL'
+                ))
+                open_now = Snapshot._ids(self.source.session.execute(
+                    'SELECT JobID FROM Tbl_Workorders WHERE CloseDate IS NULL'
+                ))
+                closed = sorted(open_before - open_now)
+
+                conn.exec_driver_sql('CREATE TEMP TABLE IF NOT EXISTS snapshot_dirty (JobID INTEGER PRIMARY KEY)')
+                conn.exec_driver_sql('DELETE FROM snapshot_dirty')
+                conn.exec_driver_sql('INSERT INTO snapshot_dirty (JobID) VALUES (?)',
+                                     [(job_id,) for job_id in open_before | open_now])
+                dirty_jobs = 'JobID > :max_job OR JobID IN (SELECT JobID FROM snapshot_dirty)'
+                for table in JOB_TABLES:
+                    Snapshot._save_rows(conn, table, Snapshot._job_predicate(table, dirty_jobs), {'max_job': max_job})
+                for table in JOB_TABLES:
+                    conn.exec_driver_sql(f'DELETE FROM {table} WHERE {Snapshot._job_predicate(table, dirty_jobs)}',
+                                         {'max_job': max_job})
+
+                open_jobs = 'JobID <= :max_job ' \
+                            'AND JobID IN (SELECT JobID FROM Tbl_Workorders WHERE CloseDate IS NULL)'
+                for table in JOB_TABLES:
+                    copied += self._copy_where(conn, table, Snapshot._job_predicate(table, 'JobID > :max_job'),
+                                               {'max_job': max_job})
+                    copied += self._copy_where(conn, table, Snapshot._job_predicate(table, open_jobs),
+                                               {'max_job': max_job})
+                    for batch in SQLUtil.batches(closed):
+                        placeholders, params = SQLUtil.bind_list('job_id', batch)
+                        copied += self._copy_where(
+                            conn, table, Snapshot._job_predicate(table, f'JobID IN ({placeholders})'), params
+                        )
+
+                for table in JOB_TABLES:
+                    if Snapshot._rows_differ(conn, table, Snapshot._job_predicate(table, dirty_jobs),
+                                             {'max_job': max_job}):
+                        changed.append(table)
+
+                customers = self._copy_where(conn, 'Tbl_Customers', 'CustomerID > :max_customer',
+                                             {'max_customer': max_customer})
+                Snapshot._save_rows(conn, 'Tbl_Job_Types', '1 = 1', {})
+                conn.exec_driver_sql('DELETE FROM Tbl_Job_Types')
+                copied += customers + self._copy_where(conn, 'Tbl_Job_Types', '1 = 1', {})
+                if customers:
+                    changed.append('Tbl_Customers')
+                if Snapshot._rows_differ(conn, 'Tbl_Job_Types', '1 = 1', {}):
+                    changed.append('Tbl_Job_Types')
+            self._refresh_job_summary(changed)
+            self.watermarks = watermarks
+            self.last_refresh_seconds = time.monotonic() - start
+            self.refreshed_at = start
+            self.refreshes += 1
+            self.rows_copied += copied
+            return changed
+
+    def start(self, app, interval: float) -> PeriodicTask:
+        return PeriodicTask(app, self.source, 'snapshot', interval, self._scheduled_refresh).start()
+
+    def remove(self) -> None:
+        self.session.remove()
+
+    def _scheduled_refresh(self) -> int:
+        """
+        Returns the number of rows copied when the copy changed, for PeriodicTask to log, and 0 otherwise.
+        """
+        rows_copied = self.rows_copied
+        try:
+            if self.full_refreshed_at is None \
+                    or time.monotonic() - self.full_refreshed_at >= self.full_refresh_interval:
+                changed = self.full_refresh()
+            else:
+                changed = self.refresh()
+        finally:
+            self.session.remove()
+        if not changed:
+            return 0
+        self.sql_util.data_changed(changed)
+        return self.rows_copied - rows_copied
+
+    def has_job_summary(self) -> bool:
+        return self.job_summary is not None
+
+    def _refresh_job_summary(self, changed: List[str]) -> None:
+        """
+        Rebuilds Tbl_web_job_summary inside the snapshot from the copied tables when SQLUtil reads job results
+        from the summary, so the same queries work against either database: in full the first time SQLUtil reads
+        the summary, which may be after the snapshot was loaded, and by diff whenever copied tables changed.
+        """
+        if not self.sql_util.use_job_summary:
+            return
+        if self.job_summary is None:
+            from util.job_summary_util import JobSummary
+
+            job_summary = JobSummary(SQLUtil(self))
+            job_summary.ensure_table()
+            job_summary.refresh()
+            self.job_summary = job_summary
+        elif changed:
+            self.job_summary.refresh()
+
+    def _copy_where(self, conn, table: str, predicate: str, params: dict) -> int:
+        return self._copy(conn, table, f'SELECT * FROM {table} WHERE {predicate}', params, None, create=False)
+
+    def _copy(self, conn, table: str, query: str, params: dict, decimal_columns: Optional[Set[str]],
+              create: bool) -> int:
+        result = self.source.session.execute(query, params)
+        columns = list(result.keys())
+        rows = [tuple(row) for row in result.fetchmany(FETCH_CHUNK_SIZE)]
+        if create:
+            types = [declared_type(row[i] for row in rows) for i in range(len(columns))]
+            definitions = ', '.join(f'[{column}] {sql_type}'.strip() for column, sql_type in zip(columns, types))
+            conn.exec_driver_sql(f'CREATE TABLE {table} ({definitions})')
+            decimal_columns.update(column for column, sql_type in zip(columns, types) if sql_type == 'DECIMAL')
+        insert = f'INSERT INTO {table} ({", ".join(f"[{column}]" for column in columns)}) ' \
+                 f'VALUES ({", ".join("?" for _ in columns)})'
+        copied = 0
+        while rows:
+            conn.exec_driver_sql(insert, rows)
+            copied += len(rows)
+            rows = [tuple(row) for row in result.fetchmany(FETCH_CHUNK_SIZE)]
+        return copied
+
+    def _configure_connection(self, dbapi_connection, _) -> None:
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+        dbapi_connection.execute('PRAGMA synchronous=OFF')
+        dbapi_connection.row_factory = self._row_factory
+
+    def _row_factory(self, cursor, row: tuple) -> tuple:
+        """
+        Returns currency columns as 4 place Decimals, as the Access driver does, including SUMs, which SQLite
+        computes as floats. Does nothing unless the source returned Decimals.
+        """
+        if not self.decimal_columns:
+            return row
+        description, indexes = self._converters
+        if description is not cursor.description:
+            description = cursor.description
+            indexes = [i for i, column in enumerate(description) if column[0] in self.decimal_columns]
+            self._converters = (description, indexes)
+        if not indexes:
+            return row
+        values = list(row)
+        for i in indexes:
+            value = values[i]
+            if value is not None:
+                values[i] = Decimal(str(value)).quantize(CURRENCY_PLACES)
+        return tuple(values)
+
+    @staticmethod
+    def _job_predicate(table: str, predicate: str) -> str:
+        if table == 'Tbl_InvoiceDetail':
+            return f'InvoiceNumber IN (SELECT InvoiceNumber FROM Tbl_Invoice WHERE {predicate})'
+        return f'({predicate})'
+
+    @staticmethod
+    def _ids(result) -> Set[int]:
+        return {row[0] for row in result}
+
+    @staticmethod
+    def _watermarks(db) -> list:
+        return [tuple(db.session.execute(query).fetchone()) for query in TABLE_WATERMARKS.values()]
+
+    @staticmethod
+    def _save_rows(conn, table: str, predicate: str, params: dict) -> None:
+        """
+        Keeps the rows of table matching predicate in a temporary table, to compare with once they are replaced.
+        """
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS temp.snapshot_before_{table}')
+        conn.exec_driver_sql(f'CREATE TEMP TABLE snapshot_before_{table} AS SELECT * FROM {table} WHERE {predicate}',
+                             params)
+
+    @staticmethod
+    def _rows_differ(conn, table: str, predicate: str, params: dict) -> bool:
+        """
+        Whether the rows of table matching predicate differ from the ones _save_rows kept.
+        """
+        saved = f'temp.snapshot_before_{table}'
+        current = f'SELECT * FROM {table} WHERE {predicate}'
+        differ = conn.exec_driver_sql(f'''
+            SELECT (SELECT COUNT(*) FROM {saved}) <> (SELECT COUNT(*) FROM ({current}))
+            OR EXISTS (SELECT * FROM {saved} EXCEPT {current})
+            OR EXISTS ({current} EXCEPT SELECT * FROM {saved})
+        ''', params).scalar()
+        conn.exec_driver_sql(f'DROP TABLE {saved}')
+        return bool(differ)
+
+
+def default_path() -> str:
+    """
+    A snapshot file per process in SNAPSHOT_DIR, or the temp directory, removed at exit.
+    """
+    directory = os.environ.get('SNAPSHOT_DIR', tempfile.gettempdir())
+    path = os.path.join(directory, f'dc-estimates-snapshot-{os.getpid()}.db')
+    atexit.register(remove_files, [path, f'{path}-wal', f'{path}-shm'])
+    return path
+
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,12 +1,286 @@
+import heapq
+import time
+from datetime import datetime
+from functools import lru_cache
 from os import environ
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from util import app_logger, metrics_util
+from util.cache_util import DEFAULT_MAX_ENTRIES, ResultCache, cached, parse_ttls
+from util.metrics_util import instrumented
+
+JOB_SUMMARY_TABLE = 'Tbl_web_job_summary'
+IN_BATCH_SIZE = 100
+FETCH_CHUNK_SIZE = 500
+DASHBOARD_SIZE = 25
+
+JOB_RESULT_COLUMNS = {
+    'CustomerID': 'Tbl_Customers.[CustomerID]',
+    'JobID': 'Tbl_Workorders.[JobID]',
+    'Customer': 'Tbl_Customers.[Customer]',
+    'CustomerLastName': 'Tbl_Customers.[CustomerLastName]',
+    'CompanyName': 'Tbl_Customers.[CompanyName]',
+    'ContractDate': 'Tbl_Workorders.[ContractDate]',
+    'CreateDate': 'Tbl_Workorders.[CreateDate]',
+    'JobAddress': 'Tbl_Workorders.[JobAddress]',
+    'JobTypeDescription': 'Tbl_Job_Types.[JobTypeDescription]',
+    'TotalAmount': 'JobContracts.[TotalAmount]',
+    'TotalPayments': 'Payments.[TotalPayments]',
+    'CloseDate': 'Tbl_Workorders.[CloseDate]',
+    'JobCustomerID': 'Tbl_Workorders.[CustomerID]'
+}
+
+JOB_SUMMARY_COLUMNS = {name: f'{JOB_SUMMARY_TABLE}.[{name}]' for name in JOB_RESULT_COLUMNS}
+
+JOB_RESULT_NAMES = [
+    'CustomerID', 'JobID', 'Customer', 'CustomerLastName', 'CompanyName', 'ContractDate', 'CreateDate', 'JobAddress',
+    'JobTypeDescription', 'TotalAmount', 'TotalPayments'
+]
+
+EXPORT_NAMES = JOB_RESULT_NAMES + ['CloseDate', 'TotalInvoiced']
+
+
+class Table(NamedTuple):
+    """
+    Query results as column names and one tuple of values per row, in column order.
+    """
+    columns: List[str]
+    rows: Iterable[tuple]
+
+
+Rows = Union[List[dict], Table]
+
+CUSTOMER_JOB_IDS = 'SELECT JobID FROM Tbl_Workorders WHERE CustomerID = :customer_id'
+# Cheap per-table aggregates that change whenever rows are added or removed and on most edits.
+TABLE_WATERMARKS = {
+    'Tbl_Workorders': 'SELECT COUNT(*), MAX(JobID), MAX(CreateDate), MAX(ContractDate), COUNT(ContractDate), '
+                      'COUNT(CloseDate) FROM Tbl_Workorders',
+    'Tbl_Customers': 'SELECT COUNT(*), MAX(CustomerID) FROM Tbl_Customers',
+    'Tbl_JobContracts': 'SELECT COUNT(*), SUM(JobContractAmount) FROM Tbl_JobContracts',
+    'Tbl_Payments': 'SELECT COUNT(*), SUM(PaymentAmount), MAX(PaymentDate) FROM Tbl_Payments',
+    'Tbl_Invoice': 'SELECT COUNT(*), MAX(InvoiceNumber) FROM Tbl_Invoice'
+}
+WORK_ITEMS_BY_JOBS = '''
+    SELECT JobID,
+           WorkDescriptionType,
+           JobContractDescription,
+           JobContractAmount
+    FROM Tbl_JobContracts
+    WHERE JobID IN ({placeholders})
+'''
+PAYMENTS_BY_JOBS = '''
+    SELECT JobID,
+           PaymentDate,
+           PaymentAmount,
+           PaymentMethod
+    FROM Tbl_Payments
+    WHERE JobID IN ({placeholders})
+    ORDER BY JobID, PaymentDate ASC
+'''
+INVOICES_BY_JOBS = '''
+    SELECT Tbl_Invoice.JobID,
+           Tbl_Invoice.InvoiceDate,
+           SUM(Tbl_InvoiceDetail.JobContractAmount) AS InvoiceAmount
+    FROM Tbl_Invoice
+    INNER JOIN Tbl_InvoiceDetail
+        ON Tbl_Invoice.InvoiceNumber = Tbl_InvoiceDetail.InvoiceNumber
+    WHERE Tbl_Invoice.JobID IN ({placeholders})
+    GROUP BY Tbl_Invoice.JobID, Tbl_Invoice.InvoiceDate, Tbl_Invoice.InvoiceNumber
+    ORDER BY Tbl_Invoice.JobID, Tbl_Invoice.InvoiceDate
+'''
+
+STATEMENT_CACHE_SIZE = 512
+ACCESS_DIALECT = 'access'
+ANSI_FUNCTIONS = {'LCASE(': 'LOWER('}
+
+SCOPE_JOB_COLUMNS = {
+    'JobCustomerID': 'ScopeJobs.[CustomerID]',
+    'ContractDate': 'ScopeJobs.[ContractDate]',
+    'CloseDate': 'ScopeJobs.[CloseDate]'
+}
+
+
+class JobScope(NamedTuple):
+    """
+    The jobs a job result or job details statement covers: the first job_ids JobIDs bound as :job_id0, :job_id1,
+    ... (see SQLUtil.bind_list), the jobs of :customer_id, no job at all (customers without jobs), open or closed
+    jobs, jobs contracted on or after :contract_from and before :contract_to, and jobs with a JobID above
+    :after_job. Each restriction filters the outer query and is pushed down into the TotalAmount and TotalPayments
+    aggregates, so that they only sum the rows of the jobs in scope instead of all of Tbl_JobContracts and
+    Tbl_Payments.
+    """
+    job_ids: int = 0
+    customer: bool = False
+    no_job: bool = False
+    open_jobs: bool = False
+    closed_jobs: bool = False
+    contract_from: bool = False
+    contract_to: bool = False
+    after_job: bool = False
+
+    @property
+    def joins_jobs(self) -> bool:
+        return self.customer or self.open_jobs or self.closed_jobs or self.contract_from or self.contract_to
+
+    def predicates(self, columns: Dict[str, str]) -> List[str]:
+        predicates = []
+        if self.job_ids:
+            placeholders = ', '.join(f':job_id{i}' for i in range(self.job_ids))
+            predicates.append(f'{columns["JobID"]} IN ({placeholders})')
+        if self.no_job:
+            predicates.append(f'{columns["JobID"]} IS NULL')
+        if self.customer:
+            predicates.append(f'{columns["JobCustomerID"]} = :customer_id')
+        if self.open_jobs:
+            predicates.append(f'{columns["CloseDate"]} IS NULL')
+        if self.closed_jobs:
+            predicates.append(f'{columns["CloseDate"]} IS NOT NULL')
+        if self.contract_from:
+            predicates.append(f'{columns["ContractDate"]} >= :contract_from')
+        if self.contract_to:
+            predicates.append(f'{columns["ContractDate"]} < :contract_to')
+        if self.after_job:
+            predicates.append(f'{columns["JobID"]} > :after_job')
+        return predicates
+
+
+class JobResultQuery(NamedTuple):
+    """
+    A job result statement: the projection over the jobs in scope, read from Tbl_web_job_summary when summary is
+    set, filtered by the where predicates and returning the first top rows in order_by order. The job columns
+    named in extra, e.g. CloseDate, are selected ahead of the projection.
+    """
+    scope: JobScope = JobScope()
+    where: Tuple[str, ...] = ()
+    order_by: Tuple[str, ...] = ()
+    top: Optional[int] = None
+    summary: bool = False
+    extra: Tuple[str, ...] = ()
+
+
+def render_statement(body: str, where: Iterable[str], order_by: Iterable[str], top: Optional[int], dialect: str) \
+        -> TextClause:
+    """
+    Renders a SELECT of body, written in Access SQL, for dialect: TOP becomes LIMIT and Access functions their
+    ANSI equivalents everywhere but on Access.
+    """
+    access = dialect == ACCESS_DIALECT
+    where = ' AND '.join(where)
+    order_by = ', '.join(order_by)
+    sql = f'SELECT {f"TOP {top} " if top is not None and access else ""}{body}'
+    if where:
+        sql = f'{sql} WHERE {where}'
+    if order_by:
+        sql = f'{sql} ORDER BY {order_by}'
+    if not access:
+        if top is not None:
+            sql = f'{sql} LIMIT {top}'
+        for function, replacement in ANSI_FUNCTIONS.items():
+            sql = sql.replace(function, replacement)
+    return text(sql)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def job_result_statement(query: JobResultQuery, dialect: str) -> TextClause:
+    if query.summary:
+        body, columns = SQLUtil.build_job_summary_query(), JOB_SUMMARY_COLUMNS
+    else:
+        body, columns = SQLUtil.build_job_result_query(query.scope), JOB_RESULT_COLUMNS
+    if query.extra:
+        body = ', '.join([*(f'{columns[name]} AS {name}' for name in query.extra), body])
+    return render_statement(body, [*query.scope.predicates(columns), *query.where], query.order_by, query.top,
+                            dialect)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def export_statement(query: JobResultQuery, dialect: str) -> TextClause:
+    """
+    The job result statement for query, which must select CloseDate as an extra column, joined to the invoice
+    totals of the jobs in its scope.
+    """
+    jobs = job_result_statement(query, dialect).text
+    return text(f'''
+        SELECT {', '.join(f'Jobs.[{name}]' for name in EXPORT_NAMES[:-1])}, Invoices.[TotalInvoiced]
+        FROM ({jobs}) AS Jobs
+        LEFT JOIN (
+            {SQLUtil.build_invoice_aggregate_query(query.scope)}
+        ) AS Invoices ON Jobs.[JobID] = Invoices.[JobID]
+    ''')
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def job_details_statement(job_ids: int, dialect: str) -> TextClause:
+    scope = JobScope(job_ids=job_ids)
+    return render_statement(SQLUtil.build_job_details_query(scope),
+                            scope.predicates({'JobID': 'Tbl_Workorders.[JobID]'}), (), None, dialect)
 
 
 class SQLUtil:
 
-    def __init__(self, db):
-        self.db = db
-        self.job_result_query = '''
+    def __init__(self, db, use_job_summary=False, cache: ResultCache = None):
+        self.source_db = db
+        self.use_job_summary = use_job_summary
+        self.cache = cache
+        self.search_index = None
+        self.snapshot = None
+        self.receivables = None
+        self.pool = None
+        self.version = None
+        self.generation = 0
+        self.table_generations: Dict[str, int] = {}
+
+    def get_db(self):
+        return self.source_db
+
+    @property
+    def db(self):
+        """
+        The database reads go to: the local snapshot while it is within its staleness bound, and holds its copy of
+        the job summary if job results are read from it, else the source.
+        """
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.is_fresh() and (not self.use_job_summary or snapshot.has_job_summary()):
+            return snapshot
+        return self.source_db
+
+    def data_changed(self, tables: Iterable[str] = ()) -> None:
+        """
+        Called by background refreshes that changed what reads return: drops cached results and bumps the
+        generation the global DataVersion token includes, and the generations of the tables whose rows changed,
+        which the customer and job tokens of routes reading those tables include.
+        """
+        self.generation += 1
+        for table in tables:
+            self.table_generations[table] = self.table_generations.get(table, 0) + 1
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def remove_sessions(self) -> None:
+        self.source_db.session.remove()
+        if self.snapshot is not None:
+            self.snapshot.remove()
+
+    def job_results(self, params: dict = None, scope: JobScope = JobScope(), where: Iterable[str] = (),
+                    order_by: Iterable[str] = (), top: Optional[int] = None, extra: Iterable[str] = ()):
+        """
+        Executes the job result statement for these parts, compiled once per shape and dialect of the database
+        reads currently go to. Empty where predicates, e.g. a keyset_predicate without a cursor, are left out.
+        """
+        db = self.db
+        query = JobResultQuery(scope, tuple(p for p in where if p), tuple(order_by), top, self.use_job_summary,
+                               tuple(extra))
+        return db.session.execute(job_result_statement(query, db.engine.dialect.name), params or {})
+
+    @staticmethod
+    def build_job_result_query(scope: JobScope = JobScope()) -> str:
+        """
+        Builds the job result projection and FROM clause, summing TotalAmount and TotalPayments over the jobs in
+        scope only.
+        """
+        return f'''
             Tbl_Customers.[CustomerID],
             Tbl_Workorders.[JobID],
             Tbl_Customers.[Customer], 
@@ -24,84 +298,273 @@ class SQLUtil:
         LEFT JOIN Tbl_Job_Types 
             ON Tbl_Workorders.JobType = Tbl_Job_Types.JobType) 
         LEFT JOIN (
-            SELECT Tbl_JobContracts.[JobID], SUM(Tbl_JobContracts.[JobContractAmount]) AS TotalAmount
-            FROM Tbl_JobContracts
-            WHERE Tbl_JobContracts.[JobContractAmount] IS NOT NULL
-            GROUP BY Tbl_JobContracts.[JobID]
+            {SQLUtil.build_aggregate_query('Tbl_JobContracts', 'JobContractAmount', 'TotalAmount', scope)}
         ) JobContracts ON Tbl_Workorders.[JobID] = JobContracts.[JobID])
         LEFT JOIN ( 
-            SELECT Tbl_Payments.[JobID], SUM(Tbl_Payments.[PaymentAmount]) AS TotalPayments
-            FROM Tbl_Payments
-            WHERE Tbl_Payments.[PaymentAmount] IS NOT NULL
-            GROUP BY Tbl_Payments.[JobID]
+            {SQLUtil.build_aggregate_query('Tbl_Payments', 'PaymentAmount', 'TotalPayments', scope)}
         ) Payments ON Tbl_Workorders.[JobID] = Payments.[JobID] 
         '''
 
-    def get_db(self):
-        return self.db
+    @staticmethod
+    def build_job_summary_query() -> str:
+        return f'''
+            {JOB_SUMMARY_COLUMNS['CustomerID']},
+            {JOB_SUMMARY_COLUMNS['JobID']},
+            {JOB_SUMMARY_COLUMNS['Customer']},
+            {JOB_SUMMARY_COLUMNS['CustomerLastName']},
+            {JOB_SUMMARY_COLUMNS['CompanyName']},
+            {JOB_SUMMARY_COLUMNS['ContractDate']},
+            {JOB_SUMMARY_COLUMNS['CreateDate']},
+            {JOB_SUMMARY_COLUMNS['JobAddress']},
+            {JOB_SUMMARY_COLUMNS['JobTypeDescription']},
+            {JOB_SUMMARY_COLUMNS['TotalAmount']},
+            {JOB_SUMMARY_COLUMNS['TotalPayments']}
+        FROM {JOB_SUMMARY_TABLE}
+        '''
 
-    def fetch_recent_estimates(self) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT TOP 25 
-                {self.job_result_query}
-                ORDER BY Tbl_Workorders.[ContractDate] DESC
-            ''').fetchall()
-        )
+    @staticmethod
+    def build_aggregate_query(table: str, amount_column: str, alias: str, scope: JobScope) -> str:
+        """
+        Sums amount_column per JobID of table for the jobs in scope, joining Tbl_Workorders only when the scope
+        restricts columns that the child table does not have.
+        """
+        source = f'{table} INNER JOIN Tbl_Workorders AS ScopeJobs ON {table}.[JobID] = ScopeJobs.[JobID]' \
+            if scope.joins_jobs \
+            else table
+        predicates = [
+            f'{table}.[{amount_column}] IS NOT NULL',
+            *scope.predicates({**SCOPE_JOB_COLUMNS, 'JobID': f'{table}.[JobID]'})
+        ]
+        return f'''
+            SELECT {table}.[JobID], SUM({table}.[{amount_column}]) AS {alias}
+            FROM {source}
+            WHERE {' AND '.join(predicates)}
+            GROUP BY {table}.[JobID]
+        '''
 
-    def fetch_recently_received_jobs(self) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT TOP 25 
-                {self.job_result_query}
-                ORDER BY Tbl_Workorders.[CreateDate] DESC
-            ''').fetchall()
+    @staticmethod
+    def build_invoice_aggregate_query(scope: JobScope) -> str:
+        """
+        Sums the invoice detail amounts per JobID for the jobs in scope, as build_aggregate_query does for a
+        table with its own JobID column.
+        """
+        source, predicates = SQLUtil.build_invoice_source(scope)
+        return f'''
+            SELECT Tbl_Invoice.[JobID], SUM(Tbl_InvoiceDetail.[JobContractAmount]) AS TotalInvoiced
+            FROM {source}
+            WHERE {' AND '.join(predicates)}
+            GROUP BY Tbl_Invoice.[JobID]
+        '''
+
+    @staticmethod
+    def build_invoice_source(scope: JobScope) -> Tuple[str, List[str]]:
+        """
+        The FROM clause joining each invoice to its detail lines and the WHERE predicates keeping the lines with
+        an amount of the jobs in scope.
+        """
+        source = 'Tbl_Invoice INNER JOIN Tbl_InvoiceDetail ' \
+                 'ON Tbl_Invoice.[InvoiceNumber] = Tbl_InvoiceDetail.[InvoiceNumber]'
+        if scope.joins_jobs:
+            source = f'({source}) INNER JOIN Tbl_Workorders AS ScopeJobs ON Tbl_Invoice.[JobID] = ScopeJobs.[JobID]'
+        predicates = [
+            'Tbl_InvoiceDetail.[JobContractAmount] IS NOT NULL',
+            *scope.predicates({**SCOPE_JOB_COLUMNS, 'JobID': 'Tbl_Invoice.[JobID]'})
+        ]
+        return source, predicates
+
+    def is_cached(self, name: str) -> bool:
+        return self.cache is not None and bool(self.cache.ttls.get(name))
+
+    @property
+    def job_columns(self) -> Dict[str, str]:
+        return JOB_SUMMARY_COLUMNS if self.use_job_summary else JOB_RESULT_COLUMNS
+
+    @cached
+    @instrumented
+    def fetch_recent_estimates(self, columnar=False) -> Rows:
+        c = self.job_columns
+        return SQLUtil.collect(self.job_results(order_by=[f"{c['ContractDate']} DESC"], top=25), columnar)
+
+    @cached
+    @instrumented
+    def fetch_recently_received_jobs(self, columnar=False) -> Rows:
+        c = self.job_columns
+        return SQLUtil.collect(self.job_results(order_by=[f"{c['CreateDate']} DESC"], top=25), columnar)
+
+    @cached
+    @instrumented
+    def fetch_active_contracts(self, limit: int = None, cursor: tuple = None, columnar=False) -> Rows:
+        return SQLUtil.collect(self._active_contracts(limit, cursor), columnar)
+
+    @instrumented
+    def stream_active_contracts(self, columnar=False) -> Union[Iterator[dict], Table]:
+        if self.is_cached('fetch_active_contracts'):
+            return self.fetch_active_contracts(columnar=True) if columnar else iter(self.fetch_active_contracts())
+        result = self._active_contracts(None, None)
+        return SQLUtil.iter_table(result) if columnar else SQLUtil.iter_dicts(result)
+
+    @instrumented
+    def stream_export(self, contract_from: datetime = None, contract_to: datetime = None, job_type: str = None,
+                      status: str = None) -> Table:
+        """
+        Streams every job contracted on or after contract_from and before contract_to, of the job type with this
+        description, and 'open' or 'closed', in no particular order, as a Table of EXPORT_NAMES. Rows are the
+        driver's row sequences, fetched FETCH_CHUNK_SIZE at a time as they are consumed, so an export of any size
+        is held in memory a chunk at a time.
+        """
+        c = self.job_columns
+        scope = JobScope(open_jobs=status == 'open', closed_jobs=status == 'closed',
+                         contract_from=contract_from is not None, contract_to=contract_to is not None)
+        params = {'contract_from': contract_from, 'contract_to': contract_to, 'job_type': job_type}
+        where = (f"{c['JobID']} IS NOT NULL", *([f"{c['JobTypeDescription']} = :job_type"] if job_type else []))
+        query = JobResultQuery(scope, where, summary=self.use_job_summary, extra=('CloseDate',))
+        db = self.db
+        result = db.session.execute(export_statement(query, db.engine.dialect.name),
+                                    {name: value for name, value in params.items() if value is not None})
+        return Table(list(result.keys()), SQLUtil.iter_rows(result))
+
+    def _active_contracts(self, limit: Optional[int], cursor: Optional[tuple]):
+        c = self.job_columns
+        keyset, params = SQLUtil.keyset_predicate(c['CreateDate'], c['JobID'], cursor, descending=False)
+        return self.job_results(
+            params,
+            scope=JobScope(open_jobs=True),
+            where=[f"{c['JobTypeDescription']} = 'Contract'", keyset],
+            order_by=[f"{c['CreateDate']} ASC", f"{c['JobID']} ASC"],
+            top=SQLUtil.page_rows(limit)
         )
 
-    def fetch_active_contracts(self) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT 
-                {self.job_result_query}
-                WHERE Tbl_Job_Types.[JobTypeDescription] = 'Contract' 
-                    AND Tbl_Workorders.[CloseDate] IS NULL 
-                ORDER BY Tbl_Workorders.[CreateDate] ASC
-            ''').fetchall()
+    @cached
+    @instrumented
+    def fetch_dashboard(self, columnar=False) -> Dict[str, Rows]:
+        """
+        Derives the three admin home views from a single scan of the job results, with no ORDER BY: the
+        DASHBOARD_SIZE most recent estimates by ContractDate and recently received jobs by CreateDate, each kept in
+        a bounded heap, and the open Contract jobs by CreateDate. NULL dates sort as they do in Access.
+        """
+        close_date = 0
+        contract_date, create_date, job_id, job_type = (
+            JOB_RESULT_NAMES.index(name) + 1 for name in ('ContractDate', 'CreateDate', 'JobID', 'JobTypeDescription')
         )
+        recent, received, active = [], [], []
+        rows = SQLUtil.iter_rows(self.job_results(extra=['CloseDate']))
+        for i, row in enumerate(rows):
+            value = row[contract_date]
+            SQLUtil.push_top(recent, (value is not None, value), i, row, DASHBOARD_SIZE)
+            value = row[create_date]
+            SQLUtil.push_top(received, (value is not None, value), i, row, DASHBOARD_SIZE)
+            if row[close_date] is None and row[job_type] == 'Contract':
+                active.append(row)
+        active.sort(key=lambda row: (SQLUtil.sort_key(row[create_date]), row[job_id]))
 
-    def search_by_customer_name(self, name) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT TOP 25 
-                {self.job_result_query}
-                WHERE Tbl_Customers.[CustomerLastName] IS NOT NULL 
-                AND LCASE(Tbl_Customers.[CustomerLastName]) LIKE :query 
-                ORDER BY Tbl_Workorders.[ContractDate] DESC
-            ''', {'query': f'{name}%'}).fetchall()
+        views = {
+            'recentEstimates': [row for _, _, row in sorted(recent, reverse=True)],
+            'recentlyReceived': [row for _, _, row in sorted(received, reverse=True)],
+            'activeContracts': active
+        }
+        if columnar:
+            return {name: Table(JOB_RESULT_NAMES, [tuple(row[1:]) for row in view]) for name, view in views.items()}
+        return {name: [dict(zip(JOB_RESULT_NAMES, row[1:])) for row in view] for name, view in views.items()}
+
+    @cached
+    @instrumented
+    def search_by_customer_name(self, name, columnar=False) -> Rows:
+        query = f'{name}%'
+        if self.search_index is not None and self.search_index.ready:
+            rows = self.hydrate_job_results(self.search_index.search('CustomerLastName', query, 25))
+            return SQLUtil.dicts_to_table(rows) if columnar else rows
+
+        c = self.job_columns
+        return SQLUtil.collect(
+            self.job_results(
+                {'query': query},
+                where=[f"{c['CustomerLastName']} IS NOT NULL", f"LCASE({c['CustomerLastName']}) LIKE :query"],
+                order_by=[f"{c['ContractDate']} DESC"],
+                top=25
+            ),
+            columnar
         )
 
-    def search_by_company_name(self, name) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT TOP 25 
-                {self.job_result_query}
-                WHERE Tbl_Customers.[CompanyName] IS NOT NULL 
-                AND LCASE(Tbl_Customers.[CompanyName]) LIKE :query 
-                ORDER BY Tbl_Workorders.[ContractDate] DESC
-            ''', {'query': f'%{name}%'}).fetchall()
+    @cached
+    @instrumented
+    def search_by_company_name(self, name, columnar=False) -> Rows:
+        query = f'%{name}%'
+        if self.search_index is not None and self.search_index.ready:
+            rows = self.hydrate_job_results(self.search_index.search('CompanyName', query, 25))
+            return SQLUtil.dicts_to_table(rows) if columnar else rows
+
+        c = self.job_columns
+        return SQLUtil.collect(
+            self.job_results(
+                {'query': query},
+                where=[f"{c['CompanyName']} IS NOT NULL", f"LCASE({c['CompanyName']}) LIKE :query"],
+                order_by=[f"{c['ContractDate']} DESC"],
+                top=25
+            ),
+            columnar
         )
 
-    def search_by_job_address(self, address) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT
-                {self.job_result_query}
-                WHERE Tbl_Workorders.[JobAddress] IS NOT NULL 
-                AND LCASE(Tbl_Workorders.[JobAddress]) LIKE :query 
-                ORDER BY Tbl_Workorders.[ContractDate] DESC
-            ''', {'query': f'%{address}%'}).fetchall()
+    @cached
+    @instrumented
+    def search_by_job_address(self, address, limit: int = None, cursor: tuple = None, columnar=False) -> Rows:
+        results = self._job_address_results(address, limit, cursor, columnar)
+        return Table(results.columns, list(results.rows)) if columnar else list(results)
+
+    @instrumented
+    def stream_by_job_address(self, address, columnar=False) -> Union[Iterator[dict], Table]:
+        if self.is_cached('search_by_job_address'):
+            return self.search_by_job_address(address, columnar=True) if columnar \
+                else iter(self.search_by_job_address(address))
+        return self._job_address_results(address, None, None, columnar)
+
+    def _job_address_results(self, address, limit: Optional[int], cursor: Optional[tuple], columnar=False) \
+            -> Union[Iterator[dict], Table]:
+        query = f'%{address}%'
+        if self.search_index is not None and self.search_index.ready:
+            rows = self.iter_job_results(
+                self.search_index.search('JobAddress', query, limit + 1 if limit else None, cursor)
+            )
+            return SQLUtil.dicts_to_table(rows) if columnar else rows
+
+        c = self.job_columns
+        keyset, params = SQLUtil.keyset_predicate(c['ContractDate'], c['JobID'], cursor, descending=True)
+        result = self.job_results(
+            {'query': query, **params},
+            where=[f"{c['JobAddress']} IS NOT NULL", f"LCASE({c['JobAddress']}) LIKE :query", keyset],
+            order_by=[f"{c['ContractDate']} DESC", f"{c['JobID']} DESC"],
+            top=SQLUtil.page_rows(limit)
         )
+        return SQLUtil.iter_table(result) if columnar else SQLUtil.iter_dicts(result)
+
+    @instrumented
+    def hydrate_job_results(self, keys: List[Tuple[int, int]]) -> List[dict]:
+        return list(self.iter_job_results(keys))
 
+    def iter_job_results(self, keys: List[Tuple[int, int]]) -> Iterator[dict]:
+        """
+        Loads the job result rows for (CustomerID, JobID) keys, yielded in the order of the keys one batch at a
+        time. Customers without jobs are keyed with a JobID of None.
+        """
+        c = self.job_columns
+        for keys_batch in SQLUtil.batches(keys):
+            rows = {}
+            job_ids = [job_id for _, job_id in keys_batch if job_id is not None]
+            customer_ids = [customer_id for customer_id, job_id in keys_batch if job_id is None]
+            if job_ids:
+                _, params = SQLUtil.bind_list('job_id', job_ids)
+                for row in self.job_results(params, scope=JobScope(job_ids=len(job_ids))):
+                    rows[(row['CustomerID'], row['JobID'])] = dict(row)
+            if customer_ids:
+                placeholders, params = SQLUtil.bind_list('customer_id', customer_ids)
+                for row in self.job_results(params, scope=JobScope(no_job=True),
+                                            where=[f"{c['CustomerID']} IN ({placeholders})"]):
+                    rows[(row['CustomerID'], row['JobID'])] = dict(row)
+            for key in keys_batch:
+                if key in rows:
+                    yield rows[key]
+
+    @cached
+    @instrumented
     def get_customer(self, customer_id) -> dict:
         return dict(
             self.db.session.execute(f'''
@@ -137,62 +600,84 @@ class SQLUtil:
             ''', {'customer_id': customer_id}).fetchone()
         )
 
-    def get_jobs_by_customer(self, customer_id) -> List[dict]:
-        return SQLUtil.rows_to_dict_list(
-            self.db.session.execute(f'''
-                SELECT 
-                {self.job_result_query}
-                WHERE Tbl_Workorders.[CustomerID] = :customer_id
-                ORDER BY Tbl_Workorders.[ContractDate] DESC
-            ''', {'customer_id': customer_id}).fetchall()
+    @cached
+    @instrumented
+    def get_jobs_by_customer(self, customer_id, limit: int = None, cursor: tuple = None, columnar=False) -> Rows:
+        c = self.job_columns
+        keyset, params = SQLUtil.keyset_predicate(c['ContractDate'], c['JobID'], cursor, descending=True)
+        return SQLUtil.collect(
+            self.job_results(
+                {'customer_id': customer_id, **params},
+                scope=JobScope(customer=True),
+                where=[keyset],
+                order_by=[f"{c['ContractDate']} DESC", f"{c['JobID']} DESC"],
+                top=SQLUtil.page_rows(limit)
+            ),
+            columnar
         )
 
+    @cached
+    @instrumented
     def get_job_details(self, job_id) -> dict:
+        db = self.db
         return dict(
-            self.db.session.execute(f'''
-                SELECT Tbl_Workorders.[JobID],
-                       Tbl_Workorders.[CustomerID],
-                       Tbl_Job_Types.[JobTypeDescription],
-                       Tbl_Workorders.[JobCustomer], 
-                       Tbl_Workorders.[JobContact],
-                       TRIM(Tbl_Workorders.[JobSecondContact]) AS JobContact2,
-                       Tbl_Workorders.[JobAddress],
-                       Tbl_Workorders.[JobCity],
-                       Tbl_Workorders.[JobSt],
-                       Tbl_Workorders.[JobZip],
-                       Tbl_Workorders.[JobPhone1Type],
-                       Tbl_Workorders.[JobContactPhone1],
-                       Tbl_Workorders.[JobPhone2Type],
-                       Tbl_Workorders.[JobContactPhone2],
-                       Tbl_Workorders.[JobPhone3Type],
-                       Tbl_Workorders.[JobContactPhone3],
-                       Tbl_Workorders.[JobPhone4Type],
-                       Tbl_Workorders.[JobContactPhone4],
-                       Tbl_Workorders.[ContractDate],
-                       Tbl_Workorders.[CreateDate],
-                       Tbl_Workorders.[JobStart],
-                       Tbl_Workorders.[CloseDate],
-                       JobContracts.[TotalAmount],
-                       Payments.[TotalPayments] 
-                FROM (( Tbl_Workorders 
-                LEFT JOIN Tbl_Job_Types 
-                    ON Tbl_Workorders.JobType = Tbl_Job_Types.JobType) 
-                LEFT JOIN (
-                    SELECT Tbl_JobContracts.[JobID], SUM(Tbl_JobContracts.[JobContractAmount]) AS TotalAmount
-                    FROM Tbl_JobContracts
-                    WHERE Tbl_JobContracts.[JobContractAmount] IS NOT NULL
-                    GROUP BY Tbl_JobContracts.[JobID]
-                ) JobContracts ON Tbl_Workorders.[JobID] = JobContracts.[JobID]) 
-                LEFT JOIN ( 
-                    SELECT Tbl_Payments.[JobID], SUM(Tbl_Payments.[PaymentAmount]) AS TotalPayments
-                    FROM Tbl_Payments
-                    WHERE Tbl_Payments.[PaymentAmount] IS NOT NULL
-                    GROUP BY Tbl_Payments.[JobID]
-                ) Payments ON Tbl_Workorders.[JobID] = Payments.[JobID] 
-                WHERE Tbl_Workorders.[JobID] = :job_id
-            ''', {'job_id': job_id}).fetchone()
+            db.session.execute(job_details_statement(1, db.engine.dialect.name), {'job_id0': job_id}).fetchone()
         )
 
+    @instrumented
+    def get_job_details_by_ids(self, job_ids: List[int]) -> Dict[int, dict]:
+        db = self.db
+        details = {}
+        for batch in SQLUtil.batches(job_ids):
+            _, params = SQLUtil.bind_list('job_id', batch)
+            for row in db.session.execute(job_details_statement(len(batch), db.engine.dialect.name), params):
+                details[row['JobID']] = dict(row)
+        return details
+
+    @staticmethod
+    def build_job_details_query(scope: JobScope) -> str:
+        """
+        Builds the job details projection and FROM clause, summing TotalAmount and TotalPayments over the jobs in
+        scope only.
+        """
+        return f'''
+            Tbl_Workorders.[JobID],
+            Tbl_Workorders.[CustomerID],
+            Tbl_Job_Types.[JobTypeDescription],
+            Tbl_Workorders.[JobCustomer], 
+            Tbl_Workorders.[JobContact],
+            TRIM(Tbl_Workorders.[JobSecondContact]) AS JobContact2,
+            Tbl_Workorders.[JobAddress],
+            Tbl_Workorders.[JobCity],
+            Tbl_Workorders.[JobSt],
+            Tbl_Workorders.[JobZip],
+            Tbl_Workorders.[JobPhone1Type],
+            Tbl_Workorders.[JobContactPhone1],
+            Tbl_Workorders.[JobPhone2Type],
+            Tbl_Workorders.[JobContactPhone2],
+            Tbl_Workorders.[JobPhone3Type],
+            Tbl_Workorders.[JobContactPhone3],
+            Tbl_Workorders.[JobPhone4Type],
+            Tbl_Workorders.[JobContactPhone4],
+            Tbl_Workorders.[ContractDate],
+            Tbl_Workorders.[CreateDate],
+            Tbl_Workorders.[JobStart],
+            Tbl_Workorders.[CloseDate],
+            JobContracts.[TotalAmount],
+            Payments.[TotalPayments] 
+        FROM (( Tbl_Workorders 
+        LEFT JOIN Tbl_Job_Types 
+            ON Tbl_Workorders.JobType = Tbl_Job_Types.JobType) 
+        LEFT JOIN (
+            {SQLUtil.build_aggregate_query('Tbl_JobContracts', 'JobContractAmount', 'TotalAmount', scope)}
+        ) JobContracts ON Tbl_Workorders.[JobID] = JobContracts.[JobID]) 
+        LEFT JOIN ( 
+            {SQLUtil.build_aggregate_query('Tbl_Payments', 'PaymentAmount', 'TotalPayments', scope)}
+        ) Payments ON Tbl_Workorders.[JobID] = Payments.[JobID] 
+        '''
+
+    @cached
+    @instrumented
     def get_work_items_by_job(self, job_id) -> List[dict]:
         return SQLUtil.rows_to_dict_list(
             self.db.session.execute(f'''
@@ -204,6 +689,8 @@ class SQLUtil:
             ''', {'job_id': job_id}).fetchall()
         )
 
+    @cached
+    @instrumented
     def get_payments_by_job(self, job_id) -> List[dict]:
         return SQLUtil.rows_to_dict_list(
             self.db.session.execute(f'''
@@ -216,6 +703,8 @@ class SQLUtil:
             ''', {'job_id': job_id}).fetchall()
         )
 
+    @cached
+    @instrumented
     def get_invoices_by_job(self, job_id) -> List[dict]:
         return SQLUtil.rows_to_dict_list(
             self.db.session.execute(f'''
@@ -230,17 +719,308 @@ class SQLUtil:
             ''', {'job_id': job_id}).fetchall()
         )
 
+    @instrumented
+    def get_work_items_by_jobs(self, job_ids: List[int]) -> Dict[int, List[dict]]:
+        return self._group_by_job(job_ids, WORK_ITEMS_BY_JOBS)
+
+    @instrumented
+    def get_payments_by_jobs(self, job_ids: List[int]) -> Dict[int, List[dict]]:
+        return self._group_by_job(job_ids, PAYMENTS_BY_JOBS)
+
+    @instrumented
+    def get_invoices_by_jobs(self, job_ids: List[int]) -> Dict[int, List[dict]]:
+        return self._group_by_job(job_ids, INVOICES_BY_JOBS)
+
+    @instrumented
+    def get_work_items_by_customer(self, customer_id) -> Dict[int, List[dict]]:
+        return self._group_by_customer(customer_id, WORK_ITEMS_BY_JOBS)
+
+    @instrumented
+    def get_payments_by_customer(self, customer_id) -> Dict[int, List[dict]]:
+        return self._group_by_customer(customer_id, PAYMENTS_BY_JOBS)
+
+    @instrumented
+    def get_invoices_by_customer(self, customer_id) -> Dict[int, List[dict]]:
+        return self._group_by_customer(customer_id, INVOICES_BY_JOBS)
+
+    def _group_by_job(self, job_ids: List[int], query: str) -> Dict[int, List[dict]]:
+        """
+        Runs a child row query once per batch of JobIDs and groups the rows by their JobID column, which is
+        dropped so each row has the same shape as the single-job query's rows.
+        """
+        grouped = {job_id: [] for job_id in job_ids}
+        for batch in SQLUtil.batches(job_ids):
+            placeholders, params = SQLUtil.bind_list('job_id', batch)
+            SQLUtil.group_rows(self.db.session.execute(query.format(placeholders=placeholders), params), grouped)
+        return grouped
+
+    def _group_by_customer(self, customer_id, query: str) -> Dict[int, List[dict]]:
+        """
+        Runs a child row query once for all of a customer's jobs, selecting their JobIDs with a subquery, and
+        groups the rows as _group_by_job does. Jobs without child rows are left out.
+        """
+        return SQLUtil.group_rows(
+            self.db.session.execute(query.format(placeholders=CUSTOMER_JOB_IDS), {'customer_id': customer_id}), {}
+        )
+
+    @staticmethod
+    def group_rows(result, grouped: Dict[int, List[dict]]) -> Dict[int, List[dict]]:
+        for row in result:
+            row = dict(row)
+            grouped.setdefault(row.pop('JobID'), []).append(row)
+        return grouped
+
     @staticmethod
     def rows_to_dict_list(row_proxy) -> List[dict]:
-        return list(map(lambda row: dict(row), row_proxy))
+        start = time.perf_counter()
+        rows = list(map(lambda row: dict(row), row_proxy))
+        metrics_util.observe_since('sql_convert_seconds', start, method=metrics_util.current_method() or 'other')
+        return rows
+
+    @staticmethod
+    def iter_dicts(result, size=FETCH_CHUNK_SIZE) -> Iterator[dict]:
+        rows = result.fetchmany(size)
+        while rows:
+            for row in rows:
+                yield dict(row)
+            rows = result.fetchmany(size)
+
+    @staticmethod
+    def collect(result, columnar: bool) -> Rows:
+        if not columnar:
+            return SQLUtil.rows_to_dict_list(result.fetchall())
+        start = time.perf_counter()
+        table = Table(list(result.keys()), list(map(tuple, result.fetchall())))
+        metrics_util.observe_since('sql_convert_seconds', start, method=metrics_util.current_method() or 'other')
+        return table
+
+    @staticmethod
+    def iter_rows(result, size=FETCH_CHUNK_SIZE) -> Iterator[tuple]:
+        rows = result.fetchmany(size)
+        while rows:
+            yield from rows
+            rows = result.fetchmany(size)
+
+    @staticmethod
+    def sort_key(value) -> tuple:
+        """
+        Orders NULLs before every other value, as Access does, without comparing None to a value.
+        """
+        return value is not None, value
+
+    @staticmethod
+    def push_top(heap: list, key: tuple, i: int, row, k: int) -> None:
+        """
+        Keeps the (key, i, row) entries of the k largest keys pushed so far in heap, a min-heap, so its root is
+        the one to evict next. Rows only enter the heap once its key is larger than the root's, so most rows of
+        a long scan cost a single comparison.
+        """
+        if len(heap) < k:
+            heapq.heappush(heap, (key, i, row))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, i, row))
+
+    @staticmethod
+    def iter_table(result, size=FETCH_CHUNK_SIZE) -> Table:
+        def rows():
+            chunk = result.fetchmany(size)
+            while chunk:
+                yield from map(tuple, chunk)
+                chunk = result.fetchmany(size)
+
+        return Table(list(result.keys()), rows())
+
+    @staticmethod
+    def dicts_to_table(rows: Iterable[dict]) -> Table:
+        """
+        Converts job result dicts, e.g. hydrated from the search index, to a Table of JOB_RESULT_NAMES. The
+        conversion is lazy when rows is an iterator.
+        """
+        values = (tuple(row[column] for column in JOB_RESULT_NAMES) for row in rows)
+        return Table(JOB_RESULT_NAMES, values if isinstance(rows, Iterator) else list(values))
+
+    @staticmethod
+    def bind_list(name: str, values: Iterable) -> Tuple[str, dict]:
+        params = {f'{name}{i}': value for i, value in enumerate(values)}
+        return ', '.join(f':{key}' for key in params), params
+
+    @staticmethod
+    def page_rows(limit: Optional[int]) -> Optional[int]:
+        """
+        Rows to fetch for a page of `limit` rows: one extra to tell whether there is a next page.
+        """
+        return int(limit) + 1 if limit else None
+
+    @staticmethod
+    def keyset_predicate(sort_column: str, id_column: str, cursor: Optional[tuple], descending: bool) \
+            -> Tuple[str, dict]:
+        """
+        Builds the predicate selecting rows after cursor = (sort value, JobID) in the order
+        sort_column, id_column. NULL sort values sort first ascending and last descending, as they do in Access.
+        """
+        if cursor is None:
+            return '', {}
+        sort_value, job_id = cursor
+        params = {'cursor_sort': sort_value, 'cursor_id': job_id}
+        op = '<' if descending else '>'
+        if sort_value is None:
+            predicate = f'{sort_column} IS NULL AND {id_column} {op} :cursor_id'
+            if not descending:
+                predicate = f'{predicate} OR {sort_column} IS NOT NULL'
+            return f'({predicate})', params
+        predicate = f'{sort_column} {op} :cursor_sort ' \
+                    f'OR ({sort_column} = :cursor_sort AND {id_column} {op} :cursor_id)'
+        if descending:
+            predicate = f'{predicate} OR {sort_column} IS NULL'
+        return f'({predicate})', params
+
+    @staticmethod
+    def batches(values: list, size=IN_BATCH_SIZE) -> Iterable[list]:
+        for i in range(0, len(values), size):
+            yield values[i:i + size]
 
 
 # noinspection PyUnresolvedReferences
 def init_db(app) -> SQLUtil:
+    """
+    Configures the source database and the SQLUtil around it without connecting to it. Connections, the
+    components enabled by environment variables and their background refreshes are set up by start_db in each
+    process that serves requests.
+    """
     from flask_sqlalchemy import SQLAlchemy
     import urllib
+    from util import lifecycle_util, pool_util, shared_cache_util, version_util
 
     app.config['SQLALCHEMY_DATABASE_URI'] = environ['DATABASE_URI']
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_util.engine_options()
+
+    cache = ResultCache(
+        parse_ttls(environ['RESULT_CACHE_TTLS']) or None,
+        int(environ.get('RESULT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+    ) if 'RESULT_CACHE_TTLS' in environ else None
+    if cache is not None and 'RESULT_CACHE_SHARED_PATH' in environ:
+        cache.shared = shared_cache_util.SharedResultStore(
+            environ['RESULT_CACHE_SHARED_PATH'],
+            int(environ.get('RESULT_CACHE_SHARED_MAX_BYTES', shared_cache_util.DEFAULT_MAX_BYTES)),
+            horizon=max(cache.ttls.values(), default=0.0),
+            is_dev=app.config['IS_DEV']
+        )
+
+    sql_util = SQLUtil(SQLAlchemy(app), cache=cache)
+    with app.app_context():
+        metrics_util.instrument_engine(
+            sql_util.source_db.engine,
+            float(environ['SLOW_QUERY_MS']) / 1000 if 'SLOW_QUERY_MS' in environ else None,
+            app_logger.create_logger('slow_query', app.config['IS_DEV'])
+        )
+        sql_util.pool = pool_util.PoolManager(app, sql_util.source_db.engine)
+    version_seconds = float(environ.get('DATA_VERSION_SECONDS', version_util.DEFAULT_INTERVAL_SECONDS))
+    if version_seconds > 0:
+        sql_util.version = version_util.DataVersion(
+            sql_util,
+            version_seconds,
+            environ.get('DATA_VERSION_FILE') or version_util.database_path(environ['DATABASE_URI'])
+        )
+    app.teardown_appcontext(lambda exception: sql_util.snapshot.remove() if sql_util.snapshot is not None else None)
+    lifecycle_util.on_start(app, 'db', lambda: start_db(app, sql_util))
+    return sql_util
+
+
+def start_db(app, sql_util: SQLUtil) -> None:
+    """
+    Drops any pooled connections inherited from a parent process, then creates the components enabled by
+    environment variables and loads them on a background thread, so the process serves requests straight away.
+    Until a component has loaded, reads go to the source database as they would without it.
+    """
+    from util import lifecycle_util
+
+    sql_util.source_db.engine.dispose(close=False)
+    loads = [('db_pool', lambda: _warm_pool(app, sql_util))]
+    if 'JOB_SUMMARY_REFRESH_SECONDS' in environ:
+        from util import job_summary_util
+
+        job_summary_interval = float(environ['JOB_SUMMARY_REFRESH_SECONDS'])
+        job_summary = job_summary_util.JobSummary(
+            sql_util,
+            float(environ.get('JOB_SUMMARY_FULL_REFRESH_SECONDS', job_summary_util.DEFAULT_FULL_REFRESH_SECONDS)),
+            max(3 * job_summary_interval, job_summary_util.DEFAULT_LEASE_SECONDS)
+        )
+
+        def load_job_summary():
+            try:
+                job_summary.load()
+            finally:
+                job_summary.start(app, job_summary_interval)
+
+        loads.append(('job_summary', load_job_summary))
+    if 'SEARCH_INDEX_REFRESH_SECONDS' in environ:
+        from util.search_index_util import SearchIndex
+
+        search_index = sql_util.search_index = SearchIndex(sql_util)
+
+        def load_search_index():
+            try:
+                search_index.refresh()
+            finally:
+                search_index.start(app, float(environ['SEARCH_INDEX_REFRESH_SECONDS']))
+
+        loads.append(('search_index', load_search_index))
+    if 'SNAPSHOT_REFRESH_SECONDS' in environ:
+        from util import snapshot_util
+
+        interval = float(environ['SNAPSHOT_REFRESH_SECONDS'])
+        snapshot = sql_util.snapshot = snapshot_util.Snapshot(
+            sql_util,
+            snapshot_util.default_path(),
+            float(environ.get('SNAPSHOT_MAX_STALENESS_SECONDS', 3 * interval)),
+            float(environ.get('SNAPSHOT_FULL_REFRESH_SECONDS', snapshot_util.DEFAULT_FULL_REFRESH_SECONDS))
+        )
+        metrics_util.instrument_engine(snapshot.engine)
+        metrics_util.registry.add_collector('snapshot', 'Local read snapshot statistics', snapshot.stats)
+
+        def load_snapshot():
+            try:
+                snapshot.full_refresh()
+            finally:
+                snapshot.remove()
+                snapshot.start(app, interval)
+
+        loads.append(('snapshot', load_snapshot))
+    if 'RECEIVABLES_REFRESH_SECONDS' in environ:
+        from util import receivables_util
+
+        receivables = sql_util.receivables = receivables_util.Receivables(
+            sql_util,
+            float(environ.get('RECEIVABLES_FULL_REFRESH_SECONDS', receivables_util.DEFAULT_FULL_REFRESH_SECONDS))
+        )
+        metrics_util.registry.add_collector('receivables', 'Receivables report statistics', receivables.stats)
+
+        def load_receivables():
+            try:
+                receivables.full_refresh()
+            finally:
+                sql_util.remove_sessions()
+                receivables.start(app, float(environ['RECEIVABLES_REFRESH_SECONDS']))
+
+        loads.append(('receivables', load_receivables))
+    lifecycle_util.run_in_background(app, 'db_startup', [
+        (name, lambda load=load: _load_and_release(sql_util, load)) for name, load in loads
+    ])
+
+
+def _warm_pool(app, sql_util: SQLUtil) -> None:
+    from util import pool_util
+
+    opened = sql_util.pool.warm()
+    sql_util.pool.logger.info('Opened %d connections in %.2fs', opened, sql_util.pool.last_warm_seconds)
+    validate_seconds = float(environ.get('DB_POOL_VALIDATE_SECONDS', pool_util.DEFAULT_VALIDATE_SECONDS))
+    if validate_seconds > 0:
+        sql_util.pool.start(app, sql_util.source_db, validate_seconds)
+
 
-    return SQLUtil(SQLAlchemy(app))
+def _load_and_release(sql_util: SQLUtil, load: Callable[[], None]) -> None:
+    try:
+        load()
+    finally:
+        sql_util.source_db.session.remove()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from util.type_util import JWTClaims
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+
+class VerifiedTokenCache:
+    """
+    Remembers the claims of bearer tokens whose signature and claims were already verified, keyed by a SHA-256
+    digest of the token, until the token's exp. Repeat tokens skip RS256 verification. Entries are evicted least
+    recently used once either max_entries or the approximate max_bytes of stored claims is exceeded.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, clock=time.time):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries: 'OrderedDict[bytes, Tuple[JWTClaims, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.verifications = 0
+        self.verify_seconds = 0.0
+
+    def get(self, token: str) -> Optional[JWTClaims]:
+        digest = VerifiedTokenCache.digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, size = entry
+            if claims['exp'] <= self.clock():
+                del self._entries[digest]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return claims
+
+    def put(self, token: str, claims: JWTClaims) -> None:
+        digest = VerifiedTokenCache.digest(token)
+        size = len(digest) + len(json.dumps(claims))
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[digest] = (claims, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def record_verification(self, seconds: float) -> None:
+        with self._lock:
+            self.verifications += 1
+            self.verify_seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'verifications': self.verifications,
+                'verify_seconds': self.verify_seconds
+            }
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import threading
+from functools import wraps
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import unquote_plus
+
+from flask import current_app, request as req
+from sqlalchemy.engine import make_url
+
+from util import executor_util, json_util, validation_util
+from util.cache_util import ResultCache
+from util.sql_util import JOB_SUMMARY_TABLE, TABLE_WATERMARKS
+
+DEFAULT_INTERVAL_SECONDS = 5.0
+MAX_ENTITY_VERSIONS = 4096
+
+DBQ_PATTERN = re.compile(r'DBQ=([^;]+)', re.IGNORECASE)
+
+GLOBAL_WATERMARKS = list(TABLE_WATERMARKS.values())
+
+# One round trip per entity: the columns its routes serve from its own row, and counts, totals and latest dates of
+# the child rows, which change whenever child rows are added or removed and on most edits.
+CUSTOMER_WATERMARK = '''
+    SELECT Customer, CustomerLastName, CompanyName, CustomerFirstName2, CustomerLastName2, BillingContactFirstName,
+           BillingContactLastName, BillingContactCompanyName, BillingAddress, BillingCity, BillingState, BillingZip,
+           BillingPhone1Type, BillingPhone1, BillingExt1, BillingPhone2Type, BillingPhone2, BillingExt2,
+           BillingPhone3Type, BillingPhone3, BillingExt3, BillingPhone4Type, BillingFax, BillingExt4, EmailOne,
+           EmailTwo,
+           (SELECT COUNT(*) FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT MAX(JobID) FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT SUM(JobType) FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT MAX(ContractDate) FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT MAX(CreateDate) FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT COUNT(ContractDate) FROM Tbl_Workorders
+            WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID),
+           (SELECT COUNT(*) FROM Tbl_JobContracts WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT SUM(JobContractAmount) FROM Tbl_JobContracts WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT COUNT(*) FROM Tbl_Payments WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT SUM(PaymentAmount) FROM Tbl_Payments WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT MAX(PaymentDate) FROM Tbl_Payments WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT COUNT(*) FROM Tbl_Invoice WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT MAX(InvoiceDate) FROM Tbl_Invoice WHERE JobID IN (
+               SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+           )),
+           (SELECT COUNT(*) FROM Tbl_InvoiceDetail WHERE InvoiceNumber IN (
+               SELECT InvoiceNumber FROM Tbl_Invoice WHERE JobID IN (
+                   SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+               )
+           )),
+           (SELECT SUM(JobContractAmount) FROM Tbl_InvoiceDetail WHERE InvoiceNumber IN (
+               SELECT InvoiceNumber FROM Tbl_Invoice WHERE JobID IN (
+                   SELECT JobID FROM Tbl_Workorders WHERE Tbl_Workorders.CustomerID = Tbl_Customers.CustomerID
+               )
+           ))
+    FROM Tbl_Customers
+    WHERE CustomerID = :customer_id
+'''
+JOB_WATERMARK = '''
+    SELECT CustomerID, JobType, JobCustomer, JobContact, JobSecondContact, JobAddress, JobCity, JobSt, JobZip,
+           JobPhone1Type, JobContactPhone1, JobPhone2Type, JobContactPhone2, JobPhone3Type, JobContactPhone3,
+           JobPhone4Type, JobContactPhone4, ContractDate, CreateDate, JobStart, CloseDate,
+           (SELECT COUNT(*) FROM Tbl_JobContracts WHERE Tbl_JobContracts.JobID = Tbl_Workorders.JobID),
+           (SELECT SUM(JobContractAmount) FROM Tbl_JobContracts WHERE Tbl_JobContracts.JobID = Tbl_Workorders.JobID),
+           (SELECT COUNT(*) FROM Tbl_Payments WHERE Tbl_Payments.JobID = Tbl_Workorders.JobID),
+           (SELECT SUM(PaymentAmount) FROM Tbl_Payments WHERE Tbl_Payments.JobID = Tbl_Workorders.JobID),
+           (SELECT MAX(PaymentDate) FROM Tbl_Payments WHERE Tbl_Payments.JobID = Tbl_Workorders.JobID),
+           (SELECT COUNT(*) FROM Tbl_Invoice WHERE Tbl_Invoice.JobID = Tbl_Workorders.JobID),
+           (SELECT MAX(InvoiceDate) FROM Tbl_Invoice WHERE Tbl_Invoice.JobID = Tbl_Workorders.JobID),
+           (SELECT COUNT(*) FROM Tbl_InvoiceDetail WHERE InvoiceNumber IN (
+               SELECT InvoiceNumber FROM Tbl_Invoice WHERE Tbl_Invoice.JobID = Tbl_Workorders.JobID
+           )),
+           (SELECT SUM(JobContractAmount) FROM Tbl_InvoiceDetail WHERE InvoiceNumber IN (
+               SELECT InvoiceNumber FROM Tbl_Invoice WHERE Tbl_Invoice.JobID = Tbl_Workorders.JobID
+           ))
+    FROM Tbl_Workorders
+    WHERE JobID = :job_id
+'''
+
+# The tables the customer and job routes read, include= expansions included, whose refreshes by the snapshot or
+# job summary change their tokens.
+CUSTOMER_TABLES = ['Tbl_Customers', 'Tbl_Workorders', 'Tbl_Job_Types', 'Tbl_JobContracts', 'Tbl_Payments',
+                   'Tbl_Invoice', 'Tbl_InvoiceDetail', JOB_SUMMARY_TABLE]
+JOB_TABLES = ['Tbl_Workorders', 'Tbl_Job_Types', 'Tbl_JobContracts', 'Tbl_Payments', 'Tbl_Invoice',
+              'Tbl_InvoiceDetail']
+
+CUSTOMER_METHODS = ['get_customer', 'get_jobs_by_customer']
+JOB_METHODS = ['get_job_details', 'get_work_items_by_job', 'get_payments_by_job', 'get_invoices_by_job']
+
+
+def database_path(uri: str) -> Optional[str]:
+    """
+    The Access file named by DBQ= in an ODBC connection string, percent-encoded or not, or the file of a SQLite
+    URI. None when the URI names neither.
+    """
+    match = DBQ_PATTERN.search(unquote_plus(uri))
+    if match:
+        return match.group(1).strip()
+    url = make_url(uri)
+    if url.drivername.startswith('sqlite') and url.database not in (None, '', ':memory:'):
+        return url.database
+    return None
+
+
+def digest(parts: Iterable) -> str:
+    return hashlib.blake2b(repr(tuple(parts)).encode(), digest_size=12).hexdigest()
+
+
+class DataVersion:
+    """
+    Cheap tokens for the data the estimate routes serve, recomputed at most once per interval and used to build
+    their ETags. The global token covers every route and is derived from table watermarks (row counts, max ids
+    and dates, amount totals), the database file's mtime and SQLUtil.generation, which the snapshot, job summary
+    and search index bump when a refresh changes what reads return. Customer and job tokens cost a single query:
+    the entity's own row and watermarks of its child rows only, so one entity's token survives edits elsewhere,
+    and the generations of the tables their routes read, bumped only by refreshes that changed those tables.
+
+    A changed token drops the SQLUtil results cached for what it covers, so that a new ETag is never served with
+    a result cached under the old one.
+    """
+
+    def __init__(self, sql_util, interval: float = DEFAULT_INTERVAL_SECONDS, path: Optional[str] = None):
+        self.sql_util = sql_util
+        self.path = path
+        self._tokens = ResultCache({'global': interval, 'customer': interval, 'job': interval},
+                                   max_entries=MAX_ENTITY_VERSIONS)
+        self._published: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        self.changes = 0
+
+    def current(self) -> str:
+        return self._tokens.get_or_load('global', (), self._load_global)
+
+    def customer(self, customer_id: str) -> str:
+        validation_util.require_numeric(customer_id)
+        return self._tokens.get_or_load('customer', (customer_id,), lambda: self._load_entity(
+            ('customer', customer_id), CUSTOMER_WATERMARK, {'customer_id': int(customer_id)}, CUSTOMER_TABLES,
+            lambda cache: [cache.invalidate(name) for name in CUSTOMER_METHODS]
+        ))
+
+    def job(self, job_id: str) -> str:
+        validation_util.require_numeric(job_id)
+        return self._tokens.get_or_load('job', (job_id,), lambda: self._load_entity(
+            ('job', job_id), JOB_WATERMARK, {'job_id': int(job_id)}, JOB_TABLES,
+            lambda cache: [cache.invalidate(name, job_id) for name in JOB_METHODS]
+        ))
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._tokens.stats(), 'changes': self.changes}
+
+    def _load_global(self) -> str:
+        db = self.sql_util.db
+        parts = [tuple(db.session.execute(query).fetchone()) for query in GLOBAL_WATERMARKS]
+        parts.append(self._mtime())
+        parts.append(self.sql_util.generation)
+        return self._publish(('global',), digest(parts), lambda cache: cache.invalidate())
+
+    def _load_entity(self, key: tuple, query: str, params: dict, tables: Iterable[str],
+                     invalidate: Callable[[ResultCache], object]) -> str:
+        row = self.sql_util.db.session.execute(query, params).fetchone()
+        generations = self.sql_util.table_generations
+        parts = [tuple(row) if row is not None else None, [generations.get(table, 0) for table in tables]]
+        return self._publish(key, digest(parts), invalidate)
+
+    def _publish(self, key: tuple, token: str, invalidate: Callable[[ResultCache], object]) -> str:
+        with self._lock:
+            previous = self._published.get(key)
+            if previous is None and len(self._published) >= MAX_ENTITY_VERSIONS:
+                self._published.clear()
+            self._published[key] = token
+            changed = previous is not None and previous != token
+            if changed:
+                self.changes += 1
+        if changed and self.sql_util.cache is not None:
+            invalidate(self.sql_util.cache)
+        return token
+
+    def _mtime(self) -> Optional[int]:
+        if self.path is None:
+            return None
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+
+def entity_tag(token: str) -> str:
+    """
+    A strong ETag for this request's response at the given data version: the same path, query string and
+    representation always render the same body from the same data.
+    """
+    return digest((token, req.full_path, json_util.wants_columnar()))
+
+
+def conditional(version: Callable[..., str]):
+    """
+    Answers a GET whose If-None-Match names the current ETag with 304 Not Modified before the route runs, and
+    adds the ETag to successful responses. version is the DataVersion method returning the token the response
+    depends on; it is called on the point lane of the query executor with the route's keyword arguments. Does
+    nothing when DATA_VERSION_SECONDS is 0.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            data_version: Optional[DataVersion] = current_app.config['DC_DB'].version
+            if data_version is None:
+                return f(*args, **kwargs)
+
+            etag = entity_tag(executor_util.call_point(version, data_version, **kwargs))
+            if req.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return decorated
+
+    return decorator